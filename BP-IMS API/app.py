@@ -1,4 +1,5 @@
-from quart import Quart, request, send_file, websocket, send_from_directory
+from quart import Quart, request, send_file, websocket
+from quart.wrappers.response import FileBody
 from tortoise import Tortoise
 import userService
 import itemService
@@ -10,26 +11,119 @@ import socketService
 import warehouseService
 import stockService
 import centralService
+import inventoryService
+import receivableService
+import jobService
+import imageService
+import assetService
+import mediaService
+import pdfService
+import exportService
+import reportService
+import orderSizeService
+import salesRollupService
+import dashboardService
+from werkzeug.security import safe_join
+import re
 from db import DATABASE_CONFIG
 import asyncio
 import uvicorn
 from quart_cors  import cors
-from utils import token_required
+from utils import token_required, create_response
 from config import CUSTOMER_IMAGES, ITEM_IMAGES
 import os
 
 app = Quart(__name__)
 cors(app)
 
+class SpoolFileBody(FileBody):
+    """Streams a spooled report and deletes the file once the response has been sent."""
+    async def __aexit__(self, exc_type, exc_value, tb):
+        await super().__aexit__(exc_type, exc_value, tb)
+        try:
+            os.remove(self.file_path)
+        except FileNotFoundError:
+            pass
+
 async def init():
     try:
         await Tortoise.init(config=DATABASE_CONFIG)
     except ConnectionError as e:
         print(f"Database configuration error: {e}")
 
+MAX_HISTORY_PAGE_SIZE = 200
+
+class InvalidHistoryArgs(ValueError):
+    pass
+
+def history_args():
+    """Date range and paging arguments shared by the history endpoints; a page is capped at MAX_HISTORY_PAGE_SIZE rows."""
+    args = {
+        "fromDate": request.args.get('fromDate'),
+        "toDate": request.args.get('toDate'),
+        "cursor": request.args.get('cursor')
+    }
+
+    cursor = args["cursor"]
+    if cursor and not re.fullmatch(r'.+,\d+', cursor):
+        raise InvalidHistoryArgs("Invalid cursor")
+
+    pageSize = request.args.get('pageSize')
+    if pageSize:
+        if not pageSize.isdigit() or int(pageSize) < 1:
+            raise InvalidHistoryArgs("pageSize must be a positive number")
+        args["pageSize"] = min(int(pageSize), MAX_HISTORY_PAGE_SIZE)
+
+    includeCount = request.args.get('includeCount')
+    if includeCount:
+        args["includeCount"] = includeCount == 'true'
+    return args
+
+@app.errorhandler(InvalidHistoryArgs)
+async def invalid_history_args(error):
+    return create_response(False, str(error), None, None), 400
+
+async def backfillCustomers():
+    """Receivables link old central sales through lastPurchaseDate, so they run before the summaries rewrite it."""
+    await receivableService.ensureReceivables()
+    await customerService.ensureCustomerSummaries()
+
 @app.before_serving
 async def startup():
     await init()
+    app.add_background_task(inventoryService.runSnapshots)
+    app.add_background_task(mediaService.runWorkers)
+    app.add_background_task(reportService.runClosing)
+    app.add_background_task(salesRollupService.ensureRollups)
+    app.add_background_task(orderSizeService.ensureHistogram)
+    app.add_background_task(backfillCustomers)
+
+@app.after_serving
+async def shutdown():
+    imageService.shutdown()
+    pdfService.shutdown()
+
+async def send_image(directory):
+    fileName = request.args.get('fileName')
+    if not fileName:
+        return {"error": "fileName parameter is required"}, 400
+
+    size = request.args.get('size')
+    fmt = request.args.get('format')
+    if (size and size not in imageService.VARIANTS) or (fmt and fmt not in imageService.FORMATS):
+        return {"error": "Unsupported size or format"}, 400
+
+    file_path = safe_join(directory, fileName)
+
+    if not file_path or not os.path.exists(file_path):
+        return {"error": "File not found"}, 404
+
+    variant = await imageService.getVariant(file_path, size, fmt)
+    response = await assetService.serve(variant)
+    if variant != file_path and assetService.isContentAddressed(variant):
+        response.headers['Content-Location'] = f"/imageVariants/{os.path.basename(variant)}"
+
+    return response
 
 """ GET METHODS """        
 
@@ -67,6 +161,19 @@ async def getCustomer():
     response = await customerService.getCustomer(int(id)) 
     return response
 
+@app.route('/getCustomerOrders', methods=['GET'])
+@token_required
+async def getCustomerOrders():
+    id = request.args.get('customerId')
+    response = await customerService.getCustomerOrders(int(id), **history_args()) 
+    return response
+
+@app.route('/rebuildCustomerSummaries', methods=['POST'])
+@token_required
+async def rebuildCustomerSummaries():
+    response = await customerService.rebuildCustomerSummaries() 
+    return response
+
 @app.route('/getCart', methods=['GET'])
 @token_required
 async def getCartandItems():
@@ -88,21 +195,12 @@ async def getBranchStocks():
 @token_required
 async def getStockHistory():
     id = request.args.get('branchItemId')
-    response = await itemService.getStockHistory(id) 
+    response = await itemService.getStockHistory(id, **history_args()) 
     return response
 
 @app.route('/getCustomerImage', methods=['GET'])
 async def getCustomerImage():
-    fileName = request.args.get('fileName')
-    if not fileName:
-        return {"error": "fileName parameter is required"}, 400
-
-    file_path = os.path.join(CUSTOMER_IMAGES, fileName)
-
-    if not os.path.exists(file_path):
-        return {"error": "File not found"}, 404
-
-    return await send_file(file_path)
+    return await send_image(CUSTOMER_IMAGES)
 
 @app.route('/getUsers', methods=['GET'])
 @token_required
@@ -154,16 +252,7 @@ async def getProductHQ():
 
 @app.route('/getItemImage', methods=['GET'])
 async def getItemImage():
-    fileName = request.args.get('fileName')
-    if not fileName:
-        return {"error": "fileName parameter is required"}, 400
-
-    file_path = os.path.join(ITEM_IMAGES, fileName)
-
-    if not os.path.exists(file_path):
-        return {"error": "File not found"}, 404
-
-    return await send_file(file_path)
+    return await send_image(ITEM_IMAGES)
 
 @app.route('/getStocksMonitor', methods=['GET'])
 @token_required
@@ -203,14 +292,14 @@ async def getWHStocks():
 @token_required
 async def getWHStockHistory():
     id = request.args.get('itemId')
-    response = await warehouseService.getStockHistory(id) 
+    response = await warehouseService.getStockHistory(id, **history_args()) 
     return response
 
 @app.route('/getSupplierStockHistory', methods=['GET'])
 @token_required
 async def getSupplierStockHistory():
     id = request.args.get('supplierId')
-    response = await warehouseService.getSupplierStockHistory(id) 
+    response = await warehouseService.getSupplierStockHistory(id, **history_args()) 
     return response
 
 @app.route('/getAllTransactions', methods=['GET'])
@@ -259,21 +348,21 @@ async def getSupplier():
 @token_required
 async def getBranchTransferHistory():  
     id = request.args.get('branchItemId')
-    response = await stockService.getBranchTransferHistory(int(id)) 
+    response = await stockService.getBranchTransferHistory(int(id), **history_args()) 
     return response
 
 @app.route('/getReturnToStockHistory', methods=['GET'])
 @token_required
 async def getReturnToStockHistory():  
     id = request.args.get('whItemId')
-    response = await warehouseService.getReturnToStockHistory(int(id)) 
+    response = await warehouseService.getReturnToStockHistory(int(id), **history_args()) 
     return response
 
 @app.route('/getBranchReturnHistory', methods=['GET'])
 @token_required
 async def getBranchReturnHistory():  
     id = request.args.get('branchItemId')
-    response = await stockService.getBranchReturnHistory(int(id)) 
+    response = await stockService.getBranchReturnHistory(int(id), **history_args()) 
     return response
 
 @app.route('/getLoyaltyCardList', methods=['GET'])
@@ -318,6 +407,43 @@ async def getOldestTransaction():
     response = await transactionService.getOldestTransaction(int(branchId)) 
     return response
 
+@app.route('/getItemMovements', methods=['GET'])
+@token_required
+async def getItemMovements():
+    itemId = request.args.get('itemId')
+    locationType = request.args.get('locationType')
+    locationId = request.args.get('locationId')
+    response = await inventoryService.getItemMovements(int(itemId), locationType, int(locationId) if locationId else None) 
+    return response
+
+@app.route('/getStockAt', methods=['GET'])
+@token_required
+async def getStockAt():
+    locationType = request.args.get('locationType')
+    locationId = request.args.get('locationId')
+    itemId = request.args.get('itemId')
+    asOf = request.args.get('asOf')
+    response = await inventoryService.getStockAt(locationType, int(locationId), int(itemId), asOf) 
+    return response
+
+@app.route('/getReceivablesSummary', methods=['GET'])
+@token_required
+async def getReceivablesSummary():
+    response = await receivableService.getReceivablesSummary() 
+    return response
+
+@app.route('/getCustomerBalances', methods=['GET'])
+@token_required
+async def getCustomerBalances():
+    response = await receivableService.getCustomerBalances() 
+    return response
+
+@app.route('/reconcileInventory', methods=['GET'])
+@token_required
+async def reconcileInventory():
+    response = await inventoryService.reconcile() 
+    return response
+
 """ POST AND PUT METHODS """
 
 @app.route('/loginUser', methods=['POST'])
@@ -418,6 +544,131 @@ async def generate_pdf():
 
     return await send_file(pdf_buffer, as_attachment=True, mimetype='application/pdf')  
 
+@app.route('/getPdfMetrics', methods=['GET'])
+@token_required
+async def getPdfMetrics():
+    return create_response(True, "Metrics retrieved", pdfService.getMetrics(), None), 200
+
+@app.route('/getDashboardTimings', methods=['GET'])
+@token_required
+async def getDashboardTimings():
+    return create_response(True, "Timings retrieved", dashboardService.getTimings(), None), 200
+
+@app.route('/startSalesReport', methods=['POST'])
+@token_required
+async def startSalesReport():
+    data = await request.json
+    response = await fileService.startSalesReport(data.get('fromDate'), data.get('toDate'), int(data.get('branchId')))
+    return response
+
+@app.route('/downloadSalesReport', methods=['GET'])
+@token_required
+async def downloadSalesReport():
+    path, fileName = fileService.getSalesReportFile(request.args.get('jobId'))
+    if not path:
+        return {"error": "Report not ready"}, 404
+
+    return await send_file(path, as_attachment=True, attachment_filename=fileName, mimetype='application/pdf')
+
+def stream_export(export, name):
+    fmt = 'xlsx' if request.args.get('format') == 'xlsx' else 'csv'
+    gzip = request.args.get('gzip') == 'true' and 'gzip' in request.headers.get('Accept-Encoding', '')
+    branchId = request.args.get('branchId')
+
+    chunks, mimetype, extension = exportService.export(
+        export, fmt, request.args.get('fromDate'), request.args.get('toDate'),
+        int(branchId) if branchId else None, gzip
+    )
+
+    async def body():
+        # Closing the chain on a disconnect or cancellation releases the export's server-side cursor.
+        try:
+            async for chunk in chunks:
+                yield chunk
+        finally:
+            await chunks.aclose()
+
+    response = app.response_class(body(), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename="{name}.{extension}"'
+    if gzip:
+        response.headers['Content-Encoding'] = 'gzip'
+    response.timeout = None
+    return response
+
+@app.route('/export/transactions', methods=['GET'])
+@token_required
+async def exportTransactions():
+    return stream_export(exportService.TRANSACTION_EXPORT, 'transactions')
+
+@app.route('/export/transactionItems', methods=['GET'])
+@token_required
+async def exportTransactionItems():
+    return stream_export(exportService.TRANSACTION_ITEM_EXPORT, 'transactionItems')
+
+@app.route('/closeSalesDays', methods=['POST'])
+@token_required
+async def closeSalesDays():
+    await reportService.closeDays()
+    return create_response(True, "Sales days closed", None, None), 200
+
+@app.route('/closeBranchDay', methods=['POST'])
+@token_required
+async def closeBranchDay():
+    data = await request.json
+    response = await reportService.closeBranch(data.get('branchId'), data.get('date'), request.user_id)
+    return response
+
+@app.route('/getBranchClose', methods=['GET'])
+@token_required
+async def getBranchClose():
+    branchId = request.args.get('branchId')
+    date = request.args.get('date')
+    response = await reportService.getBranchClose(branchId, date)
+    return response
+
+@app.route('/getBranchCloses', methods=['GET'])
+@token_required
+async def getBranchCloses():
+    branchId = request.args.get('branchId')
+    fromDate = request.args.get('fromDate')
+    toDate = request.args.get('toDate')
+    response = await reportService.getBranchCloses(branchId, fromDate, toDate)
+    return response
+
+@app.route('/getOrderSizeDistribution', methods=['GET'])
+@token_required
+async def getOrderSizeDistribution():
+    fromDate = request.args.get('fromDate')
+    toDate = request.args.get('toDate')
+    branchId = request.args.get('branchId')
+    response = await orderSizeService.getOrderSizeDistribution(fromDate, toDate, branchId)
+    return response
+
+@app.route('/rebuildOrderHistogram', methods=['POST'])
+@token_required
+async def rebuildOrderHistogram():
+    response = await orderSizeService.startRebuild()
+    return response
+
+@app.route('/rebuildMonthlySales', methods=['POST'])
+@token_required
+async def rebuildMonthlySales():
+    response = await salesRollupService.startRebuild()
+    return response
+
+@app.route('/backfillLineSnapshots', methods=['POST'])
+@token_required
+async def backfillLineSnapshots():
+    response = await reportService.startLineSnapshotBackfill()
+    return response
+
+@app.route('/getReceipt', methods=['GET'])
+@token_required
+async def getReceipt():
+    transactionId = request.args.get('transactionId')
+    path = await fileService.getReceiptPath(int(transactionId))
+    return await assetService.serve(path)
+
 @app.route('/generateSalespdf', methods=['POST'])
 @token_required
 async def generateSalespdf():
@@ -428,7 +679,10 @@ async def generateSalespdf():
 
     pdf_buffer = await fileService.generateSalesReport(fromDate,toDate, int(branchId)) 
 
-    return await send_file(pdf_buffer, as_attachment=True, mimetype='application/pdf')  
+    response = await send_file(pdf_buffer, as_attachment=True, mimetype='application/pdf')
+    if fileService.isSpooled(pdf_buffer):
+        response.response = SpoolFileBody(pdf_buffer)
+    return response
 
 @app.route('/saveCustomer', methods=['PUT'])
 @token_required
@@ -455,6 +709,14 @@ async def createStockInput():
     response = await itemService.createStockInput(stockInput) 
     return response
 
+@app.route('/createDispatch', methods=['POST'])
+@token_required
+async def createDispatch():
+    data = await request.json
+    dispatch = data.get('dispatch')
+    response = await itemService.createDispatch(dispatch) 
+    return response
+
 @app.route('/addUser', methods=['POST'])
 @token_required
 async def addUser():
@@ -496,6 +758,14 @@ async def createWHStockInput():
     response = await warehouseService.createStockInput(stockInput) 
     return response
 
+@app.route('/createWHDelivery', methods=['POST'])
+@token_required
+async def createWHDelivery():
+    data = await request.json
+    delivery = data.get('delivery')
+    response = await warehouseService.createDelivery(delivery) 
+    return response
+
 @app.route('/setUserInactive', methods=['POST'])
 @token_required
 async def setUserInactive():
@@ -612,6 +882,13 @@ async def saveLoyaltyStage():
     response = await customerService.saveLoyaltyStage(stage) 
     return response
 
+@app.route('/getJob', methods=['GET'])
+@token_required
+async def getJob():
+    id = request.args.get('id')
+    response = await jobService.getJob(id) 
+    return response
+
 @app.route('/saveLoyaltyCustomer', methods=['PUT'])
 @token_required
 async def saveLoyaltyCustomer():
@@ -667,6 +944,25 @@ async def addCentralItemToCart():
     response = await centralService.addCentralItemToCart(int(request.cart_id), data.get('branchProducts')) 
     return response
 
+@app.route('/settleTransactions', methods=['PUT'])
+@token_required
+async def settleTransactions():
+    data = await request.json
+    response = await receivableService.settleTransactions(data.get('transactionIds'), data.get('amount')) 
+    return response
+
+@app.route('/rebuildReceivables', methods=['POST'])
+@token_required
+async def rebuildReceivables():
+    response = await receivableService.rebuildReceivables() 
+    return response
+
+@app.route('/createInventorySnapshot', methods=['POST'])
+@token_required
+async def createInventorySnapshot():
+    response = await inventoryService.createSnapshot() 
+    return response
+
 @app.route('/payPendingTransaction', methods=['PUT'])
 @token_required
 async def payPendingTransaction():
@@ -748,8 +1044,15 @@ async def analysisReportHQ():
     await socketService.analysisReportHQ(websocket)
 
 @app.route('/static/images/<filename>')
-def get_image(filename):
-    return send_from_directory(os.path.join(app.root_path, 'static/images'), filename)
+async def get_image(filename):
+    return await assetService.serve(safe_join(os.path.join(app.root_path, 'static/images'), filename))
+
+@app.route('/imageVariants/<name>')
+async def get_image_variant(name):
+    if not re.fullmatch(r"[0-9a-f]{64}_[a-z]+\.[a-z]+", name):
+        return {"error": "File not found"}, 404
+
+    return await assetService.serve(os.path.join(imageService.VARIANT_CACHE, name[:2], name), immutable=True)
 
 if __name__ == '__main__':
     asyncio.run(init())
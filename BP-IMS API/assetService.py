@@ -0,0 +1,90 @@
+from quart import request, send_file, current_app
+from datetime import datetime, timezone
+import imageService
+import os
+import time
+
+METADATA_TTL = 10
+REVALIDATE_MAX_AGE = 300
+IMMUTABLE_MAX_AGE = 60 * 60 * 24 * 365
+
+metadataCache = {}
+
+def invalidate(path):
+    metadataCache.pop(path, None)
+
+def isContentAddressed(path):
+    return os.path.abspath(path).startswith(imageService.VARIANT_CACHE + os.sep)
+
+async def getMetadata(path):
+    """
+    Returns (lastModified, size, etag) for a file, or None when it does not exist. Entries are
+    kept for METADATA_TTL seconds so a busy list screen does not stat the same file on every hit.
+    Variants already carry their content hash in the name; anything else is hashed once per
+    (mtime, size).
+    """
+    cached = metadataCache.get(path)
+    now = time.monotonic()
+    if cached and cached[0] > now:
+        return cached[1]
+
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        metadataCache.pop(path, None)
+        return None
+
+    if isContentAddressed(path):
+        digest = os.path.splitext(os.path.basename(path))[0]
+    else:
+        digest = await imageService.sourceDigest(path)
+
+    metadata = (
+        datetime.fromtimestamp(int(stat.st_mtime), timezone.utc),
+        stat.st_size,
+        digest
+    )
+    metadataCache[path] = (now + METADATA_TTL, metadata)
+    return metadata
+
+def notModified(etag, lastModified):
+    if request.if_none_match:
+        return request.if_none_match.contains(etag)
+    if request.if_modified_since:
+        return lastModified <= request.if_modified_since
+    return False
+
+async def serve(path, immutable=False):
+    """
+    Sends a file with a strong content-hash ETag and Last-Modified, answers matching conditional
+    requests with 304 and honours Range. immutable is for URLs that name a content-addressed file
+    and may be cached for a year; anything else is revalidated after a few minutes since the
+    same file name can be overwritten by a new upload.
+    """
+    if not path:
+        return {"error": "File not found"}, 404
+
+    metadata = await getMetadata(path)
+    if not metadata:
+        return {"error": "File not found"}, 404
+
+    lastModified, size, etag = metadata
+
+    if notModified(etag, lastModified):
+        response = current_app.response_class("", status=304)
+    else:
+        response = await send_file(path, add_etags=False, conditional=False)
+
+    response.set_etag(etag)
+    response.last_modified = lastModified
+    response.cache_control.public = True
+    if immutable:
+        response.cache_control.max_age = IMMUTABLE_MAX_AGE
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.max_age = REVALIDATE_MAX_AGE
+
+    if response.status_code == 200:
+        await response.make_conditional(request, accept_ranges=True, complete_length=size)
+
+    return response
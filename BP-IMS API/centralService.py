@@ -1,6 +1,15 @@
 from tortoise import Tortoise
+from tortoise.transactions import in_transaction
+from tortoise.expressions import F
 from utils import create_response
 import transactionService
+import inventoryService
+import receivableService
+import fileService
+import reportService
+import salesRollupService
+import orderSizeService
+import customerService
 from models import User, CartItems, Item, Customer, Cart, BranchItem, Branch, Transaction, TransactionItem
 from decimal import Decimal
 from datetime import datetime, time, timedelta, timezone
@@ -54,8 +63,9 @@ async def getCentralProducts(categoryId, page=1, search=""):
 
     items = result[1]
 
+    branchProducts = await getBranchProductsForItems([item['id'] for item in items])
     for item in items:
-        item['branchProducts'] = await getBranchProducts(item['id'])
+        item['branchProducts'] = branchProducts.get(item['id'], [])
 
     itemList = [
         {
@@ -79,33 +89,40 @@ async def getCentralProducts(categoryId, page=1, search=""):
     return create_response(True, 'Items Successfully Retrieved', itemList, None, totalCount), 200
 
 async def getBranchProducts(itemId):
+    branchProducts = await getBranchProductsForItems([itemId])
+    return branchProducts.get(itemId, [])
 
-    sqlQuery = """
-        SELECT bi.id, bi.branchId, b.name as branchName, bi.quantity
-        From branchitem bi inner join branches b on b.Id = bi.branchId 
-        where bi.itemId = %s and b.isActive = 1
-    """
+async def getBranchProductsForItems(itemIds):
+    branchProducts = inventoryService.getCachedAvailability(itemIds)
+    missing = [itemId for itemId in itemIds if itemId not in branchProducts]
 
-    params = [itemId]
+    if not missing:
+        return branchProducts
 
-    sqlQuery += " ORDER BY b.id"
+    placeholders = ", ".join(["%s"] * len(missing))
+    sqlQuery = f"""
+        SELECT bi.id, bi.itemId, bi.branchId, b.name as branchName, bi.quantity
+        From branchitem bi inner join branches b on b.Id = bi.branchId 
+        where bi.itemId IN ({placeholders}) and b.isActive = 1
+        ORDER BY bi.itemId, b.id
+    """
 
     connection = Tortoise.get_connection('default')
-    result = await connection.execute_query(sqlQuery, tuple(params))
-
-    items = result[1]
+    result = await connection.execute_query(sqlQuery, tuple(missing))
 
-    itemList = [
-        {
+    loaded = {itemId: [] for itemId in missing}
+    for item in result[1]:
+        loaded[item['itemId']].append({
             "id": item['id'],
             "branchId": item['branchId'],
             "branchName": item['branchName'],
             "quantity": item['quantity']
-        }
-        for item in items
-    ]
+        })
+
+    inventoryService.cacheAvailability(loaded)
+    branchProducts.update(loaded)
 
-    return itemList
+    return branchProducts
 
 async def getCentralCartandItems(userId):
     cart = await transactionService.getCartforUser(userId)
@@ -156,7 +173,7 @@ async def getCentralCartItems(cartId):
 from decimal import Decimal, InvalidOperation
 
 async def addCentralItemToCart(cartId, branchProducts):
-    message = None
+    quantities = {}
 
     for bp in branchProducts:
         sold_qty = bp.get('soldQuantity')
@@ -172,29 +189,54 @@ async def addCentralItemToCart(cartId, branchProducts):
         if quantity_decimal <= 0:
             continue
 
-        branchItem = await BranchItem.get_or_none(id=bp['id'])
-        if not branchItem:
-            continue
+        quantities[bp['id']] = quantities.get(bp['id'], Decimal(0)) + quantity_decimal
 
-        item = await Item.get_or_none(id=branchItem.itemId)
-        if branchItem.quantity < quantity_decimal:
-            return create_response(False, 'Not enough stock available for this item', None, None), 200
+    if not quantities:
+        return create_response(True, "No items added to cart", None, None), 200
+
+    placeholders = ", ".join(["%s"] * len(quantities))
+    sqlQuery = f"""
+        SELECT bi.id, bi.quantity, i.price, ci.id AS cartItemId
+        FROM branchitem bi
+        INNER JOIN items i ON i.id = bi.itemId
+        LEFT JOIN cartitems ci ON ci.branchItemId = bi.id AND ci.cartId = %s
+        WHERE bi.id IN ({placeholders})
+    """
+    connection = Tortoise.get_connection('default')
+    rows = await connection.execute_query_dict(sqlQuery, [cartId, *quantities])
 
-        existing_cart_item = await CartItems.get_or_none(cartId=cartId, branchItemId=branchItem.id)
+    for row in rows:
+        if row['quantity'] < quantities[row['id']]:
+            return create_response(False, 'Not enough stock available for this item', None, None), 200
 
-        if existing_cart_item:
-            existing_cart_item.quantity += quantity_decimal
-            await existing_cart_item.save()
-            message = 'Item quantity updated in the cart'
+    newCartItems = []
+    updatedCartItems = []
+    subTotal = Decimal(0)
+    for row in rows:
+        quantity_decimal = quantities[row['id']]
+        subTotal += row['price'] * quantity_decimal
+        if row['cartItemId']:
+            updatedCartItems.append((row['cartItemId'], quantity_decimal))
         else:
-            await CartItems.create(cartId=cartId, branchItemId=branchItem.id, quantity=quantity_decimal)
-            message = 'Item successfully added to the cart' 
+            newCartItems.append(CartItems(cartId=cartId, branchItemId=row['id'], quantity=quantity_decimal))
+
+    async with in_transaction() as connection:
+        if updatedCartItems:
+            cases = " ".join(["WHEN %s THEN %s"] * len(updatedCartItems))
+            params = [value for pair in updatedCartItems for value in pair]
+            ids = [cartItemId for cartItemId, _ in updatedCartItems]
+            await connection.execute_query(
+                f"UPDATE cartitems SET quantity = quantity + CASE id {cases} END WHERE id IN ({', '.join(['%s'] * len(ids))})",
+                params + ids
+            )
 
-        cart = await Cart.get_or_none(id=cartId)
-        cart.subTotal += item.price * quantity_decimal
-        await cart.save()    
-    
-    return create_response(True, message or "No items added to cart", None, None), 200
+        if newCartItems:
+            await CartItems.bulk_create(newCartItems, using_db=connection)
+
+        await Cart.filter(id=cartId).using_db(connection).update(subTotal=F('subTotal') + subTotal)
+
+    message = 'Item quantity updated in the cart' if updatedCartItems and not newCartItems else 'Item successfully added to the cart'
+    return create_response(True, message, None, None), 200
 
 async def processCentralPayment(cartId, amountReceived, isCredit):
     cart = await Cart.get_or_none(id=cartId)
@@ -202,11 +244,18 @@ async def processCentralPayment(cartId, amountReceived, isCredit):
     if not cart:
         return create_response(False, 'Transaction Error. Please Try Again!'), 404
     
-    user = await User.get_or_none(id=cart.userId)
     branch = await Branch.get_or_none(id=1)
     customer = await Customer.get_or_none(id=cart.customerId) if cart.customerId else None
-    cartItems = await CartItems.filter(cartId=cartId)
-    transactionItems = []
+
+    cartItemsQuery = """
+        SELECT ci.quantity, bi.branchId, bi.itemId, i.name, i.price, i.cost, i.sellByUnit
+        FROM cartitems ci
+        INNER JOIN branchitem bi ON bi.id = ci.branchItemId
+        INNER JOIN items i ON i.id = bi.itemId
+        WHERE ci.cartId = %s
+        ORDER BY ci.id
+    """
+    cartItems = await Tortoise.get_connection('default').execute_query_dict(cartItemsQuery, [cartId])
 
     total_amount = cart.subTotal
     if cart.discount:
@@ -218,58 +267,82 @@ async def processCentralPayment(cartId, amountReceived, isCredit):
         return create_response(False, 'Transaction Error. Please Try Again!'), 404
 
     slip_no = await transactionService.generate_slip_no(branch.id)
-    total_profit = 0 
-
-    total_cogs = 0
-    for cItem in cartItems:
-        branchItem = await BranchItem.get_or_none(id=cItem.branchItemId)
-        item = await Item.get_or_none(id=branchItem.itemId)
-        if item:
-            total_cogs += item.cost * cItem.quantity  
 
+    total_cogs = sum(cItem['cost'] * cItem['quantity'] for cItem in cartItems)
     total_profit = total_amount - total_cogs
     current_time = datetime.now(timezone.utc) + timedelta(hours=8)
     adjusted_time = transactionService.adjust_transaction_time(current_time)
 
-    transaction = await Transaction.create(
-        amountReceived=float(amountReceived),
-        totalAmount=total_amount,
-        cashierId=cart.userId,
-        slipNo=slip_no,
-        transactionDate = adjusted_time,
-        branchId=1,
-        profit=total_profit,
-        discount=cart.discount,
-        deliveryFee=cart.deliveryFee,
-        isExacon = True,
-        isPaid = False if isCredit else True
-    )
-
-    for cItem in cartItems:
-        branchItem = await BranchItem.get_or_none(id=cItem.branchItemId)
-        item = await Item.get_or_none(id=branchItem.itemId)
-        if item:    
-            branchItem.quantity -= cItem.quantity
-            itemAmount = item.price * cItem.quantity
-
-            tItem = await TransactionItem.create(
-                transactionId=transaction.id,
-                itemId=branchItem.itemId,
-                quantity=cItem.quantity,
-                amount=itemAmount,
-                isVoided=False
+    try:
+        async with in_transaction() as connection:
+            transaction = await Transaction.create(
+                amountReceived=float(amountReceived),
+                totalAmount=total_amount,
+                cashierId=cart.userId,
+                slipNo=slip_no,
+                transactionDate = adjusted_time,
+                customerId=cart.customerId if customer else None,
+                branchId=1,
+                profit=total_profit,
+                discount=cart.discount,
+                deliveryFee=cart.deliveryFee,
+                isExacon = True,
+                isPaid = False if isCredit else True,
+                dueDate = adjusted_time.date() if isCredit else None,
+                using_db=connection
+            )
+
+            await TransactionItem.bulk_create([
+                TransactionItem(
+                    transactionId=transaction.id,
+                    itemId=cItem['itemId'],
+                    quantity=cItem['quantity'],
+                    amount=cItem['price'] * cItem['quantity'],
+                    unitPrice=cItem['price'],
+                    unitCost=cItem['cost']
+                )
+                for cItem in cartItems
+            ], using_db=connection)
+
+            await inventoryService.adjustStock([
+                inventoryService.movement(inventoryService.BRANCH, cItem['branchId'], cItem['itemId'], -cItem['quantity'], 'sale', transaction.id)
+                for cItem in cartItems
+            ], connection, guard=True)
+
+            savedItems = await connection.execute_query_dict(
+                "SELECT id FROM transactionitems WHERE transactionId = %s ORDER BY id", [transaction.id]
             )
-            transactionItems.append({
-                "id": tItem.id,
-                "itemId": item.id,
-                "name": item.name,
-                "price": item.price,
-                "quantity": tItem.quantity,
-                "amount": tItem.amount,
-                "sellByUnit": item.sellByUnit
-            })
-
-        await branchItem.save()
+
+            await CartItems.filter(cartId=cartId).using_db(connection).delete()
+            await Cart.filter(id=cartId).using_db(connection).update(subTotal=0, deliveryFee=None, discount=None, customerId=None)
+
+            if customer and isCredit:
+                await receivableService.adjustBalance(customer.id, total_amount, connection)
+            elif customer:
+                await Customer.filter(id=customer.id).using_db(connection).update(
+                    totalOrderAmount=F('totalOrderAmount') + total_amount,
+                    orderCount=F('orderCount') + 1,
+                    lastPurchaseDate=adjusted_time
+                )
+
+            if not isCredit:
+                await salesRollupService.recordSale(transaction.branchId, adjusted_time, total_amount, connection=connection)
+                await orderSizeService.recordOrder(transaction.branchId, adjusted_time, total_amount, connection=connection)
+    except inventoryService.StockAdjustmentError as e:
+        return create_response(False, str(e)), 200
+
+    transactionItems = [
+        {
+            "id": saved['id'],
+            "itemId": cItem['itemId'],
+            "name": cItem['name'],
+            "price": cItem['price'],
+            "quantity": cItem['quantity'],
+            "amount": cItem['price'] * cItem['quantity'],
+            "sellByUnit": bool(cItem['sellByUnit'])
+        }
+        for saved, cItem in zip(savedItems, cartItems)
+    ]
 
     transactionRequest = {
         "transaction": {
@@ -288,16 +361,7 @@ async def processCentralPayment(cartId, amountReceived, isCredit):
         "transactionItems": transactionItems
     }
 
-    await CartItems.filter(cartId=cartId).delete()
-    cart.subTotal = 0
-    cart.deliveryFee = None
-    cart.discount = None
-    cart.customerId = None
-    await cart.save()
-
-    if customer:
-        customer.totalOrderAmount += total_amount
-        await customer.save()
+    fileService.prerenderReceipt(transaction.id)
 
     message = 'Payment Successful'
     return create_response(True, message, transactionRequest), 200
@@ -353,10 +417,23 @@ async def getAllCentralTransactionsAsync(categoryId,page=1, search=""):
     return create_response(True, "Successfully Retrieved", transactions, None, total_count), 200
 
 async def payPendingTransaction(transactionId, amount):
-    transaction = await Transaction.get_or_none(id = transactionId)
-    transaction.isPaid = True
-    transaction.amountReceived = amount
-    
-    await transaction.save()
+    async with in_transaction() as connection:
+        transaction = await Transaction.select_for_update().using_db(connection).get_or_none(id = transactionId)
+
+        if not transaction or transaction.isPaid:
+            return create_response(False, "Transaction not found or already paid", None, None), 200
+
+        transaction.isPaid = True
+        transaction.amountReceived = amount
+        transaction.receiptVersion += 1
+        await transaction.save(using_db=connection)
+
+        if not transaction.isVoided:
+            await receivableService.adjustBalance(transaction.customerId, -transaction.totalAmount, connection)
+            await customerService.addOrder(transaction.customerId, transaction.transactionDate, transaction.totalAmount, connection)
+            await salesRollupService.recordSale(transaction.branchId, transaction.transactionDate, transaction.totalAmount, connection=connection)
+            await orderSizeService.recordOrder(transaction.branchId, transaction.transactionDate, transaction.totalAmount, connection=connection)
+
+    await reportService.reopen([(transaction.transactionDate, transaction.branchId)])
     
     return create_response(True, "Successfully Paid", None, None), 200
\ No newline at end of file
@@ -1,12 +1,21 @@
-from models import Customer, Branch, Transaction, Cart, ItemReward, LoyaltyCard, LoyaltyCustomer, LoyaltyStages, TransactionItem, Item, BranchItem
-from utils import create_response, upload_media, delete_media
+from models import Customer, Branch, ItemReward, LoyaltyCard, LoyaltyCustomer, LoyaltyStages, BranchItem
+from utils import create_response, query_history, detach_references, SET_NULL, CASCADE
 import os
 from tortoise.queryset import Q 
-from datetime import date
 from tortoise import Tortoise
+from tortoise.transactions import in_transaction
 from decimal import Decimal
 from werkzeug.utils import secure_filename
 from config import CUSTOMER_IMAGES
+import inventoryService
+import imageService
+import assetService
+import jobService
+import loyaltyService
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
 
 async def getCustomerList(branchId = None, search = ""):
 
@@ -24,50 +33,75 @@ async def getCustomerList(branchId = None, search = ""):
 
     return create_response(True, "Customer list retrieved successfully.", customers, None), 200
 
+ORDER_HISTORY_PAGE_SIZE = 20
+
+def customerOrders(alias):
+    """The orders behind both the customer summary and the order history: paid and not voided."""
+    return f"{alias}.isPaid = 1 AND {alias}.isVoided = 0"
+
+async def getOrderHistoryPage(customerId, fromDate=None, toDate=None, cursor=None, pageSize=ORDER_HISTORY_PAGE_SIZE, includeCount=False):
+    """
+    Returns one page of a customer's orders, newest first, with their items loaded in a single
+    query. Without pageSize every order is returned.
+    """
+    query = f"""
+        SELECT tr.id, tr.amountReceived, tr.totalAmount, tr.slipNo, tr.transactionDate, tr.isVoided, u.name as cashier 
+        FROM transactions tr 
+        INNER JOIN users u ON u.id = tr.cashierId
+        WHERE tr.customerId = %s AND {customerOrders('tr')}
+    """
+
+    transactions, nextCursor, totalCount = await query_history(
+        query, [str(customerId)], 'tr.transactionDate', 'tr.id', fromDate, toDate, cursor, pageSize, includeCount, descending=True
+    )
+
+    itemsByTransaction = {}
+    if transactions:
+        placeholders = ", ".join(["%s"] * len(transactions))
+        itemsQuery = f"""
+            SELECT ti.id, ti.transactionId, ti.quantity, ti.amount, i.id AS itemId, i.name, COALESCE(ti.unitPrice, i.price) AS price, i.sellByUnit
+            FROM transactionitems ti
+            INNER JOIN items i ON i.id = ti.itemId
+            WHERE ti.transactionId IN ({placeholders})
+            ORDER BY ti.id
+        """
+        transactionItems = await Tortoise.get_connection("default").execute_query_dict(itemsQuery, [t['id'] for t in transactions])
+
+        for tItem in transactionItems:
+            itemsByTransaction.setdefault(tItem['transactionId'], []).append({
+                "id": tItem['id'],
+                "itemId": tItem['itemId'],
+                "name": tItem['name'],
+                "price": tItem['price'],
+                "quantity": tItem['quantity'],
+                "amount": tItem['amount'],
+                "sellByUnit": tItem['sellByUnit']
+            })
+
+    orderHistory = [
+        {
+            "id": transaction['id'],
+            "totalAmount": transaction['totalAmount'],
+            "amountReceived": transaction['amountReceived'],
+            "slipNo": transaction['slipNo'],
+            "transactionDate": transaction['transactionDate'],
+            "isVoided": transaction['isVoided'],
+            "cashier": transaction['cashier'],
+            "items": itemsByTransaction.get(transaction['id'], [])
+        }
+        for transaction in transactions
+    ]
+
+    return orderHistory, nextCursor, totalCount
+
 async def getCustomer(id):
+    """Returns the customer with their full order history; paged clients use getCustomerOrders."""
     if id:
         customer = await Customer.get_or_none(id=id)
 
         if customer:
             branch = await Branch.get_or_none(id=customer.branchId)
-
-            query = """
-                SELECT tr.id, tr.amountReceived, tr.totalAmount, tr.slipNo, tr.transactionDate, tr.isVoided, u.name as cashier 
-                FROM transactions tr 
-                INNER JOIN users u ON u.id = tr.cashierId
-                WHERE tr.customerId = %s AND tr.isPaid = 1
-            """
-
-            transactions = await Tortoise.get_connection("default").execute_query_dict(query, [id])
-
-            orderHistory = []
-            for transaction in transactions:
-                transactionItems = await TransactionItem.filter(transactionId=transaction["id"])
-                items = []
-
-                for tItem in transactionItems:
-                    item = await Item.get_or_none(id=tItem.itemId)
-                    if item:
-                        items.append({
-                            "id": tItem.id,
-                            "itemId": item.id,
-                            "name": item.name,
-                            "price": item.price,
-                            "quantity": tItem.quantity,
-                            "amount": tItem.amount,
-                            "sellByUnit": item.sellByUnit
-                        })
-
-                orderHistory.append({
-                    "id": transaction['id'],
-                    "totalAmount": transaction['totalAmount'],
-                    "amountReceived": transaction['amountReceived'],
-                    "slipNo": transaction['slipNo'],
-                    "transactionDate": transaction['transactionDate'],
-                    "isVoided": transaction['isVoided'],
-                    "cashier": transaction['cashier'],
-                    "items": items
-                })
+            orderHistory, _, _ = await getOrderHistoryPage(id, pageSize=None)
 
             customer_data = {
                 "id": customer.id,
@@ -75,6 +109,8 @@ async def getCustomer(id):
                 "contactNumber1": customer.contactNumber1,
                 "contactNumber2": customer.contactNumber2,
                 "totalOrderAmount": customer.totalOrderAmount,
+                "orderCount": customer.orderCount,
+                "lastPurchaseDate": customer.lastPurchaseDate,
                 "branchId": customer.branchId,
                 "branch": branch.name if branch else None,
                 "fileName": customer.fileName,
@@ -96,6 +132,62 @@ async def getCustomer(id):
 
     return create_response(True, message, request, None), 200
 
+async def getCustomerOrders(customerId, fromDate=None, toDate=None, cursor=None, pageSize=ORDER_HISTORY_PAGE_SIZE, includeCount=True):
+    orderHistory, nextCursor, totalCount = await getOrderHistoryPage(customerId, fromDate, toDate, cursor, pageSize, includeCount)
+    return create_response(True, "Orders successfully retrieved", orderHistory, nextCursor, totalCount), 200
+
+async def addOrder(customerId, transactionDate, amount, connection):
+    """Counts a sale in the customer's summary once it is paid, e.g. when a credit slip is settled."""
+    if not customerId:
+        return
+
+    await connection.execute_query("""
+        UPDATE customers
+        SET totalOrderAmount = totalOrderAmount + %s,
+            orderCount = orderCount + 1,
+            lastPurchaseDate = GREATEST(COALESCE(lastPurchaseDate, %s), %s)
+        WHERE id = %s
+    """, [amount, transactionDate, transactionDate, int(customerId)])
+
+async def recomputeSummaries(connection):
+    await connection.execute_query(f"""
+        UPDATE customers c
+        LEFT JOIN (
+            SELECT customerId, SUM(totalAmount) AS total, COUNT(*) AS orders, MAX(transactionDate) AS lastPurchase
+            FROM transactions tr
+            WHERE {customerOrders('tr')} AND customerId IS NOT NULL
+            GROUP BY customerId
+        ) t ON t.customerId = c.id
+        SET c.totalOrderAmount = COALESCE(t.total, 0),
+            c.orderCount = COALESCE(t.orders, 0),
+            c.lastPurchaseDate = t.lastPurchase
+    """)
+
+async def rebuildCustomerSummaries():
+    """Recomputes every customer's lifetime total, order count and last purchase from their transactions."""
+    await recomputeSummaries(Tortoise.get_connection("default"))
+
+    return create_response(True, "Customer summaries rebuilt successfully", None, None), 200
+
+async def ensureCustomerSummaries():
+    """
+    Rebuilds the summaries at startup when their order counts do not match the customers' orders,
+    e.g. on the first start after orderCount and lastPurchaseDate were added.
+    """
+    connection = Tortoise.get_connection("default")
+    try:
+        stored = await connection.execute_query_dict("SELECT COALESCE(SUM(orderCount), 0) AS orders FROM customers")
+        actual = await connection.execute_query_dict(f"""
+            SELECT COUNT(*) AS orders
+            FROM transactions t
+            INNER JOIN customers c ON c.id = t.customerId
+            WHERE {customerOrders('t')}
+        """)
+        if int(stored[0]['orders']) != int(actual[0]['orders']):
+            await recomputeSummaries(connection)
+    except Exception:
+        logger.exception("Rebuilding customer summaries failed")
+
 async def saveCustomer(data, file):
     customerId = int(data.get('id'))
     name = data.get('name')
@@ -132,6 +224,8 @@ async def saveCustomer(data, file):
         file_name = secure_filename(file.filename)
         file_path = os.path.join(CUSTOMER_IMAGES, file_name)
         await file.save(file_path) 
+        await imageService.processUpload(file_path)
+        assetService.invalidate(file_path)
 
         existing_customer = await Customer.get_or_none(id=customerId)
         existing_customer.fileName = file_name  
@@ -140,29 +234,23 @@ async def saveCustomer(data, file):
 
     return create_response(True, message, customerId, None), 200
 
+CUSTOMER_REFERENCES = [
+    ("carts", "customerId", SET_NULL),
+    ("transactions", "customerId", SET_NULL),
+    ("loyaltycustomers", "customerId", CASCADE),
+    ("customerbalances", "customerId", CASCADE)
+]
+
 async def deleteCustomer(id):
     customer = await Customer.get_or_none(id=id)
 
     if not customer:
         return create_response(False, "Customer not found.", None, None), 200
-        
-    carts = await Cart.filter(customerId=id)
 
-    transactions = await Transaction.filter(customerId=id)
-    loyaltyCustomer = await LoyaltyCustomer.filter(customerId = id)
-
-    for cart in carts:
-        cart.customerId = None
-        await cart.save()
-
-    for transaction in transactions:
-        transaction.customerId = None
-        await transaction.save()
-    
-    for cust in loyaltyCustomer:
-        await cust.delete()
+    async with in_transaction() as connection:
+        await detach_references(connection, CUSTOMER_REFERENCES, id)
+        await customer.delete(using_db=connection)
 
-    await customer.delete()
     return create_response(True, "Customer deleted successfully.", None, None), 200
 
 async def saveItemsReward(id, name):
@@ -181,41 +269,80 @@ async def saveItemsReward(id, name):
 
         message = "Reward updated successfully."
 
+    loyaltyService.invalidateRules()
     return create_response(True, message, None, None), 200
 
+LOYALTY_CHUNK_SIZE = 1000
+
 async def saveLoyaltyCard(card):
-    cardId = 0
-    if card['id'] == 0:
-        savedCard = await LoyaltyCard.create(
-            validYear=card['validYear'],
-            isValid = card['isValid']
-        )
-        cardId = savedCard.id
-        message = "Card added successfully."
-    else: 
-        existingCard = await LoyaltyCard.get_or_none(id=card['id'])
-        if not existingCard:
-            return create_response(False, "Card not found.", None, None), 404
+    async with in_transaction() as connection:
+        if card['id'] == 0:
+            savedCard = await LoyaltyCard.create(
+                validYear=card['validYear'],
+                isValid = card['isValid'],
+                using_db=connection
+            )
+            cardId = savedCard.id
+            message = "Card added successfully."
+        else: 
+            existingCard = await LoyaltyCard.get_or_none(id=card['id'], using_db=connection)
+            if not existingCard:
+                return create_response(False, "Card not found.", None, None), 404
+
+            existingCard.validYear = card['validYear']
+            existingCard.isValid = card['isValid']
+            cardId = existingCard.id
+            await existingCard.save(using_db=connection)
 
-        existingCard.validYear = card['validYear']
-        existingCard.isValid = card['isValid']
-        cardId = existingCard.id
-        await existingCard.save()
+            message = "Card updated successfully."
 
-        message = "Card updated successfully."
+        if(card['isValid'] == True):
+            await LoyaltyCard.filter(isValid=True, id__not=cardId).using_db(connection).update(isValid=False)
 
-    if(card['isValid'] == True):
-        cards = await LoyaltyCard.filter(id__not=cardId)
-        for card in cards:
-            card.isValid = False
-            await card.save()
-       
+    loyaltyService.invalidateRules()
     return create_response(True, message, None, None), 200
 
+async def provisionStage(stageId, jobId=None):
+    """
+    Adds a pending LoyaltyCustomer row for every loyalty customer, one id-range chunk per statement
+    so the event loop and the table locks are released between chunks. Customers that already
+    have the stage are skipped, so a failed run can simply be repeated.
+    """
+    connection = Tortoise.get_connection("default")
+    lastId = 0
+    processed = 0
+
+    while True:
+        chunk = await connection.execute_query_dict("""
+            SELECT MAX(id) AS maxId, COUNT(*) AS total
+            FROM (SELECT id FROM customers WHERE isLoyalty = 1 AND id > %s ORDER BY id LIMIT %s) c
+        """, [lastId, LOYALTY_CHUNK_SIZE])
+
+        if not chunk or not chunk[0]['total']:
+            break
+
+        maxId = chunk[0]['maxId']
+        await connection.execute_query("""
+            INSERT INTO loyaltycustomers (customerId, stageId, isDone, dateDone, itemId)
+            SELECT c.id, %s, 0, NULL, NULL
+            FROM customers c
+            WHERE c.isLoyalty = 1 AND c.id > %s AND c.id <= %s
+            AND NOT EXISTS (SELECT 1 FROM loyaltycustomers lc WHERE lc.customerId = c.id AND lc.stageId = %s)
+        """, [stageId, lastId, maxId, stageId])
+
+        lastId = maxId
+        processed += chunk[0]['total']
+        if jobId:
+            jobService.updateProgress(jobId, processed)
+        await asyncio.sleep(0)
+
+    return {"stageId": stageId, "customers": processed}
+
 async def saveLoyaltyStage(stage):
     if stage['itemRewardId'] == 0 :
         stage['itemRewardId'] = None
 
+    jobId = None
     if stage['id'] == 0:
         loyaltyStage = await LoyaltyStages.create(
             loyaltyCardId=stage['loyaltyCardId'],
@@ -223,16 +350,15 @@ async def saveLoyaltyStage(stage):
             itemRewardId=stage['itemRewardId']
         )
 
-        customers = await Customer.filter(isLoyalty = True)
-
-        for customer in customers:
-            await LoyaltyCustomer.create(
-                customerId = customer.id,
-                stageId = loyaltyStage.id,
-                isDone = False,
-                dateDone = None,
-                itemId = None
+        loyaltyCount = await Customer.filter(isLoyalty = True).count()
+        if loyaltyCount > LOYALTY_CHUNK_SIZE:
+            jobId = jobService.startJob(
+                "provisionLoyaltyStage",
+                lambda jobId: provisionStage(loyaltyStage.id, jobId),
+                loyaltyCount
             )
+        else:
+            await provisionStage(loyaltyStage.id)
 
         message = "Stage added successfully."
     else: 
@@ -247,69 +373,18 @@ async def saveLoyaltyStage(stage):
 
         message = "Stage updated successfully."
 
-    return create_response(True, message, None, None), 200
+    loyaltyService.invalidateRules()
+    return create_response(True, message, {"jobId": jobId} if jobId else None, None), 200
 
 
 async def saveLoyaltyCustomer(customerId):
+    enrolled = await loyaltyService.enroll(customerId, Tortoise.get_connection("default"))
 
-    card = await LoyaltyCard.get_or_none(isValid=True)
-
-    stages = await LoyaltyStages.filter(loyaltyCardId = card.id)
-
-    for stage in stages:
-        isDone = stage.orderId == 1 or False
-        dateDone = date.today() if isDone else None
-        await LoyaltyCustomer.create(
-            customerId = customerId,
-            stageId = stage.id,
-            isDone = isDone,
-            dateDone = dateDone,
-            itemId = None
-        )
+    if not enrolled:
+        return create_response(False, "No valid loyalty card found or customer is already enrolled", None, None), 200
 
     return create_response(True, "Creation of Loyalty Saved Succesfully", None, None), 200
 
-async def markNextStageDone(customerId):
-    query = """
-        SELECT lc.id AS loyalty_customer_id, lc.stageId, lc.isDone, ls.orderId
-        FROM loyaltycustomers lc
-        JOIN loyaltystages ls ON lc.stageId = ls.id
-        WHERE lc.customerId = %s
-        ORDER BY ls.orderId ASC
-    """
-
-    customerStages = await Tortoise.get_connection("default").execute_query_dict(query, [customerId])
-    
-    if not customerStages:
-        return create_response(False, "No stages found for customer.", None, None), 400
-
-    latest_stage = None
-    for stage in customerStages:
-        if stage["isDone"]:
-            latest_stage = stage
-
-    if not latest_stage:
-        return False
-
-    if latest_stage["orderId"] == customerStages[-1]["orderId"]:
-        return True
-
-    next_stage = None
-    for stage in customerStages:
-        if stage["orderId"] > latest_stage["orderId"] and not stage["isDone"]:
-            next_stage = stage
-            break
-
-    if next_stage:
-        await LoyaltyCustomer.filter(id=next_stage["loyalty_customer_id"]).update(
-            isDone=True,
-            dateDone=date.today()
-        )
-
-        return False
-    
-    return False
-
 async def getLoyaltyCardList():
     card_query = LoyaltyCard.filter(isActive=True).order_by('-isValid', 'id')
 
@@ -400,26 +475,36 @@ async def saveCustomerItemReward(id, itemId, branchId, qty):
     loyaltyCustomer = await LoyaltyCustomer.get_or_none(id=id)
     branchItem = await BranchItem.get_or_none(itemId = itemId, branchId = branchId)
 
-    loyaltyCustomer.itemId = branchItem.id
-    branchItem.quantity -= Decimal(qty)
+    if not loyaltyCustomer or not branchItem:
+        return create_response(False, "Item not found", None, None), 200
 
-    await loyaltyCustomer.save()
-    await branchItem.save()
+    try:
+        async with in_transaction() as connection:
+            await LoyaltyCustomer.filter(id=loyaltyCustomer.id).using_db(connection).update(itemId=branchItem.id)
+            await inventoryService.adjustStock([
+                inventoryService.branchMovement(branchItem, -Decimal(str(qty)), 'reward', loyaltyCustomer.id)
+            ], connection, guard=True)
+    except inventoryService.StockAdjustmentError as e:
+        return create_response(False, str(e), None, None), 200
 
     return create_response(True, "Picked Item Successfully", None, None), 200
 
 async def changeReward(id, itemId, branchId, lastItemId, qty, lastQty):
 
-    loyaltyCustomer = await LoyaltyCustomer.get_or_none(id=id)
-    lastItem = await BranchItem.get_or_none(itemId = lastItemId, branchId = branchId) 
     branchItem = await BranchItem.get_or_none(itemId = itemId, branchId = branchId)
 
-    loyaltyCustomer.itemId = branchItem.id
-    branchItem.quantity -= Decimal(qty)
-    lastItem.quantity += Decimal(lastQty)
-    await loyaltyCustomer.save()
-    await branchItem.save()
-    await lastItem.save()
+    if not branchItem:
+        return create_response(False, "Item not found", None, None), 200
+
+    try:
+        async with in_transaction() as connection:
+            await LoyaltyCustomer.filter(id=id).using_db(connection).update(itemId=branchItem.id)
+            await inventoryService.adjustStock([
+                inventoryService.movement(inventoryService.BRANCH, branchId, lastItemId, Decimal(str(lastQty)), 'reward', id),
+                inventoryService.branchMovement(branchItem, -Decimal(str(qty)), 'reward', id)
+            ], connection, guard=True)
+    except inventoryService.StockAdjustmentError as e:
+        return create_response(False, str(e), None, None), 200
 
     return create_response(True, "Picked Item Successfully", None, None), 200
 
@@ -431,6 +516,7 @@ async def deleteReward(id):
 
     reward.isActive = False
     await reward.save()
+    loyaltyService.invalidateRules()
     return create_response(True, "Reward deleted successfully.", None, None), 200
 
 async def deleteLoyaltyStage(id):
@@ -441,6 +527,7 @@ async def deleteLoyaltyStage(id):
 
     stage.isActive = False
     await stage.save()
+    loyaltyService.invalidateRules()
     return create_response(True, "Stage deleted successfully.", None, None), 200
 
 async def deleteLoyaltyCard(id):
@@ -451,4 +538,5 @@ async def deleteLoyaltyCard(id):
 
     card.isActive = False
     await card.save()
+    loyaltyService.invalidateRules()
     return create_response(True, "Card deleted successfully.", None, None), 200
\ No newline at end of file
@@ -0,0 +1,86 @@
+from tortoise import Tortoise
+import asyncio
+import time
+
+# Shared by every dashboard socket in the process and kept below the default pool size of 5, so
+# dashboards can never hold more than three connections and checkout always has two left.
+DASHBOARD_CONCURRENCY = 3
+QUERY_TIMEOUT = 5
+
+semaphore = asyncio.Semaphore(DASHBOARD_CONCURRENCY)
+stalled = {}
+timings = {}
+
+def fetch(sqlQuery, params=None):
+    """A dashboard step running one statement; every call acquires its own pooled connection."""
+    return lambda: Tortoise.get_connection('default').execute_query_dict(sqlQuery, params)
+
+def timingFor(name):
+    return timings.setdefault(name, {"count": 0, "failed": 0, "timeouts": 0, "skipped": 0, "totalMs": 0.0, "maxMs": 0.0, "lastMs": 0.0})
+
+def recordTiming(name, started, query):
+    elapsed = (time.perf_counter() - started) * 1000
+    timing = timingFor(name)
+    timing["count"] += 1
+    timing["totalMs"] += elapsed
+    timing["lastMs"] = elapsed
+    timing["maxMs"] = max(timing["maxMs"], elapsed)
+    if query.cancelled() or query.exception():
+        timing["failed"] += 1
+
+def getTimings():
+    return {
+        name: dict(timing, averageMs=timing["totalMs"] / timing["count"] if timing["count"] else 0)
+        for name, timing in timings.items()
+    }
+
+async def gather(snapshot, steps, fallbacks=None, timeout=QUERY_TIMEOUT):
+    """
+    Runs the independent steps of one dashboard snapshot concurrently and returns their results
+    by name. A step that fails, waits for a slot or runs past timeout gets its fallback (None
+    unless given) so the rest of the payload still goes out. A timed-out statement is not
+    cancelled, since that would hand a half-read connection back to the pool; it keeps its slot
+    until it finishes, and until then later ticks skip that step instead of piling up behind it.
+    """
+    fallbacks = fallbacks or {}
+
+    async def run(name, step):
+        key = f"{snapshot}.{name}"
+        if stalled.get(key):
+            timingFor(key)["skipped"] += 1
+            return fallbacks.get(name)
+
+        try:
+            await asyncio.wait_for(semaphore.acquire(), timeout)
+        except asyncio.TimeoutError:
+            timingFor(key)["timeouts"] += 1
+            print(f"Dashboard query {key} found no free slot within {timeout}s")
+            return fallbacks.get(name)
+
+        started = time.perf_counter()
+        timedOut = False
+        query = asyncio.ensure_future(step())
+
+        def finished(query):
+            semaphore.release()
+            recordTiming(key, started, query)
+            if timedOut:
+                stalled[key] -= 1
+
+        query.add_done_callback(finished)
+
+        try:
+            return await asyncio.wait_for(asyncio.shield(query), timeout)
+        except asyncio.TimeoutError:
+            if not query.done():
+                timedOut = True
+                stalled[key] = stalled.get(key, 0) + 1
+            timingFor(key)["timeouts"] += 1
+            print(f"Dashboard query {key} timed out after {timeout}s")
+        except Exception as e:
+            print(f"Dashboard query {key} failed: {e}")
+        return fallbacks.get(name)
+
+    names = list(steps)
+    results = await asyncio.gather(*(run(name, steps[name]) for name in names))
+    return dict(zip(names, results))
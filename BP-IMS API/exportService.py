@@ -0,0 +1,223 @@
+from tortoise import Tortoise
+from xml.sax.saxutils import escape
+from datetime import date, datetime
+from decimal import Decimal
+import aiomysql
+import csv
+import io
+import zipfile
+import zlib
+
+EXPORT_BATCH = 2000
+
+TRANSACTION_EXPORT = {
+    "columns": ["id", "slipNo", "transactionDate", "branch", "cashier", "customer", "totalAmount",
+                "amountReceived", "discount", "deliveryFee", "profit", "isVoided", "isPaid", "isExacon"],
+    "query": """
+        SELECT tr.id, tr.slipNo, tr.transactionDate, b.name, u.name, c.name, tr.totalAmount,
+               tr.amountReceived, tr.discount, tr.deliveryFee, tr.profit, tr.isVoided, tr.isPaid, tr.isExacon
+        FROM transactions tr
+        INNER JOIN branches b ON b.id = tr.branchId
+        LEFT JOIN users u ON u.id = tr.cashierId
+        LEFT JOIN customers c ON c.id = tr.customerId
+        WHERE 1 = 1
+    """
+}
+
+TRANSACTION_ITEM_EXPORT = {
+    "columns": ["id", "transactionId", "slipNo", "transactionDate", "branch", "itemId", "item",
+                "quantity", "amount", "isVoided"],
+    "query": """
+        SELECT ti.id, tr.id, tr.slipNo, tr.transactionDate, b.name, i.id, i.name,
+               ti.quantity, ti.amount, tr.isVoided
+        FROM transactionitems ti
+        INNER JOIN transactions tr ON tr.id = ti.transactionId
+        INNER JOIN branches b ON b.id = tr.branchId
+        INNER JOIN items i ON i.id = ti.itemId
+        WHERE 1 = 1
+    """
+}
+
+def buildQuery(export, fromDate=None, toDate=None, branchId=None):
+    sqlQuery = export["query"]
+    params = []
+
+    if fromDate:
+        sqlQuery += " AND tr.transactionDate >= %s"
+        params.append(fromDate)
+
+    if toDate:
+        sqlQuery += " AND tr.transactionDate < DATE_ADD(%s, INTERVAL 1 DAY)"
+        params.append(toDate)
+
+    if branchId:
+        sqlQuery += " AND tr.branchId = %s"
+        params.append(branchId)
+
+    sqlQuery += " ORDER BY tr.transactionDate, tr.id"
+    return sqlQuery, params
+
+async def streamRows(sqlQuery, params):
+    """
+    Yields result batches from an unbuffered server-side cursor, so only EXPORT_BATCH rows are
+    held in memory at a time however many the query returns. When the consumer stops early the
+    connection still has unread rows, so it is closed and the pool drops it instead of reusing it.
+    """
+    async with Tortoise.get_connection('default').acquire_connection() as connection:
+        cursor = await connection.cursor(aiomysql.SSCursor)
+        finished = False
+        try:
+            await cursor.execute(sqlQuery, params)
+            while True:
+                rows = await cursor.fetchmany(EXPORT_BATCH)
+                if not rows:
+                    finished = True
+                    break
+                yield rows
+        finally:
+            if finished:
+                await cursor.close()
+            else:
+                connection.close()
+
+def formatValue(value):
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+    if isinstance(value, date):
+        return value.isoformat()
+    return value
+
+async def csvChunks(columns, batches):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+
+    try:
+        async for rows in batches:
+            writer.writerows([formatValue(v) for v in row] for row in rows)
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    finally:
+        await batches.aclose()
+
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+class ChunkSink(io.RawIOBase):
+    """Write-only, unseekable stream that collects what zipfile writes so it can be yielded chunk by chunk."""
+    def __init__(self):
+        self.chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+XLSX_PARTS = {
+    "[Content_Types].xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'
+    ),
+    "_rels/.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    ),
+    "xl/workbook.xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Export" sheetId="1" r:id="rId1"/></sheets></workbook>'
+    ),
+    "xl/_rels/workbook.xml.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+        '</Relationships>'
+    )
+}
+
+def xlsxCell(value):
+    value = formatValue(value)
+    if isinstance(value, bool):
+        return f'<c t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, (int, float, Decimal)):
+        return f'<c><v>{value}</v></c>'
+    return f'<c t="inlineStr"><is><t>{escape(str(value))}</t></is></c>'
+
+def xlsxRow(values):
+    return "<row>" + "".join(xlsxCell(v) for v in values) + "</row>"
+
+async def xlsxChunks(columns, batches):
+    """Streams a single-sheet workbook with inline strings; the sheet is written through zipfile without seeking."""
+    sink = ChunkSink()
+    archive = zipfile.ZipFile(sink, mode='w', compression=zipfile.ZIP_DEFLATED)
+
+    for name, content in XLSX_PARTS.items():
+        archive.writestr(name, content)
+    yield sink.drain()
+
+    with archive.open("xl/worksheets/sheet1.xml", mode='w', force_zip64=True) as sheet:
+        sheet.write(
+            b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+        )
+        sheet.write(xlsxRow(columns).encode('utf-8'))
+
+        try:
+            async for rows in batches:
+                sheet.write("".join(xlsxRow(row) for row in rows).encode('utf-8'))
+                data = sink.drain()
+                if data:
+                    yield data
+        finally:
+            await batches.aclose()
+
+        sheet.write(b'</sheetData></worksheet>')
+
+    archive.close()
+    yield sink.drain()
+
+async def gzipChunks(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    try:
+        async for chunk in chunks:
+            data = compressor.compress(chunk)
+            if data:
+                yield data
+    finally:
+        await chunks.aclose()
+    yield compressor.flush()
+
+def export(export, fmt="csv", fromDate=None, toDate=None, branchId=None, gzip=False):
+    """Returns (chunk generator, mimetype, file extension) for a streamed export."""
+    sqlQuery, params = buildQuery(export, fromDate, toDate, branchId)
+    batches = streamRows(sqlQuery, params)
+
+    if fmt == "xlsx":
+        chunks = xlsxChunks(export["columns"], batches)
+        mimetype = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    else:
+        chunks = csvChunks(export["columns"], batches)
+        mimetype = "text/csv"
+
+    if gzip:
+        chunks = gzipChunks(chunks)
+
+    return chunks, mimetype, fmt
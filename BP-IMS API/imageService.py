@@ -0,0 +1,108 @@
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image, ImageOps
+import asyncio
+import hashlib
+import os
+
+VARIANT_CACHE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'variants')
+
+VARIANTS = {
+    "thumb": 128,
+    "list": 320,
+    "full": 1280
+}
+
+FORMATS = {
+    "jpeg": ("JPEG", "jpg", {"quality": 80, "optimize": True, "progressive": True}),
+    "webp": ("WEBP", "webp", {"quality": 75, "method": 4})
+}
+
+DEFAULT_FORMAT = "jpeg"
+IMAGE_WORKERS = 2
+
+executor = None
+digests = {}
+
+def getExecutor():
+    global executor
+    if executor is None:
+        executor = ProcessPoolExecutor(max_workers=IMAGE_WORKERS)
+    return executor
+
+def shutdown():
+    global executor
+    if executor is not None:
+        executor.shutdown(wait=False, cancel_futures=True)
+        executor = None
+
+def fileDigest(path):
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+def variantPath(digest, size, fmt):
+    return os.path.join(VARIANT_CACHE, digest[:2], f"{digest}_{size}.{FORMATS[fmt][1]}")
+
+def renderVariants(sourcePath, digest):
+    """Runs in a worker process: writes every missing size/format variant of one image and returns the digest."""
+    with Image.open(sourcePath) as original:
+        original = ImageOps.exif_transpose(original)
+        if original.mode not in ("RGB", "L"):
+            original = original.convert("RGB")
+
+        for size, maxSide in VARIANTS.items():
+            resized = None
+            for fmt, (pillowFormat, _, options) in FORMATS.items():
+                target = variantPath(digest, size, fmt)
+                if os.path.exists(target):
+                    continue
+
+                if resized is None:
+                    resized = original.copy()
+                    resized.thumbnail((maxSide, maxSide), Image.LANCZOS)
+
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                temp = f"{target}.{os.getpid()}.tmp"
+                resized.save(temp, pillowFormat, **options)
+                os.replace(temp, target)
+
+    return digest
+
+async def sourceDigest(sourcePath):
+    """Content hash of an original, remembered per (path, mtime, size) so a file is only hashed once per process."""
+    stat = os.stat(sourcePath)
+    key = (sourcePath, stat.st_mtime_ns, stat.st_size)
+    if key not in digests:
+        digests[key] = await asyncio.get_running_loop().run_in_executor(getExecutor(), fileDigest, sourcePath)
+    return digests[key]
+
+async def processUpload(sourcePath):
+    """Generates the variants of a freshly saved upload; failures leave the original servable as-is."""
+    try:
+        digest = await sourceDigest(sourcePath)
+        await asyncio.get_running_loop().run_in_executor(getExecutor(), renderVariants, sourcePath, digest)
+    except Exception as e:
+        print(f"Image variants failed for {sourcePath}: {e}")
+
+async def getVariant(sourcePath, size=None, fmt=None):
+    """
+    Returns the path to serve for an image request. Without a size the original is returned;
+    variants missing from the cache (older uploads) are rendered on first request.
+    """
+    if not size:
+        return sourcePath
+
+    fmt = fmt or DEFAULT_FORMAT
+    digest = await sourceDigest(sourcePath)
+    target = variantPath(digest, size, fmt)
+
+    if not os.path.exists(target):
+        try:
+            await asyncio.get_running_loop().run_in_executor(getExecutor(), renderVariants, sourcePath, digest)
+        except Exception as e:
+            print(f"Image variants failed for {sourcePath}: {e}")
+            return sourcePath
+
+    return target
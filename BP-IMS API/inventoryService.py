@@ -0,0 +1,283 @@
+from models import InventoryMovement
+from utils import create_response
+from tortoise import Tortoise
+from tortoise.transactions import in_transaction
+from decimal import Decimal
+from datetime import datetime, timedelta, timezone
+import asyncio
+import logging
+import time
+
+BRANCH = 'branch'
+WAREHOUSE = 'warehouse'
+WAREHOUSE_LOCATION_ID = 0
+
+SNAPSHOT_INTERVAL = 60 * 60 * 24
+
+logger = logging.getLogger(__name__)
+
+AVAILABILITY_TTL = 5
+availabilityCache = {}
+
+def movement(locationType, locationId, itemId, delta, reason, referenceId=None):
+    return {
+        "locationType": locationType,
+        "locationId": locationId,
+        "itemId": itemId,
+        "delta": Decimal(str(delta)),
+        "reason": reason,
+        "referenceId": referenceId
+    }
+
+def branchMovement(branchItem, delta, reason, referenceId=None):
+    return movement(BRANCH, branchItem.branchId, branchItem.itemId, delta, reason, referenceId)
+
+def warehouseMovement(whItem, delta, reason, referenceId=None):
+    return movement(WAREHOUSE, WAREHOUSE_LOCATION_ID, whItem.itemId, delta, reason, referenceId)
+
+def getCachedAvailability(itemIds):
+    """Returns the per-branch availability still fresh in the cache, keyed by item id."""
+    now = time.monotonic()
+    hits = {}
+    for itemId in itemIds:
+        entry = availabilityCache.get(itemId)
+        if entry and entry[0] > now:
+            hits[itemId] = entry[1]
+    return hits
+
+def cacheAvailability(availability):
+    expires = time.monotonic() + AVAILABILITY_TTL
+    for itemId, branches in availability.items():
+        availabilityCache[itemId] = (expires, branches)
+
+def invalidateAvailability(itemIds):
+    for itemId in itemIds:
+        availabilityCache.pop(itemId, None)
+
+async def recordMovements(movements, connection=None):
+    """Appends a batch of stock movements to the ledger with a single insert."""
+    movements = [m for m in movements if m["delta"] != 0]
+    if not movements:
+        return
+
+    invalidateAvailability({m["itemId"] for m in movements})
+
+    now = datetime.now(timezone.utc) + timedelta(hours=8)
+    await InventoryMovement.bulk_create(
+        [InventoryMovement(date=now, **m) for m in movements],
+        using_db=connection
+    )
+
+class StockAdjustmentError(Exception):
+    pass
+
+def groupDeltas(movements):
+    totals = {}
+    for m in movements:
+        key = (m["locationType"], m["locationId"], m["itemId"])
+        totals[key] = totals.get(key, Decimal(0)) + m["delta"]
+    return {key: delta for key, delta in totals.items() if delta != 0}
+
+async def adjustStock(movements, connection, guard=False):
+    """
+    Applies signed deltas to one or many (location, item) pairs with one UPDATE per table
+    and records them in the ledger. Must run inside a transaction; raises StockAdjustmentError
+    when a row is missing or, with guard, when a decrement would take a quantity below zero.
+    """
+    totals = groupDeltas(movements)
+    tables = {
+        BRANCH: ("branchitem", "t.branchId = d.locationId AND t.itemId = d.itemId"),
+        WAREHOUSE: ("warehouseitems", "t.itemId = d.itemId")
+    }
+
+    for locationType, (table, joinCondition) in tables.items():
+        deltas = [(key, delta) for key, delta in totals.items() if key[0] == locationType]
+        if not deltas:
+            continue
+
+        rows = " UNION ALL ".join(
+            ["SELECT %s AS locationId, %s AS itemId, CAST(%s AS DECIMAL(10,2)) AS delta"] * len(deltas)
+        )
+        params = []
+        for (_, locationId, itemId), delta in deltas:
+            params.extend([locationId, itemId, delta])
+
+        sqlQuery = f"""
+            UPDATE {table} t
+            INNER JOIN ({rows}) d ON {joinCondition}
+            SET t.quantity = t.quantity + d.delta
+        """
+        if guard:
+            sqlQuery += " WHERE d.delta >= 0 OR t.quantity + d.delta >= 0"
+
+        result = await connection.execute_query(sqlQuery, params)
+        if result[0] != len(deltas):
+            raise StockAdjustmentError('Not enough stock available' if guard else 'Item not found')
+
+    await recordMovements(movements, connection)
+
+async def takeSnapshot():
+    """Captures the quantity of every (location, item) pair together with the last ledger id it includes."""
+    now = datetime.now(timezone.utc) + timedelta(hours=8)
+
+    async with in_transaction() as connection:
+        lastMovement = await connection.execute_query_dict("SELECT COALESCE(MAX(id), 0) AS lastId FROM inventory_movements")
+        lastMovementId = lastMovement[0]['lastId']
+
+        await connection.execute_query("""
+            INSERT INTO inventory_snapshots (locationType, locationId, itemId, quantity, lastMovementId, snapshotDate)
+            SELECT %s, bi.branchId, bi.itemId, bi.quantity, %s, %s
+            FROM branchitem bi
+            INNER JOIN branches b ON b.id = bi.branchId
+            WHERE b.isActive = 1
+        """, [BRANCH, lastMovementId, now])
+
+        await connection.execute_query("""
+            INSERT INTO inventory_snapshots (locationType, locationId, itemId, quantity, lastMovementId, snapshotDate)
+            SELECT %s, %s, wh.itemId, wh.quantity, %s, %s
+            FROM warehouseitems wh
+        """, [WAREHOUSE, WAREHOUSE_LOCATION_ID, lastMovementId, now])
+
+    return now
+
+async def runSnapshots():
+    """Takes a snapshot at startup and then every SNAPSHOT_INTERVAL seconds."""
+    while True:
+        try:
+            await takeSnapshot()
+        except Exception:
+            logger.exception("Inventory snapshot failed")
+        await asyncio.sleep(SNAPSHOT_INTERVAL)
+
+async def createSnapshot():
+    snapshotDate = await takeSnapshot()
+    return create_response(True, "Snapshot created successfully", snapshotDate, None), 200
+
+async def getStockAt(locationType, locationId, itemId, asOf):
+    connection = Tortoise.get_connection('default')
+
+    snapshotQuery = """
+        SELECT quantity, lastMovementId, snapshotDate
+        FROM inventory_snapshots
+        WHERE locationType = %s AND locationId = %s AND itemId = %s AND snapshotDate <= %s
+        ORDER BY snapshotDate DESC
+        LIMIT 1
+    """
+    snapshot = await connection.execute_query_dict(snapshotQuery, [locationType, locationId, itemId, asOf])
+
+    if not snapshot:
+        return create_response(False, "No snapshot available for the requested date", None, None), 200
+
+    snapshot = snapshot[0]
+
+    deltaQuery = """
+        SELECT COALESCE(SUM(delta), 0) AS moved
+        FROM inventory_movements
+        WHERE locationType = %s AND locationId = %s AND itemId = %s
+        AND id > %s AND date <= %s
+    """
+    delta = await connection.execute_query_dict(deltaQuery, [locationType, locationId, itemId, snapshot['lastMovementId'], asOf])
+
+    stock = {
+        "locationType": locationType,
+        "locationId": locationId,
+        "itemId": itemId,
+        "asOf": asOf,
+        "snapshotDate": snapshot['snapshotDate'],
+        "quantity": Decimal(snapshot['quantity']) + Decimal(delta[0]['moved'])
+    }
+
+    return create_response(True, "Stock successfully retrieved", stock, None), 200
+
+async def getItemMovements(itemId, locationType=None, locationId=None):
+    sqlQuery = """
+        SELECT m.id, m.locationType, m.locationId, b.name AS branchName, m.delta, m.reason, m.referenceId, m.date
+        FROM inventory_movements m
+        LEFT JOIN branches b ON b.id = m.locationId AND m.locationType = %s
+        WHERE m.itemId = %s
+    """
+    params = [BRANCH, itemId]
+
+    if locationType:
+        sqlQuery += " AND m.locationType = %s"
+        params.append(locationType)
+
+    if locationId is not None:
+        sqlQuery += " AND m.locationId = %s"
+        params.append(locationId)
+
+    sqlQuery += " ORDER BY m.date DESC, m.id DESC"
+
+    connection = Tortoise.get_connection('default')
+    result = await connection.execute_query_dict(sqlQuery, tuple(params))
+
+    movementList = [
+        {
+            "id": m['id'],
+            "locationType": m['locationType'],
+            "locationId": m['locationId'],
+            "locationName": m['branchName'] if m['locationType'] == BRANCH else "Warehouse",
+            "delta": m['delta'],
+            "reason": m['reason'],
+            "referenceId": m['referenceId'],
+            "date": m['date']
+        }
+        for m in result
+    ]
+
+    return create_response(True, "Movements successfully retrieved", movementList, None), 200
+
+async def reconcileLocation(locationType, locationId):
+    """Recomputes quantities from the latest snapshot plus later deltas and returns the items that disagree."""
+    connection = Tortoise.get_connection('default')
+
+    latest = await connection.execute_query_dict("""
+        SELECT MAX(snapshotDate) AS snapshotDate
+        FROM inventory_snapshots
+        WHERE locationType = %s AND locationId = %s
+    """, [locationType, locationId])
+
+    snapshotDate = latest[0]['snapshotDate'] if latest else None
+    if not snapshotDate:
+        return []
+
+    if locationType == BRANCH:
+        currentJoin = "INNER JOIN branchitem cur ON cur.branchId = s.locationId AND cur.itemId = s.itemId"
+    else:
+        currentJoin = "INNER JOIN warehouseitems cur ON cur.itemId = s.itemId"
+
+    reconcileQuery = f"""
+        SELECT s.itemId, s.quantity + COALESCE(SUM(m.delta), 0) AS expectedQty, cur.quantity AS actualQty
+        FROM inventory_snapshots s
+        {currentJoin}
+        LEFT JOIN inventory_movements m
+            ON m.locationType = s.locationType AND m.locationId = s.locationId
+            AND m.itemId = s.itemId AND m.id > s.lastMovementId
+        WHERE s.locationType = %s AND s.locationId = %s AND s.snapshotDate = %s
+        GROUP BY s.itemId, s.quantity, cur.quantity
+        HAVING expectedQty <> actualQty
+    """
+    result = await connection.execute_query_dict(reconcileQuery, [locationType, locationId, snapshotDate])
+
+    return [
+        {
+            "locationType": locationType,
+            "locationId": locationId,
+            "itemId": r['itemId'],
+            "expectedQty": r['expectedQty'],
+            "actualQty": r['actualQty']
+        }
+        for r in result
+    ]
+
+async def reconcile():
+    connection = Tortoise.get_connection('default')
+    branches = await connection.execute_query_dict("SELECT id FROM branches WHERE isActive = 1")
+
+    locations = [(BRANCH, b['id']) for b in branches]
+    locations.append((WAREHOUSE, WAREHOUSE_LOCATION_ID))
+
+    results = await asyncio.gather(*(reconcileLocation(t, i) for t, i in locations))
+    discrepancies = [d for result in results for d in result]
+
+    return create_response(True, "Reconciliation completed", discrepancies, None, len(discrepancies)), 200
@@ -1,9 +1,14 @@
 from models import BranchItem, StockInput, Item, Branch, WareHouseItem, CartItems
-from utils import create_response, upload_media, delete_media
+from utils import create_response, query_history
 from tortoise import Tortoise
-from decimal import Decimal
+from tortoise.transactions import in_transaction
+from decimal import Decimal, InvalidOperation
 from werkzeug.utils import secure_filename
 from config import ITEM_IMAGES
+import inventoryService
+import imageService
+import assetService
+import mediaService
 import os
 
 """ GET METHODS """
@@ -157,25 +162,16 @@ async def getBranchStocks(categoryId, branchId, page=1, search=""):
     ]
     return create_response(True, 'Items Successfully Retrieved', itemList, None, totalCount), 200
 
-async def getStockHistory(itemId):
+async def getStockHistory(itemId, fromDate=None, toDate=None, cursor=None, pageSize=None, includeCount=True):
     sqlQuery = """
         SELECT s.*, i.storeCriticalValue from stockinputs s inner join branchitem bi on s.branchItemId= bi.id
         INNER JOIN items i on i.id = bi.itemId WHERE s.branchItemId = %s
     """
     params = [itemId]
 
-    sqlQuery += " ORDER BY s.Id"
-
-    connection = Tortoise.get_connection('default')
-    result = await connection.execute_query(sqlQuery, tuple(params))
-
-    countQuery = """
-        SELECT COUNT(*) from stockinputs WHERE branchItemId = %s
-    """
-    totalCountResult = await connection.execute_query(countQuery, (itemId,))
-    totalCount = totalCountResult[1][0]['COUNT(*)']
-
-    items = result[1]
+    items, nextCursor, totalCount = await query_history(
+        sqlQuery, params, 's.deliveryDate', 's.id', fromDate, toDate, cursor, pageSize, includeCount
+    )
 
     itemList = [
         {
@@ -191,7 +187,7 @@ async def getStockHistory(itemId):
         for item in items
     ]
 
-    return create_response(True, 'Items Successfully Retrieved', itemList, None, totalCount), 200
+    return create_response(True, 'Items Successfully Retrieved', itemList, nextCursor, totalCount), 200
 
 async def getProductsHQ(categoryId, page=1, search=""):
     pageSize = 30
@@ -314,26 +310,104 @@ async def getProductHQ(itemId):
 
 async def createStockInput(stockInput):
     branchItem = await BranchItem.get_or_none(id=stockInput['branchItemId'])
-    whItem = await WareHouseItem.get_or_none(itemId = branchItem.itemId)
 
     if not branchItem:
         return create_response(False, 'Item not found', None, None), 200
 
-    await StockInput.create(
-        qty=stockInput['qty'],
-        deliveryDate=stockInput['deliveryDate'],
-        deliveredBy=stockInput['deliveredBy'],
-        expectedQty=stockInput['expectedTotalQty'],
-        actualQty=stockInput['actualTotalQty'],
-        branchItemId=branchItem.id
-    )
-    branchItem.quantity += Decimal(str(stockInput['qty']))
-    whItem.quantity -= Decimal(str(stockInput['qty']))
-    await branchItem.save()
-    await whItem.save()
+    qty = Decimal(str(stockInput['qty']))
+
+    try:
+        async with in_transaction() as connection:
+            savedInput = await StockInput.create(
+                qty=stockInput['qty'],
+                deliveryDate=stockInput['deliveryDate'],
+                deliveredBy=stockInput['deliveredBy'],
+                expectedQty=stockInput['expectedTotalQty'],
+                actualQty=stockInput['actualTotalQty'],
+                branchItemId=branchItem.id,
+                using_db=connection
+            )
+            await inventoryService.adjustStock([
+                inventoryService.branchMovement(branchItem, qty, 'stock_input', savedInput.id),
+                inventoryService.movement(inventoryService.WAREHOUSE, inventoryService.WAREHOUSE_LOCATION_ID, branchItem.itemId, -qty, 'stock_input', savedInput.id)
+            ], connection)
+    except inventoryService.StockAdjustmentError as e:
+        return create_response(False, str(e), None, None), 200
     
     return create_response(True, "Success", None, None), 200
 
+async def createDispatch(dispatch):
+    if not dispatch or not dispatch.get('deliveryDate') or not dispatch.get('deliveredBy'):
+        return create_response(False, 'Delivery date and deliveredBy are required', None, None), 400
+
+    try:
+        for line in dispatch.get('lines') or []:
+            line['branchId'] = int(line['branchId'])
+            line['itemId'] = int(line['itemId'])
+            line['qty'] = Decimal(str(line['qty']))
+            line['expectedQty'] = Decimal(str(line.get('expectedQty', line['qty'])))
+            line['actualQty'] = Decimal(str(line.get('actualQty', line['qty'])))
+    except (KeyError, TypeError, ValueError, InvalidOperation):
+        return create_response(False, 'Each line needs a branchId, itemId and qty', None, None), 400
+
+    lines = [line for line in dispatch.get('lines') or [] if line['qty'] > 0]
+    if not lines:
+        return create_response(False, 'No dispatch lines provided', None, None), 400
+
+    pairs = list({(line['branchId'], line['itemId']) for line in lines})
+    placeholders = ", ".join(["(%s, %s)"] * len(pairs))
+    params = [value for pair in pairs for value in pair]
+
+    sqlQuery = f"""
+        SELECT bi.id AS branchItemId, bi.branchId, bi.itemId, wh.quantity AS whQuantity
+        FROM branchitem bi
+        INNER JOIN warehouseitems wh ON wh.itemId = bi.itemId
+        WHERE (bi.branchId, bi.itemId) IN ({placeholders})
+    """
+    connection = Tortoise.get_connection('default')
+    rows = await connection.execute_query_dict(sqlQuery, params)
+
+    branchItems = {(r['branchId'], r['itemId']): r['branchItemId'] for r in rows}
+    whQuantities = {r['itemId']: Decimal(r['whQuantity']) for r in rows}
+
+    missing = [{"branchId": b, "itemId": i} for b, i in pairs if (b, i) not in branchItems]
+    if missing:
+        return create_response(False, 'Item not found', missing, None), 200
+
+    requested = {}
+    for line in lines:
+        requested[line['itemId']] = requested.get(line['itemId'], Decimal(0)) + line['qty']
+
+    shortages = [
+        {"itemId": itemId, "requestedQty": qty, "whQty": whQuantities[itemId]}
+        for itemId, qty in requested.items() if qty > whQuantities[itemId]
+    ]
+    if shortages:
+        return create_response(False, 'Not enough warehouse stock available', shortages, None), 200
+
+    try:
+        async with in_transaction() as connection:
+            movements = []
+            for line in lines:
+                qty = line['qty']
+                stockInput = await StockInput.create(
+                    qty=qty,
+                    deliveryDate=dispatch['deliveryDate'],
+                    deliveredBy=dispatch['deliveredBy'],
+                    expectedQty=line['expectedQty'],
+                    actualQty=line['actualQty'],
+                    branchItemId=branchItems[(line['branchId'], line['itemId'])],
+                    using_db=connection
+                )
+                movements.append(inventoryService.movement(inventoryService.BRANCH, line['branchId'], line['itemId'], qty, 'stock_input', stockInput.id))
+                movements.append(inventoryService.movement(inventoryService.WAREHOUSE, inventoryService.WAREHOUSE_LOCATION_ID, line['itemId'], -qty, 'stock_input', stockInput.id))
+
+            await inventoryService.adjustStock(movements, connection, guard=True)
+    except inventoryService.StockAdjustmentError as e:
+        return create_response(False, str(e), None, None), 200
+
+    return create_response(True, "Success", None, None, len(lines)), 200
+
 async def saveItem(data, file):
     itemId = int(data.get('id'))
     name = data.get('name')
@@ -407,6 +481,8 @@ async def saveItem(data, file):
         file_name = secure_filename(file.filename)
         file_path = os.path.join(ITEM_IMAGES, file_name)
         await file.save(file_path) 
+        await imageService.processUpload(file_path)
+        assetService.invalidate(file_path)
 
         existing_item = await Item.get_or_none(id=existing_item.id)
         existing_item.imagePath = file_name  
@@ -415,15 +491,16 @@ async def saveItem(data, file):
     return create_response(True, "Success", itemId, None), 200
 
 async def deleteItem(id):
+    """Soft-deletes the item: its row, stock and any cart lines that point at it are kept."""
     item = await Item.get_or_none(id=id)
     
     if not item:
         return create_response(False, "Item not found.", None, None), 200
 
     item.isManaged = False
-    if item.imagePath:
-        result = delete_media(item.imageId)
-        
+    if item.imagePath and item.imageId:
+        await mediaService.enqueue(mediaService.DELETE, item.imageId)
+
     await item.save()
     
     return create_response(True, "Item deleted successfully.", None, None), 200
@@ -506,6 +583,7 @@ async def getStocksMonitor(categoryId, page=1, search=""):
 
     items = result[1]
     itemList = []
+    availability = {}
     
     for item in items:
         item_data = {
@@ -532,6 +610,17 @@ async def getStocksMonitor(categoryId, page=1, search=""):
             })
         
         itemList.append(item_data)
+        availability[item['id']] = [
+            {
+                "id": item[f"branch_{branch['id']}_id"],
+                "branchId": branch['id'],
+                "branchName": branch['name'],
+                "quantity": item[f"branch_{branch['id']}_qty"]
+            }
+            for branch in branch_list if item[f"branch_{branch['id']}_id"] is not None
+        ]
+
+    inventoryService.cacheAvailability(availability)
 
     return create_response(True, 'Items Successfully Retrieved', itemList, None, totalCount), 200
 
@@ -607,6 +696,7 @@ async def getWHStocksMonitor(categoryId, page=1, search=""):
     itemList = []
     
     branch_name_map = {branch['id']: branch['name'] for branch in branch_list}
+    availability = {}
     
     for item in items:
         item_data = {
@@ -629,15 +719,29 @@ async def getWHStocksMonitor(categoryId, page=1, search=""):
             })
         
         itemList.append(item_data)
+        availability[item['id']] = [
+            {
+                "id": item[f'branch_{branch_id}_item_id'],
+                "branchId": branch_id,
+                "branchName": branch_name_map[branch_id],
+                "quantity": item[f'branch_{branch_id}_qty']
+            }
+            for branch_id in branch_name_map if item[f'branch_{branch_id}_item_id'] is not None
+        ]
+
+    inventoryService.cacheAvailability(availability)
 
     return create_response(True, 'Items Successfully Retrieved', itemList, None, totalCount), 200
 
 async def editStock(id, qty):
-    branchItem = await BranchItem.get_or_none(id=id)
-    if not branchItem:
-        return create_response(False, 'Item not found', None, None), 200
-
-    branchItem.quantity = Decimal(str(qty))
-    await branchItem.save()
+    async with in_transaction() as connection:
+        branchItem = await BranchItem.select_for_update().using_db(connection).get_or_none(id=id)
+        if not branchItem:
+            return create_response(False, 'Item not found', None, None), 200
+
+        delta = Decimal(str(qty)) - branchItem.quantity
+        branchItem.quantity = Decimal(str(qty))
+        await branchItem.save(using_db=connection)
+        await inventoryService.recordMovements([inventoryService.branchMovement(branchItem, delta, 'adjustment')], connection)
     
     return create_response(True, "Success", None, None), 200
\ No newline at end of file
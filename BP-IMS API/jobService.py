@@ -0,0 +1,67 @@
+from utils import create_response
+from datetime import datetime, timedelta, timezone
+import asyncio
+import uuid
+
+JOB_RETENTION = timedelta(hours=6)
+
+jobs = {}
+tasks = {}
+
+def now_sg():
+    return datetime.now(timezone.utc) + timedelta(hours=8)
+
+def pruneJobs():
+    cutoff = now_sg() - JOB_RETENTION
+    for jobId in [j for j, job in jobs.items() if job["finishedAt"] and job["finishedAt"] < cutoff]:
+        jobs.pop(jobId, None)
+
+def startJob(name, work, total=0):
+    """
+    Runs work(jobId) as a background task and returns the job id right away.
+    work reports how far it got through updateProgress; the outcome is kept in memory for polling.
+    """
+    pruneJobs()
+
+    jobId = uuid.uuid4().hex
+    jobs[jobId] = {
+        "id": jobId,
+        "name": name,
+        "status": "running",
+        "processed": 0,
+        "total": total,
+        "result": None,
+        "error": None,
+        "startedAt": now_sg(),
+        "finishedAt": None
+    }
+
+    async def run():
+        job = jobs[jobId]
+        try:
+            job["result"] = await work(jobId)
+            job["status"] = "done"
+        except Exception as e:
+            job["status"] = "failed"
+            job["error"] = str(e)
+            print(f"Job {name} ({jobId}) failed: {e}")
+        finally:
+            job["finishedAt"] = now_sg()
+            tasks.pop(jobId, None)
+
+    tasks[jobId] = asyncio.create_task(run())
+    return jobId
+
+def updateProgress(jobId, processed, total=None):
+    job = jobs.get(jobId)
+    if job:
+        job["processed"] = processed
+        if total is not None:
+            job["total"] = total
+
+async def getJob(jobId):
+    job = jobs.get(jobId)
+    if not job:
+        return create_response(False, "Job not found", None, None), 404
+
+    return create_response(True, "Job successfully retrieved", job, None), 200
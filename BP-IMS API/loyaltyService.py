@@ -0,0 +1,96 @@
+from tortoise import Tortoise
+from datetime import date
+import time
+
+LOYALTY_THRESHOLD = 3000
+RULES_TTL = 300
+
+rules = {"expires": 0, "cardId": None, "stages": {}, "rewards": {}}
+
+def invalidateRules():
+    rules["expires"] = 0
+
+async def getRules():
+    """Returns the valid card, every stage keyed by id and every reward keyed by id, loaded once until invalidated."""
+    if rules["expires"] > time.monotonic():
+        return rules
+
+    connection = Tortoise.get_connection("default")
+    card = await connection.execute_query_dict("SELECT id FROM loyaltycards WHERE isValid = 1 LIMIT 1")
+    stages = await connection.execute_query_dict("SELECT id, orderId, loyaltyCardId, itemRewardId FROM loyaltystages")
+    rewards = await connection.execute_query_dict("SELECT id, name FROM itemrewards")
+
+    rules["cardId"] = card[0]['id'] if card else None
+    rules["stages"] = {s['id']: s for s in stages}
+    rules["rewards"] = {r['id']: r['name'] for r in rewards}
+    rules["expires"] = time.monotonic() + RULES_TTL
+    return rules
+
+async def enroll(customerId, connection):
+    """Puts the customer on the valid card with its first stage done, unless they already have progress."""
+    activeRules = await getRules()
+    if not activeRules["cardId"]:
+        return 0
+
+    result = await connection.execute_query("""
+        INSERT INTO loyaltycustomers (customerId, stageId, isDone, dateDone, itemId)
+        SELECT %s, ls.id, ls.orderId = 1, CASE WHEN ls.orderId = 1 THEN %s END, NULL
+        FROM loyaltystages ls
+        WHERE ls.loyaltyCardId = %s
+        AND NOT EXISTS (SELECT 1 FROM loyaltycustomers lc WHERE lc.customerId = %s)
+    """, [customerId, date.today(), activeRules["cardId"], customerId])
+    return result[0]
+
+async def advance(customerId):
+    """
+    Records a qualifying purchase: enrolls the customer on the valid card, or marks their lowest
+    open stage done with one conditional UPDATE, so concurrent purchases each move one stage and
+    never the same one. Returns the loyaltyItemDto shown on the receipt.
+    """
+    connection = Tortoise.get_connection("default")
+    activeRules = await getRules()
+
+    advanced = await enroll(customerId, connection)
+    if not advanced:
+        result = await connection.execute_query("""
+            UPDATE loyaltycustomers
+            SET isDone = 1, dateDone = %s
+            WHERE customerId = %s AND isDone = 0
+            ORDER BY (SELECT ls.orderId FROM loyaltystages ls WHERE ls.id = loyaltycustomers.stageId)
+            LIMIT 1
+        """, [date.today(), customerId])
+        advanced = result[0]
+
+    progress = await connection.execute_query_dict(
+        "SELECT id, stageId, isDone FROM loyaltycustomers WHERE customerId = %s", [customerId]
+    )
+
+    stages = activeRules["stages"]
+    if any(p['stageId'] not in stages for p in progress):
+        invalidateRules()
+        activeRules = await getRules()
+        stages = activeRules["stages"]
+
+    progress = sorted(
+        [dict(p, orderId=stages[p['stageId']]['orderId']) for p in progress if p['stageId'] in stages],
+        key=lambda p: p['orderId']
+    )
+    doneStages = [p for p in progress if p['isDone']]
+    latest = doneStages[-1] if doneStages else None
+    complete = not advanced and bool(latest) and latest['orderId'] == progress[-1]['orderId']
+
+    loyaltyItem = {"newProgress": True}
+    if latest:
+        loyaltyItem.update({
+            "currentStage": latest["orderId"],
+            "id": latest["id"],
+            "completeLoyalty": complete
+        })
+
+        rewardId = stages[latest['stageId']]['itemRewardId']
+        if rewardId and rewardId in activeRules["rewards"]:
+            loyaltyItem["hasReward"] = True
+            loyaltyItem["rewardName"] = activeRules["rewards"][rewardId]
+            loyaltyItem["isItem"] = rewardId == 1
+
+    return loyaltyItem
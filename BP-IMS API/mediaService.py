@@ -0,0 +1,149 @@
+from models import MediaOperation
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+import asyncio
+import cloudinary.uploader
+import os
+
+# Images are now stored locally by the save handlers through imageService.processUpload, so the
+# only remote media call left is deleting an item's old Cloudinary image; that is all the queue carries.
+DELETE = 'delete'
+
+PENDING = 'pending'
+DONE = 'done'
+FAILED = 'failed'
+
+MEDIA_BACKEND = os.environ.get('MEDIA_BACKEND', 'cloudinary')
+MEDIA_FAIL_FIRST = int(os.environ.get('MEDIA_FAIL_FIRST', 0))
+LOCAL_MEDIA_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'media')
+
+MEDIA_WORKERS = 4
+MEDIA_QUEUE_SIZE = 500
+MAX_ATTEMPTS = 6
+BACKOFF_BASE = 5
+BACKOFF_MAX = 60 * 30
+POLL_INTERVAL = 30
+
+class LocalMediaBackend:
+    """
+    Keeps media under a local directory; used on dev machines and as the fake for the queue. With
+    failFirst set (MEDIA_FAIL_FIRST), the first failFirst calls for each public id raise, so the
+    retry, backoff and give-up paths can be watched in media_operations.
+    """
+    def __init__(self, root, failFirst=0):
+        self.root = root
+        self.failFirst = failFirst
+        self.calls = {}
+
+    def delete(self, public_id):
+        self.calls[public_id] = self.calls.get(public_id, 0) + 1
+        if self.calls[public_id] <= self.failFirst:
+            raise RuntimeError(f"Simulated failure {self.calls[public_id]} of {self.failFirst} deleting {public_id}")
+
+        path = os.path.join(self.root, os.path.basename(public_id))
+        if os.path.exists(path):
+            os.remove(path)
+        return True
+
+class CloudinaryMediaBackend:
+    def delete(self, public_id):
+        result = cloudinary.uploader.destroy(public_id, resource_type="image").get("result")
+        if result not in ("ok", "not found"):
+            raise RuntimeError(f"Cloudinary could not delete {public_id}: {result}")
+        return True
+
+backends = {
+    "local": LocalMediaBackend(LOCAL_MEDIA_ROOT, MEDIA_FAIL_FIRST),
+    "cloudinary": CloudinaryMediaBackend()
+}
+
+queue = None
+executor = None
+inFlight = set()
+
+def now_sg():
+    return datetime.now(timezone.utc) + timedelta(hours=8)
+
+def backoff(attempts):
+    return timedelta(seconds=min(BACKOFF_BASE * (2 ** (attempts - 1)), BACKOFF_MAX))
+
+def offer(operationId):
+    """Hands an operation to the workers; when the queue is full the poller picks it up later."""
+    if queue is None or operationId in inFlight:
+        return
+    try:
+        queue.put_nowait(operationId)
+        inFlight.add(operationId)
+    except asyncio.QueueFull:
+        pass
+
+async def enqueue(operation, target, backend=None):
+    """Records a media operation and returns at once; the delete happens on a worker thread."""
+    now = now_sg()
+    mediaOperation = await MediaOperation.create(
+        operation=operation,
+        backend=backend or MEDIA_BACKEND,
+        target=target,
+        status=PENDING,
+        attempts=0,
+        nextAttemptAt=now,
+        createdAt=now
+    )
+    offer(mediaOperation.id)
+    return mediaOperation.id
+
+async def process(operationId):
+    mediaOperation = await MediaOperation.get_or_none(id=operationId)
+    if not mediaOperation or mediaOperation.status != PENDING:
+        return
+
+    backend = backends[mediaOperation.backend]
+
+    try:
+        result = await asyncio.get_running_loop().run_in_executor(executor, backend.delete, mediaOperation.target)
+        await MediaOperation.filter(id=operationId).update(
+            status=DONE,
+            attempts=mediaOperation.attempts + 1,
+            result=str(result)[:500],
+            lastError=None
+        )
+    except Exception as e:
+        attempts = mediaOperation.attempts + 1
+        await MediaOperation.filter(id=operationId).update(
+            status=FAILED if attempts >= MAX_ATTEMPTS else PENDING,
+            attempts=attempts,
+            lastError=str(e)[:500],
+            nextAttemptAt=now_sg() + backoff(attempts)
+        )
+
+async def worker():
+    while True:
+        operationId = await queue.get()
+        try:
+            await process(operationId)
+        except Exception as e:
+            print(f"Media operation {operationId} failed: {e}")
+        finally:
+            inFlight.discard(operationId)
+            queue.task_done()
+
+async def runWorkers():
+    """Starts the worker pool and keeps feeding it pending operations that are due, including ones left over from a restart."""
+    global queue, executor
+    queue = asyncio.Queue(maxsize=MEDIA_QUEUE_SIZE)
+    executor = ThreadPoolExecutor(max_workers=MEDIA_WORKERS, thread_name_prefix="media")
+    workers = [asyncio.create_task(worker()) for _ in range(MEDIA_WORKERS)]
+
+    try:
+        while True:
+            try:
+                due = await MediaOperation.filter(status=PENDING, nextAttemptAt__lte=now_sg()).order_by('id').limit(MEDIA_QUEUE_SIZE).values_list('id', flat=True)
+                for operationId in due:
+                    offer(operationId)
+            except Exception as e:
+                print(f"Media poller failed: {e}")
+            await asyncio.sleep(POLL_INTERVAL)
+    finally:
+        for task in workers:
+            task.cancel()
+        executor.shutdown(wait=False)
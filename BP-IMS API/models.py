@@ -88,9 +88,12 @@ class Transaction(Model):
     isVoided = fields.BooleanField(null=False, default=False)
     isPaid = fields.BooleanField(null=False, default=True)
     isExacon = fields.BooleanField(null=False, default=False)
+    dueDate = fields.DateField(null=True)
+    receiptVersion = fields.IntField(null=False, default=0)
 
     class Meta:
         table = "transactions"
+        indexes = (("isExacon", "isPaid", "dueDate"), ("customerId", "isPaid", "transactionDate", "id"), ("transactionDate", "branchId"))
 
 class TransactionItem(Model):
     id = fields.IntField(pk=True)
@@ -98,9 +101,12 @@ class TransactionItem(Model):
     itemId = fields.IntField(null=False)
     quantity = fields.DecimalField(max_digits=10, decimal_places=2, null=False)
     amount = fields.DecimalField(max_digits=10, decimal_places=2, null=False)
+    unitPrice = fields.DecimalField(max_digits=10, decimal_places=2, null=True)
+    unitCost = fields.DecimalField(max_digits=10, decimal_places=2, null=True)
 
     class Meta:
         table = "transactionitems"
+        indexes = (("transactionId",),)
 
 class Customer(Model):
     id = fields.IntField(pk=True)
@@ -109,12 +115,15 @@ class Customer(Model):
     contactNumber1 = fields.CharField(max_length=20, null=True)
     contactNumber2 = fields.CharField(max_length=20, null=True)
     totalOrderAmount = fields.DecimalField(max_digits=18, decimal_places=2, null=False)
+    orderCount = fields.IntField(null=False, default=0)
+    lastPurchaseDate = fields.DatetimeField(null=True)
     fileName = fields.CharField(max_length=255, null=True)
     imageId = fields.CharField(max_length=255, null=True)
     isLoyalty = fields.BooleanField(null=True)
 
     class Meta:
         table = "customers"
+        indexes = (("isLoyalty", "id"),)
 
 class BranchItem(Model):
     id= fields.IntField(null=False, pk=True)
@@ -137,6 +146,7 @@ class StockInput(Model):
 
     class Meta:
         table = "stockinputs"
+        indexes = (("branchItemId", "deliveryDate", "id"),)
 
 class WareHouseItem(Model):
     id = fields.IntField(null=False, pk=True)
@@ -156,6 +166,7 @@ class WHStockInput(Model):
     itemId = fields.IntField(null=False)
     class Meta:
         table = "whstockinputs"
+        indexes = (("itemId", "deliveryDate", "id"), ("deliveredBy", "deliveryDate", "id"))
 
 class Supplier(Model):
     id = fields.IntField(null=False, pk=True)
@@ -176,6 +187,7 @@ class BranchTransferHistory(Model):
 
     class Meta:
         table = "branchtransferhistory"
+        indexes = (("branchFromId", "date", "id"), ("branchToId", "date", "id"))
 
 class SupplierReturn(Model):
     id = fields.IntField(pk=True)
@@ -187,6 +199,7 @@ class SupplierReturn(Model):
 
     class Meta:
         table = "supplierreturn"
+        indexes = (("whItemId", "date", "id"),)
 
 class BranchReturn(Model):
     id = fields.IntField(pk=True)
@@ -197,6 +210,7 @@ class BranchReturn(Model):
 
     class Meta:
         table = "branchreturn"
+        indexes = (("branchItemId", "date", "id"),)
 
 class LoyaltyCard(Model):
     id = fields.IntField(pk=True)
@@ -231,4 +245,144 @@ class LoyaltyCustomer(Model):
     itemId = fields.IntField(null=True)
     
     class Meta:
-        table = "loyaltycustomers"
\ No newline at end of file
+        table = "loyaltycustomers"
+        indexes = (("customerId", "stageId"), ("stageId",))
+
+class InventoryMovement(Model):
+    id = fields.IntField(pk=True)
+    locationType = fields.CharField(max_length=20, null=False)
+    locationId = fields.IntField(null=False)
+    itemId = fields.IntField(null=False)
+    delta = fields.DecimalField(max_digits=10, decimal_places=2, null=False)
+    reason = fields.CharField(max_length=50, null=False)
+    referenceId = fields.IntField(null=True)
+    date = fields.DatetimeField(null=False)
+
+    class Meta:
+        table = "inventory_movements"
+        indexes = (("locationType", "locationId", "itemId", "id"), ("itemId", "date"))
+
+class InventorySnapshot(Model):
+    id = fields.IntField(pk=True)
+    locationType = fields.CharField(max_length=20, null=False)
+    locationId = fields.IntField(null=False)
+    itemId = fields.IntField(null=False)
+    quantity = fields.DecimalField(max_digits=10, decimal_places=2, null=False)
+    lastMovementId = fields.IntField(null=False, default=0)
+    snapshotDate = fields.DatetimeField(null=False)
+
+    class Meta:
+        table = "inventory_snapshots"
+        indexes = (("locationType", "locationId", "snapshotDate"),)
+
+class CustomerBalance(Model):
+    id = fields.IntField(pk=True)
+    customerId = fields.IntField(null=False, unique=True)
+    outstanding = fields.DecimalField(max_digits=18, decimal_places=2, null=False, default=0)
+    lastUpdated = fields.DatetimeField(null=False)
+
+    class Meta:
+        table = "customerbalances"
+
+class MediaOperation(Model):
+    id = fields.IntField(pk=True)
+    operation = fields.CharField(max_length=20, null=False)
+    backend = fields.CharField(max_length=20, null=False)
+    target = fields.CharField(max_length=500, null=False)
+    status = fields.CharField(max_length=20, null=False, default="pending")
+    attempts = fields.IntField(null=False, default=0)
+    lastError = fields.CharField(max_length=500, null=True)
+    result = fields.CharField(max_length=500, null=True)
+    nextAttemptAt = fields.DatetimeField(null=False)
+    createdAt = fields.DatetimeField(null=False)
+
+    class Meta:
+        table = "media_operations"
+        indexes = (("status", "nextAttemptAt"),)
+
+class DailySalesSummary(Model):
+    id = fields.IntField(pk=True)
+    branchId = fields.IntField(null=False)
+    salesDate = fields.DateField(null=False)
+    grossSales = fields.DecimalField(max_digits=18, decimal_places=2, null=False, default=0)
+    deliveryFee = fields.DecimalField(max_digits=18, decimal_places=2, null=False, default=0)
+    totalDiscount = fields.DecimalField(max_digits=18, decimal_places=2, null=False, default=0)
+    itemCost = fields.DecimalField(max_digits=18, decimal_places=2, null=False, default=0)
+    transactionCount = fields.IntField(null=False, default=0)
+    closedAt = fields.DatetimeField(null=False)
+
+    class Meta:
+        table = "daily_sales_summaries"
+        unique_together = (("branchId", "salesDate"),)
+        indexes = (("salesDate", "branchId"),)
+
+class MonthlySales(Model):
+    id = fields.IntField(pk=True)
+    branchId = fields.IntField(null=False)
+    month = fields.DateField(null=False)
+    totalAmount = fields.DecimalField(max_digits=18, decimal_places=2, null=False, default=0)
+    transactionCount = fields.IntField(null=False, default=0)
+
+    class Meta:
+        table = "monthly_sales"
+        unique_together = (("branchId", "month"),)
+        indexes = (("month", "branchId"),)
+
+class OrderSizeBucket(Model):
+    id = fields.IntField(pk=True)
+    branchId = fields.IntField(null=False)
+    salesDate = fields.DateField(null=False)
+    bucket = fields.DecimalField(max_digits=18, decimal_places=2, null=False)
+    orderCount = fields.IntField(null=False, default=0)
+    totalAmount = fields.DecimalField(max_digits=18, decimal_places=2, null=False, default=0)
+
+    class Meta:
+        table = "order_size_histograms"
+        unique_together = (("branchId", "salesDate", "bucket"),)
+        indexes = (("salesDate", "branchId"),)
+
+class BranchClose(Model):
+    id = fields.IntField(pk=True)
+    branchId = fields.IntField(null=False)
+    salesDate = fields.DateField(null=False)
+    transactionCount = fields.IntField(null=False, default=0)
+    grossSales = fields.DecimalField(max_digits=18, decimal_places=2, null=False, default=0)
+    deliveryFee = fields.DecimalField(max_digits=18, decimal_places=2, null=False, default=0)
+    totalDiscount = fields.DecimalField(max_digits=18, decimal_places=2, null=False, default=0)
+    itemCost = fields.DecimalField(max_digits=18, decimal_places=2, null=False, default=0)
+    cashSales = fields.DecimalField(max_digits=18, decimal_places=2, null=False, default=0)
+    creditSales = fields.DecimalField(max_digits=18, decimal_places=2, null=False, default=0)
+    unpaidCredit = fields.DecimalField(max_digits=18, decimal_places=2, null=False, default=0)
+    voidCount = fields.IntField(null=False, default=0)
+    voidAmount = fields.DecimalField(max_digits=18, decimal_places=2, null=False, default=0)
+    closedBy = fields.IntField(null=True)
+    closedAt = fields.DatetimeField(null=False)
+
+    class Meta:
+        table = "branch_closes"
+        unique_together = (("branchId", "salesDate"),)
+        indexes = (("salesDate", "branchId"),)
+
+class BranchCloseItem(Model):
+    id = fields.IntField(pk=True)
+    branchCloseId = fields.IntField(null=False)
+    itemId = fields.IntField(null=False)
+    name = fields.CharField(max_length=255, null=False)
+    quantity = fields.DecimalField(max_digits=18, decimal_places=2, null=False)
+    amount = fields.DecimalField(max_digits=18, decimal_places=2, null=False)
+
+    class Meta:
+        table = "branch_close_items"
+        indexes = (("branchCloseId",),)
+
+class BranchCloseCashier(Model):
+    id = fields.IntField(pk=True)
+    branchCloseId = fields.IntField(null=False)
+    cashierId = fields.IntField(null=True)
+    name = fields.CharField(max_length=255, null=True)
+    transactionCount = fields.IntField(null=False)
+    totalAmount = fields.DecimalField(max_digits=18, decimal_places=2, null=False)
+
+    class Meta:
+        table = "branch_close_cashiers"
+        indexes = (("branchCloseId",),)
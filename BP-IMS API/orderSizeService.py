@@ -0,0 +1,207 @@
+from tortoise import Tortoise
+from tortoise.transactions import in_transaction
+from utils import create_response
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+import bisect
+import jobService
+import logging
+
+# Lower edges of the order-size buckets; the last bucket is open-ended. Changing the edges
+# requires POST /rebuildOrderHistogram so stored days are re-bucketed.
+ORDER_SIZE_EDGES = [0, 250, 500, 750, 1000, 1500, 2000, 3000, 5000, 10000, 20000, 50000]
+SMALL_ORDER_THRESHOLD = 1500
+PERCENTILES = (25, 50, 75, 90)
+REBUILD_CHUNK_DAYS = 31
+
+logger = logging.getLogger(__name__)
+
+def now_sg():
+    return datetime.now(timezone.utc) + timedelta(hours=8)
+
+def bucketFor(amount):
+    index = bisect.bisect_right(ORDER_SIZE_EDGES, float(amount)) - 1
+    return ORDER_SIZE_EDGES[max(index, 0)]
+
+def bucketExpression(column):
+    cases = " ".join(f"WHEN {column} >= {edge} THEN {edge}" for edge in reversed(ORDER_SIZE_EDGES[1:]))
+    return f"CASE {cases} ELSE {ORDER_SIZE_EDGES[0]} END"
+
+async def recordOrder(branchId, transactionDate, amount, delta=1, connection=None):
+    """
+    Moves one paid order into (delta=1) or out of (delta=-1) its branch/day bucket. Checkout,
+    credit payment and void call this in the sale's own database transaction.
+    """
+    connection = connection or Tortoise.get_connection('default')
+    salesDate = transactionDate.date() if isinstance(transactionDate, datetime) else transactionDate
+    amount = Decimal(str(amount))
+
+    await connection.execute_query("""
+        INSERT INTO order_size_histograms (branchId, salesDate, bucket, orderCount, totalAmount)
+        VALUES (%s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE orderCount = orderCount + %s, totalAmount = totalAmount + %s
+    """, [branchId, salesDate, bucketFor(amount), delta, amount * delta, delta, amount * delta])
+
+async def rebuild(jobId=None):
+    """
+    Brings every stored day back in line with transactions, one month-sized date range per
+    transaction. Each range reads its stored buckets and the recomputed ones from the same snapshot
+    and adds the difference, so checkouts keep upserting while it runs and an order committed
+    after the snapshot, which is in neither read, keeps the increment recordOrder gave it.
+    """
+    connection = Tortoise.get_connection('default')
+    first = await connection.execute_query_dict("""
+        SELECT LEAST(
+            COALESCE((SELECT MIN(DATE(transactionDate)) FROM transactions), CURDATE()),
+            COALESCE((SELECT MIN(salesDate) FROM order_size_histograms), CURDATE())
+        ) AS firstDate
+    """)
+
+    firstDay = first[0]['firstDate']
+    firstDay = firstDay.date() if isinstance(firstDay, datetime) else firstDay
+    day = firstDay
+    lastDay = now_sg().date()
+    total = (lastDay - day).days + 1
+    if jobId:
+        jobService.updateProgress(jobId, 0, total)
+
+    bucket = bucketExpression('totalAmount')
+    while day <= lastDay:
+        start = datetime.combine(day, datetime.min.time())
+        end = start + timedelta(days=REBUILD_CHUNK_DAYS)
+
+        async with in_transaction() as chunk:
+            stored = await chunk.execute_query_dict("""
+                SELECT branchId, salesDate, bucket, orderCount, totalAmount
+                FROM order_size_histograms
+                WHERE salesDate >= %s AND salesDate < %s
+            """, [start.date(), end.date()])
+            actual = await chunk.execute_query_dict(f"""
+                SELECT branchId, DATE(transactionDate) AS salesDate, {bucket} AS bucket, COUNT(*) AS orderCount, SUM(totalAmount) AS totalAmount
+                FROM transactions
+                WHERE transactionDate >= %s AND transactionDate < %s AND isVoided = 0 AND isPaid = 1
+                GROUP BY branchId, DATE(transactionDate), {bucket}
+            """, [start, end])
+
+            drift = {}
+            for rows, sign in ((actual, 1), (stored, -1)):
+                for r in rows:
+                    key = (r['branchId'], r['salesDate'], Decimal(str(r['bucket'])))
+                    count, amount = drift.get(key, (0, Decimal(0)))
+                    drift[key] = (count + sign * int(r['orderCount']), amount + sign * Decimal(str(r['totalAmount'])))
+
+            changes = [[*key, count, amount, count, amount] for key, (count, amount) in drift.items() if count or amount]
+            if changes:
+                await chunk.execute_many("""
+                    INSERT INTO order_size_histograms (branchId, salesDate, bucket, orderCount, totalAmount)
+                    VALUES (%s, %s, %s, %s, %s)
+                    ON DUPLICATE KEY UPDATE orderCount = orderCount + %s, totalAmount = totalAmount + %s
+                """, changes)
+                await chunk.execute_query("""
+                    DELETE FROM order_size_histograms
+                    WHERE salesDate >= %s AND salesDate < %s AND orderCount = 0 AND totalAmount = 0
+                """, [start.date(), end.date()])
+
+        day += timedelta(days=REBUILD_CHUNK_DAYS)
+        if jobId:
+            jobService.updateProgress(jobId, min((day - firstDay).days, total))
+
+    return {"days": total}
+
+async def ensureHistogram():
+    """
+    Reconciles the histogram at startup when it does not hold exactly the paid, unvoided orders,
+    e.g. on the first start after it was added. A sale landing between the two counts only
+    causes a redundant pass.
+    """
+    connection = Tortoise.get_connection('default')
+    try:
+        stored = await connection.execute_query_dict("SELECT COALESCE(SUM(orderCount), 0) AS orders FROM order_size_histograms")
+        actual = await connection.execute_query_dict("SELECT COUNT(*) AS orders FROM transactions WHERE isVoided = 0 AND isPaid = 1")
+        if int(stored[0]['orders']) != int(actual[0]['orders']):
+            await rebuild()
+    except Exception:
+        logger.exception("Building the order-size histogram failed")
+
+async def startRebuild():
+    jobId = jobService.startJob("rebuildOrderHistogram", rebuild)
+    return create_response(True, "Rebuild started", {"jobId": jobId}, None), 200
+
+def percentile(buckets, totalCount, p):
+    """Estimates a percentile by linear interpolation inside the bucket that contains it."""
+    rank = totalCount * p / 100
+    seen = 0
+    for index, bucket in enumerate(buckets):
+        if bucket['orderCount'] and seen + bucket['orderCount'] >= rank:
+            lower = float(bucket['bucket'])
+            if index + 1 < len(ORDER_SIZE_EDGES):
+                upper = ORDER_SIZE_EDGES[index + 1]
+                return round(lower + (upper - lower) * (rank - seen) / bucket['orderCount'], 2)
+            return lower
+        seen += bucket['orderCount']
+    return None
+
+def formatPercent(count, totalCount):
+    return f"{round(count * 100.0 / totalCount, 2):.2f}%" if totalCount else None
+
+async def getDistribution(fromDate=None, untilDate=None, branchId=None):
+    """
+    Sums the stored buckets over a date range (all time when no range is given) and derives the
+    small/high order split, average basket and percentile estimates from them.
+    """
+    sqlQuery = """
+        SELECT bucket, SUM(orderCount) AS orderCount, SUM(totalAmount) AS totalAmount
+        FROM order_size_histograms
+        WHERE 1 = 1
+    """
+    params = []
+
+    if fromDate:
+        sqlQuery += " AND salesDate >= %s"
+        params.append(fromDate)
+
+    if untilDate:
+        sqlQuery += " AND salesDate <= %s"
+        params.append(untilDate)
+
+    if branchId:
+        sqlQuery += " AND branchId = %s"
+        params.append(branchId)
+
+    sqlQuery += " GROUP BY bucket"
+    rows = await Tortoise.get_connection('default').execute_query_dict(sqlQuery, params)
+    stored = {float(r['bucket']): r for r in rows}
+
+    buckets = []
+    for edge in ORDER_SIZE_EDGES:
+        row = stored.get(float(edge))
+        buckets.append({
+            "bucket": edge,
+            "orderCount": int(row['orderCount']) if row else 0,
+            "totalAmount": row['totalAmount'] if row else Decimal(0)
+        })
+
+    totalCount = sum(b['orderCount'] for b in buckets)
+    totalAmount = sum(b['totalAmount'] for b in buckets)
+    smallCount = sum(b['orderCount'] for b in buckets if b['bucket'] < SMALL_ORDER_THRESHOLD)
+
+    return {
+        "buckets": buckets,
+        "orderCount": totalCount,
+        "smallOrderCount": smallCount,
+        "highOrderCount": totalCount - smallCount,
+        "smallOrderPercentage": formatPercent(smallCount, totalCount),
+        "highOrderPercentage": formatPercent(totalCount - smallCount, totalCount),
+        "averageOrder": totalAmount / totalCount if totalCount else None,
+        "percentiles": {f"p{p}": percentile(buckets, totalCount, p) for p in PERCENTILES} if totalCount else {}
+    }
+
+async def getOrderSizeDistribution(fromDateStr, toDateStr, branchId):
+    try:
+        fromDate = datetime.strptime(fromDateStr, '%Y-%m-%d').date() if fromDateStr else None
+        untilDate = datetime.strptime(toDateStr, '%Y-%m-%d').date() if toDateStr else None
+    except ValueError:
+        return create_response(False, "Invalid date", None, None), 400
+
+    distribution = await getDistribution(fromDate, untilDate, int(branchId) if branchId and branchId != "0" else None)
+    return create_response(True, "Successfully Retrieved", distribution, None), 200
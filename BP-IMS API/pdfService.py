@@ -0,0 +1,356 @@
+from reportlab.pdfgen import canvas
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+from reportlab.lib.pagesizes import landscape, letter
+from reportlab.lib.units import inch
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib import colors
+from reportlab.lib.enums import TA_CENTER
+from reportlab.lib.utils import ImageReader
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from io import BytesIO
+import asyncio
+import os
+import time
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+FONT_PATH = os.path.join(BASE_DIR, 'DejaVuSans.ttf')
+LOGO_PATH = os.path.join(BASE_DIR, 'static', 'images', 'appstore.png')
+
+PDF_WORKERS = 2
+PDF_MAX_CONCURRENT = 4
+
+executor = None
+semaphore = None
+logo = None
+
+metrics = {
+    "waiting": 0,
+    "rendering": 0,
+    "rendered": 0,
+    "failed": 0,
+    "totalRenderMs": 0.0,
+    "maxRenderMs": 0.0,
+    "lastRenderMs": 0.0
+}
+
+def initWorker():
+    """Runs once in each worker process: parses the font and decodes the logo so renders only draw."""
+    global logo
+    pdfmetrics.registerFont(TTFont('DejaVu', FONT_PATH))
+    with open(LOGO_PATH, 'rb') as f:
+        logo = ImageReader(BytesIO(f.read()))
+
+def getExecutor():
+    global executor
+    if executor is None:
+        executor = ProcessPoolExecutor(max_workers=PDF_WORKERS, initializer=initWorker)
+    return executor
+
+def shutdown():
+    global executor
+    if executor is not None:
+        executor.shutdown(wait=False, cancel_futures=True)
+        executor = None
+
+async def render(renderer, *args):
+    """
+    Renders a PDF in the worker pool and returns its bytes. At most PDF_MAX_CONCURRENT renders
+    are handed to the pool at once; the rest wait here and show up as metrics["waiting"].
+    """
+    global executor, semaphore
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(PDF_MAX_CONCURRENT)
+
+    metrics["waiting"] += 1
+    async with semaphore:
+        metrics["waiting"] -= 1
+        metrics["rendering"] += 1
+        started = time.perf_counter()
+        try:
+            pdf = await asyncio.get_running_loop().run_in_executor(getExecutor(), renderer, *args)
+        except BrokenProcessPool:
+            executor = None
+            metrics["failed"] += 1
+            raise
+        except Exception:
+            metrics["failed"] += 1
+            raise
+        finally:
+            metrics["rendering"] -= 1
+
+    elapsed = (time.perf_counter() - started) * 1000
+    metrics["rendered"] += 1
+    metrics["totalRenderMs"] += elapsed
+    metrics["lastRenderMs"] = elapsed
+    metrics["maxRenderMs"] = max(metrics["maxRenderMs"], elapsed)
+    return pdf
+
+def getMetrics():
+    snapshot = dict(metrics)
+    snapshot["averageRenderMs"] = metrics["totalRenderMs"] / metrics["rendered"] if metrics["rendered"] else 0
+    return snapshot
+
+def renderReceipt(transaction, transaction_items):
+    buffer = BytesIO()
+
+    width = 80 * 2.83  
+    base_height = 50 
+    margin = 10
+    right_margin = width - margin
+    line_height = 12
+    calculated_height = base_height + (len(transaction_items) * line_height * 2.5)  
+    height = max(calculated_height, 180 * 2.83)
+
+    y = 410  
+    c = canvas.Canvas(buffer, pagesize=(width, height))
+
+    logo_width = 80
+    logo_height = 80
+    c.drawImage(logo, (width - logo_width) / 2, y, width=logo_width, height=logo_height, mask='auto')
+    y -= line_height + 10  
+
+    c.setFont("DejaVu", 12)
+    business_name = "Balay Panday Hardware"
+    business_name_width = c.stringWidth(business_name, "DejaVu", 12)
+    c.drawString((width - business_name_width) / 2, y, business_name)
+    y -= line_height * 2
+
+    c.setFont("DejaVu", 10)
+    if transaction['customerName']:
+        c.drawString(margin, y, f"Customer: {transaction['customerName']}")
+        y -= line_height * 1.5
+
+    transaction_date = transaction['transactionDate'] 
+    formatted_date = transaction_date.strftime('%B %d, %Y %I:%M %p')
+    c.drawString(margin, y, f"Date: {formatted_date}")
+    y -= line_height * 1.5
+
+    c.drawString(margin, y, f"Cashier: {transaction['cashier']}")
+    y -= line_height * 1.5
+
+    c.drawString(margin, y, "Mode of Payment: Cash")
+    y -= line_height * 1.5
+
+    c.drawString(margin, y, f"Number of Items: {len(transaction_items)}")
+    y -= line_height * 1.5
+
+    c.drawString(margin, y, f"Slip Number: {transaction['slipNo']}")
+    y -= line_height * 1.5
+
+    c.drawString(margin, y, f"Branch: {transaction['branch']}")
+    y -= line_height * 2
+
+    c.setDash(2, 2) 
+    c.line(margin, y, right_margin, y)
+    c.setDash()  
+    y -= 20
+
+    c.drawString(margin, y, "Store Pick-Up")
+    y -= line_height
+
+    c.setDash(2, 2)  
+    c.line(margin, y, right_margin, y)
+    c.setDash()  
+    y -= 20
+
+    c.setFont("DejaVu", 9)
+    for item in transaction_items:
+        item_name = item['name']
+        if len(item_name) > 20: 
+            item_name = item_name[:20] + '...'
+        item_quantity = item['quantity']
+        item_price = float(item['price'])
+        item_amount = float(item['amount'])
+
+        c.drawString(margin, y, item_name)
+        y -= line_height
+
+        if item['sellByUnit']:
+            quantity_display = f"{int(item_quantity)}"  
+        else:
+            quantity_display = f"{item_quantity:.2f}" 
+
+        quantity_price_line = f"     {quantity_display} X ₱ {item_price:.2f}"  
+        c.drawString(margin, y, quantity_price_line)
+
+        total_amount_text = f"₱ {item_amount:.2f}"
+        total_amount_width = c.stringWidth(total_amount_text, "DejaVu", 9)
+        c.drawString(right_margin - total_amount_width, y, total_amount_text)
+        
+        y -= line_height * 1.2 
+
+    c.setDash(2, 2) 
+    c.line(margin, y, right_margin, y)
+    c.setDash() 
+    y -= 20
+
+    c.setFont("DejaVu", 10)
+
+    subTotal_label = "Sub Total:"
+    c.drawString(margin, y, subTotal_label)
+
+    subTotal_text = f"₱ {float(transaction['subTotal']):.2f}"
+    subTotal_width = c.stringWidth(subTotal_text, "DejaVu", 10)
+    c.drawString(right_margin - subTotal_width, y, subTotal_text)
+    y -= line_height * 1.5
+
+    if transaction['deliveryFee']:
+        delivery_label = "Delivery Fee:"
+        c.drawString(margin, y, delivery_label)
+
+        delivery_text = f"₱ {float(transaction['deliveryFee']):.2f}"
+        delivery_width = c.stringWidth(delivery_text, "DejaVu", 10)
+        c.drawString(right_margin - delivery_width, y, delivery_text)
+        y -= line_height * 1.5
+
+    if transaction['discount']:
+        discount_label = "Discount:"
+        c.drawString(margin, y, discount_label)
+
+        discount_text = f"₱ {float(transaction['discount']):.2f}"
+        discount_width = c.stringWidth(discount_text, "DejaVu", 10)
+        c.drawString(right_margin - discount_width, y, discount_text)
+        y -= line_height * 1.5
+
+    c.setFont("DejaVu", 10)
+    total_label = "TOTAL:"
+    c.drawString(margin, y, total_label)
+
+    total_text = f"₱ {float(transaction['totalAmount']):.2f}"
+    total_width = c.stringWidth(total_text, "DejaVu", 10)
+    c.drawString(right_margin - total_width, y, total_text)
+    y -= line_height * 1.5
+    c.setFont("DejaVu", 10) 
+
+    cash_label = "Cash:"
+    c.drawString(margin, y, cash_label)
+
+    cash_text = f"₱ {float(transaction['amountReceived']):.2f}"
+    cash_width = c.stringWidth(cash_text, "DejaVu", 10)
+    c.drawString(right_margin - cash_width, y, cash_text)
+    y -= line_height * 1.5
+
+    change = float(transaction['amountReceived']) - float(transaction['totalAmount'])
+    change_label = "Change:"
+    c.drawString(margin, y, change_label)
+
+    change_text = f"₱ {change:.2f}"
+    change_width = c.stringWidth(change_text, "DejaVu", 10)
+    c.drawString(right_margin - change_width, y, change_text)
+    y -= line_height * 1.5
+
+
+    c.setDash(2, 2) 
+    c.line(margin, y, right_margin, y)
+    c.setDash()  
+    y -= 10
+
+    c.setFont("DejaVu", 8)
+    footer_text = "Thank you for building with us!"
+    footer_text_width = c.stringWidth(footer_text, "DejaVu", 8)
+    c.drawString((width - footer_text_width) / 2, y, footer_text)
+    y -= line_height
+
+    footer_note = "Please keep this slip for your records."
+    footer_note_width = c.stringWidth(footer_note, "DejaVu", 8)
+    c.drawString((width - footer_note_width) / 2, y, footer_note)
+    y -= line_height
+
+    official_receipt_note = "For official receipts, please visit the Receipt Counter."
+    official_receipt_note_width = c.stringWidth(official_receipt_note, "DejaVu", 8)
+    c.drawString((width - official_receipt_note_width) / 2, y, official_receipt_note)
+
+    c.showPage()
+    c.save()
+
+    return buffer.getvalue()
+
+
+def renderSalesReport(from_date_str, to_date_str, branch_name, summary, time_data, generated_at, target=None):
+    """Returns the PDF bytes, or writes straight to target and returns its path so large reports never sit in memory."""
+    buffer = target or BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=landscape(letter),
+                        rightMargin=0.5*inch, leftMargin=0.5*inch,
+                        topMargin=0.5*inch, bottomMargin=0.5*inch)
+
+    styles = getSampleStyleSheet()
+    styles.add(ParagraphStyle(name='Center', alignment=TA_CENTER))
+    styles.add(ParagraphStyle(name='Header', fontSize=12, textColor=colors.white))
+    styles.add(ParagraphStyle(name='OrangeText', textColor=colors.HexColor('#fe6500')))
+
+    elements = []
+    
+    elements.append(Paragraph("Balay Panday Hardware Sales Report", styles['Title']))
+    elements.append(Spacer(1, 0.25*inch))
+    
+    details = [
+        [f"Branch: {branch_name}"],
+        [f"Date Range: {from_date_str} to {to_date_str}"],
+        [f"Report Generated: {generated_at.strftime('%Y-%m-%d %H:%M:%S')}"]
+    ]
+    details_table = Table(details, colWidths=[doc.width])
+    details_table.setStyle(TableStyle([
+        ('FONTNAME', (0,0), (-1,-1), 'DejaVu'),
+        ('FONTSIZE', (0,0), (-1,-1), 10),
+        ('ALIGN', (0,0), (-1,-1), 'LEFT'),
+        ('TEXTCOLOR', (0,0), (-1,-1), colors.black),
+    ]))
+    elements.append(details_table)
+    elements.append(Spacer(1, 0.5*inch))
+    summary_data = [
+        ["Metric", "Amount"],
+        ["Gross Sales", f"₱{float(summary.get('gross_sales', 0)):,.2f}"],
+        ["Discounts", f"₱{float(summary.get('total_discount', 0)):,.2f}"],
+        ["Net Sales", f"₱{float(summary.get('net_sales', 0)):,.2f}"],
+        ["Item Cost", f"₱{float(summary.get('item_cost', 0)):,.2f}"],
+        ["Gross Profit", f"₱{float(summary.get('gross_profit', 0)):,.2f}"]
+    ]
+    
+    summary_table = Table(summary_data, colWidths=[doc.width/2]*2)
+    summary_table.setStyle(TableStyle([
+        ('FONTNAME', (0,0), (-1,-1), 'DejaVu'),
+        ('FONTSIZE', (0,0), (-1,-1), 10),
+        ('ALIGN', (0,0), (-1,-1), 'CENTER'),
+        ('TEXTCOLOR', (0,0), (-1,0), colors.white),
+        ('BACKGROUND', (0,0), (-1,0), colors.HexColor('#fe6500')),
+        ('TEXTCOLOR', (0,1), (-1,-1), colors.black),
+        ('GRID', (0,0), (-1,-1), 1, colors.lightgrey),
+        ('VALIGN', (0,0), (-1,-1), 'MIDDLE'),
+    ]))
+    elements.append(summary_table)
+    elements.append(Spacer(1, 0.5*inch))
+    if from_date_str == to_date_str:
+        time_header = [["Hour", "Sales Amount"]]
+        time_rows = [[
+            f"{row['hour']}:00 {'AM' if row['hour'] < 12 else 'PM'}",
+            f"₱{float(row['totalAmount']):,.2f}"
+        ] for row in time_data]
+    else:
+        time_header = [["Date", "Sales Amount"]]
+        time_rows = [[
+            datetime.strptime(str(row['date']), '%Y-%m-%d').strftime('%b %d, %Y'),
+            f"₱{float(row['totalAmount']):,.2f}"
+        ] for row in time_data]
+    
+    time_table = Table(time_header + time_rows, colWidths=[doc.width/2]*2)
+    time_table.setStyle(TableStyle([
+        ('FONTNAME', (0,0), (-1,-1), 'DejaVu'),
+        ('FONTSIZE', (0,0), (-1,-1), 10),
+        ('ALIGN', (0,0), (-1,-1), 'CENTER'),
+        ('TEXTCOLOR', (0,0), (-1,0), colors.white),
+        ('BACKGROUND', (0,0), (-1,0), colors.HexColor('#fe6500')),
+        ('TEXTCOLOR', (0,1), (-1,-1), colors.black),
+        ('GRID', (0,0), (-1,-1), 1, colors.lightgrey),
+        ('VALIGN', (0,0), (-1,-1), 'MIDDLE'),
+    ]))
+    elements.append(time_table)
+
+    elements.append(Spacer(1, 0.5*inch))
+    elements.append(Paragraph("Confidential - For Internal Use Only", styles['Center']))
+    
+    doc.build(elements)
+    return target if target else buffer.getvalue()
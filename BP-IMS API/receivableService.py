@@ -0,0 +1,197 @@
+from utils import create_response
+from tortoise import Tortoise
+from tortoise.transactions import in_transaction
+from decimal import Decimal
+from datetime import datetime, timedelta, timezone
+import reportService
+import salesRollupService
+import orderSizeService
+import customerService
+import logging
+
+logger = logging.getLogger(__name__)
+
+async def adjustBalance(customerId, delta, connection):
+    """Moves a customer's outstanding balance by delta; inserts the balance row on first use."""
+    if not customerId or not delta:
+        return
+
+    now = datetime.now(timezone.utc) + timedelta(hours=8)
+    await connection.execute_query("""
+        INSERT INTO customerbalances (customerId, outstanding, lastUpdated)
+        VALUES (%s, %s, %s)
+        ON DUPLICATE KEY UPDATE outstanding = outstanding + %s, lastUpdated = %s
+    """, [int(customerId), delta, now, delta, now])
+
+async def getReceivablesSummary():
+    """
+    Buckets unpaid credit sales by age in days. Credit sales carry no payment terms, so dueDate is
+    the sale date: "current" is 0-30 days since the sale, then 31-60, 61-90 and over 90.
+    """
+    now_sg = datetime.now(timezone.utc) + timedelta(hours=8)
+    today = now_sg.date()
+
+    agingQuery = """
+        SELECT
+            COALESCE(SUM(CASE WHEN dueDate >= %s THEN totalAmount END), 0) AS current,
+            COALESCE(SUM(CASE WHEN dueDate < %s AND dueDate >= %s THEN totalAmount END), 0) AS days31to60,
+            COALESCE(SUM(CASE WHEN dueDate < %s AND dueDate >= %s THEN totalAmount END), 0) AS days61to90,
+            COALESCE(SUM(CASE WHEN dueDate < %s THEN totalAmount END), 0) AS over90,
+            COALESCE(SUM(totalAmount), 0) AS totalOutstanding,
+            COUNT(*) AS pendingCount
+        FROM transactions
+        WHERE isExacon = 1 AND isPaid = 0 AND isVoided = 0
+    """
+    day30 = today - timedelta(days=30)
+    day60 = today - timedelta(days=60)
+    day90 = today - timedelta(days=90)
+    params = [day30, day30, day60, day60, day90, day90]
+
+    result = await Tortoise.get_connection('default').execute_query_dict(agingQuery, params)
+    aging = result[0] if result else {}
+
+    summary = {
+        "current": aging.get('current', 0),
+        "days31to60": aging.get('days31to60', 0),
+        "days61to90": aging.get('days61to90', 0),
+        "over90": aging.get('over90', 0),
+        "totalOutstanding": aging.get('totalOutstanding', 0),
+        "pendingCount": aging.get('pendingCount', 0)
+    }
+
+    return create_response(True, "Successfully Retrieved", summary, None), 200
+
+async def getCustomerBalances():
+    sqlQuery = """
+        SELECT cb.customerId, c.name, cb.outstanding, cb.lastUpdated
+        FROM customerbalances cb
+        INNER JOIN customers c ON c.id = cb.customerId
+        WHERE cb.outstanding > 0
+        ORDER BY cb.outstanding DESC
+    """
+    result = await Tortoise.get_connection('default').execute_query_dict(sqlQuery)
+
+    balances = [
+        {
+            "customerId": b['customerId'],
+            "name": b['name'],
+            "outstanding": b['outstanding'],
+            "lastUpdated": b['lastUpdated']
+        }
+        for b in result
+    ]
+
+    return create_response(True, "Successfully Retrieved", balances, None, len(balances)), 200
+
+async def settleTransactions(transactionIds, amount):
+    if not transactionIds:
+        return create_response(False, "No transactions selected", None, None), 200
+
+    amount = Decimal(str(amount))
+    placeholders = ", ".join(["%s"] * len(transactionIds))
+
+    async with in_transaction() as connection:
+        pending = await connection.execute_query_dict(f"""
+            SELECT id, customerId, totalAmount, transactionDate, branchId
+            FROM transactions
+            WHERE id IN ({placeholders}) AND isExacon = 1 AND isPaid = 0 AND isVoided = 0
+            FOR UPDATE
+        """, list(transactionIds))
+
+        if len(pending) != len(set(transactionIds)):
+            return create_response(False, "Some transactions are already paid or voided", None, None), 200
+
+        totalDue = sum(Decimal(p['totalAmount']) for p in pending)
+        if amount < totalDue:
+            return create_response(False, "Amount is less than the total due", None, None), 200
+
+        await connection.execute_query(f"""
+            UPDATE transactions SET isPaid = 1, amountReceived = totalAmount, receiptVersion = receiptVersion + 1
+            WHERE id IN ({placeholders})
+        """, list(transactionIds))
+
+        paidPerCustomer = {}
+        for p in pending:
+            if p['customerId']:
+                paidPerCustomer[p['customerId']] = paidPerCustomer.get(p['customerId'], Decimal(0)) + Decimal(p['totalAmount'])
+
+        for customerId, paid in paidPerCustomer.items():
+            await adjustBalance(customerId, -paid, connection)
+
+        for p in pending:
+            await customerService.addOrder(p['customerId'], p['transactionDate'], p['totalAmount'], connection)
+            await salesRollupService.recordSale(p['branchId'], p['transactionDate'], p['totalAmount'], connection=connection)
+            await orderSizeService.recordOrder(p['branchId'], p['transactionDate'], p['totalAmount'], connection=connection)
+
+    await reportService.reopen([(p['transactionDate'], p['branchId']) for p in pending])
+
+    settlement = {
+        "settledCount": len(pending),
+        "totalDue": totalDue,
+        "amount": amount,
+        "change": amount - totalDue
+    }
+
+    return create_response(True, "Successfully Paid", settlement, None), 200
+
+async def linkCentralCustomers(connection):
+    """
+    Central checkout used to leave customerId empty on its transactions. The only link it kept is
+    the customer's lastPurchaseDate, written with the sale's own timestamp, so sales that match
+    exactly one customer that way get that customer; older ones cannot be attributed.
+    """
+    await connection.execute_query("UPDATE transactions SET customerId = NULL WHERE customerId = ''")
+    await connection.execute_query("""
+        UPDATE transactions t
+        INNER JOIN (
+            SELECT lastPurchaseDate, MIN(id) AS customerId
+            FROM customers
+            WHERE lastPurchaseDate IS NOT NULL
+            GROUP BY lastPurchaseDate
+            HAVING COUNT(*) = 1
+        ) c ON c.lastPurchaseDate = t.transactionDate
+        SET t.customerId = c.customerId
+        WHERE t.isExacon = 1 AND t.customerId IS NULL
+    """)
+
+async def recomputeBalances(connection):
+    now = datetime.now(timezone.utc) + timedelta(hours=8)
+    await connection.execute_query("""
+        UPDATE transactions SET dueDate = DATE(transactionDate)
+        WHERE isExacon = 1 AND isPaid = 0 AND dueDate IS NULL
+    """)
+    await connection.execute_query("DELETE FROM customerbalances")
+    await connection.execute_query("""
+        INSERT INTO customerbalances (customerId, outstanding, lastUpdated)
+        SELECT customerId, SUM(totalAmount), %s
+        FROM transactions
+        WHERE isExacon = 1 AND isPaid = 0 AND isVoided = 0 AND customerId IS NOT NULL
+        GROUP BY customerId
+    """, [now])
+
+async def rebuildReceivables():
+    """Backfills due dates and customer links on credit slips and recomputes every customer balance from them."""
+    async with in_transaction() as connection:
+        await linkCentralCustomers(connection)
+        await recomputeBalances(connection)
+
+    return create_response(True, "Receivables rebuilt successfully", None, None), 200
+
+async def ensureReceivables():
+    """
+    Links central sales to their customers at startup and rebuilds the balances when they no
+    longer add up to the pending credit slips, e.g. after sales were recorded without a customer.
+    """
+    try:
+        async with in_transaction() as connection:
+            await linkCentralCustomers(connection)
+            stored = await connection.execute_query_dict("SELECT COALESCE(SUM(outstanding), 0) AS outstanding FROM customerbalances")
+            pending = await connection.execute_query_dict("""
+                SELECT COALESCE(SUM(totalAmount), 0) AS outstanding
+                FROM transactions
+                WHERE isExacon = 1 AND isPaid = 0 AND isVoided = 0 AND customerId IS NOT NULL
+            """)
+            if Decimal(stored[0]['outstanding']) != Decimal(pending[0]['outstanding']):
+                await recomputeBalances(connection)
+    except Exception:
+        logger.exception("Rebuilding receivables failed")
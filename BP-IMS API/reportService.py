@@ -0,0 +1,480 @@
+from tortoise import Tortoise
+from tortoise.exceptions import IntegrityError
+from tortoise.transactions import in_transaction
+from models import BranchClose, BranchCloseItem, BranchCloseCashier
+from utils import create_response
+from datetime import datetime, timedelta, timezone, date
+import asyncio
+import jobService
+
+CLOSING_DELAY = timedelta(minutes=10)
+SNAPSHOT_CHUNK_SIZE = 5000
+TOP_ITEMS = 10
+
+closingLock = asyncio.Lock()
+branchCloseLock = asyncio.Lock()
+
+def now_sg():
+    return datetime.now(timezone.utc) + timedelta(hours=8)
+
+def toDate(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return datetime.strptime(str(value), '%Y-%m-%d').date()
+
+def branchClause(branchId, column):
+    if branchId:
+        return f" AND {column} = %s", [branchId]
+    return "", []
+
+async def backfillLineSnapshots(jobId=None):
+    """
+    Fills unitPrice and unitCost on transaction items recorded before checkout stored them, one
+    id-range chunk per statement. The price comes from the line amount; the cost can only be the
+    item's current cost. Rows that already have a snapshot are left alone, so it is safe to repeat.
+    """
+    connection = Tortoise.get_connection('default')
+    lastId = 0
+    processed = 0
+
+    while True:
+        chunk = await connection.execute_query_dict("""
+            SELECT MAX(id) AS maxId, COUNT(*) AS total
+            FROM (SELECT id FROM transactionitems WHERE id > %s ORDER BY id LIMIT %s) ti
+        """, [lastId, SNAPSHOT_CHUNK_SIZE])
+
+        if not chunk or not chunk[0]['total']:
+            break
+
+        maxId = chunk[0]['maxId']
+        await connection.execute_query("""
+            UPDATE transactionitems ti
+            INNER JOIN items i ON i.id = ti.itemId
+            SET ti.unitPrice = COALESCE(ti.unitPrice, IF(ti.quantity <> 0, ti.amount / ti.quantity, i.price)),
+                ti.unitCost = COALESCE(ti.unitCost, i.cost)
+            WHERE ti.id > %s AND ti.id <= %s
+            AND (ti.unitPrice IS NULL OR ti.unitCost IS NULL)
+        """, [lastId, maxId])
+
+        lastId = maxId
+        processed += chunk[0]['total']
+        if jobId:
+            jobService.updateProgress(jobId, processed)
+
+    return {"processed": processed}
+
+async def startLineSnapshotBackfill():
+    jobId = jobService.startJob("backfillLineSnapshots", backfillLineSnapshots)
+    return create_response(True, "Backfill started", {"jobId": jobId}, None), 200
+
+async def closeDay(day, branchId=None):
+    """
+    Computes the stored summary of one finished day, one row per branch including days without
+    sales, and overwrites any previous row so reopened days can simply be closed again.
+    """
+    connection = Tortoise.get_connection('default')
+    start = datetime.combine(day, datetime.min.time())
+    end = start + timedelta(days=1)
+    branchFilter, branchParams = branchClause(branchId, "b.id")
+
+    await connection.execute_query(f"""
+        INSERT INTO daily_sales_summaries
+            (branchId, salesDate, grossSales, deliveryFee, totalDiscount, itemCost, transactionCount, closedAt)
+        SELECT b.id, %s,
+            COALESCE(SUM(tr.totalAmount), 0),
+            COALESCE(SUM(tr.deliveryFee), 0),
+            COALESCE(SUM(tr.discount), 0),
+            COALESCE(SUM(costs.item_cost), 0),
+            COUNT(tr.id),
+            %s
+        FROM branches b
+        LEFT JOIN transactions tr
+            ON tr.branchId = b.id AND tr.transactionDate >= %s AND tr.transactionDate < %s
+            AND tr.isVoided = 0 AND tr.isPaid = 1
+        LEFT JOIN (
+            SELECT ti.transactionId, SUM(ti.quantity * COALESCE(ti.unitCost, i.cost)) AS item_cost
+            FROM transactionitems ti
+            INNER JOIN transactions t ON t.id = ti.transactionId
+            LEFT JOIN items i ON i.id = ti.itemId
+            WHERE t.transactionDate >= %s AND t.transactionDate < %s
+            GROUP BY ti.transactionId
+        ) AS costs ON costs.transactionId = tr.id
+        WHERE 1 = 1 {branchFilter}
+        GROUP BY b.id
+        ON DUPLICATE KEY UPDATE
+            grossSales = VALUES(grossSales),
+            deliveryFee = VALUES(deliveryFee),
+            totalDiscount = VALUES(totalDiscount),
+            itemCost = VALUES(itemCost),
+            transactionCount = VALUES(transactionCount),
+            closedAt = VALUES(closedAt)
+    """, [day, now_sg(), start, end, start, end] + branchParams)
+
+async def closedUntil():
+    """The last day closed for every branch; later days have no rows yet and are left to closeDays."""
+    last = await Tortoise.get_connection('default').execute_query_dict("SELECT MAX(salesDate) AS lastDay FROM daily_sales_summaries")
+    return toDate(last[0]['lastDay']) if last and last[0]['lastDay'] else None
+
+async def closeDays():
+    """Closes every finished day that has no stored summary yet, starting after the last closed day."""
+    async with closingLock:
+        connection = Tortoise.get_connection('default')
+        yesterday = now_sg().date() - timedelta(days=1)
+
+        lastDay = await closedUntil()
+
+        if lastDay:
+            day = lastDay + timedelta(days=1)
+        else:
+            first = await connection.execute_query_dict("SELECT MIN(transactionDate) AS firstDate FROM transactions")
+            if not first or not first[0]['firstDate']:
+                return
+            day = toDate(first[0]['firstDate'])
+
+        while day <= yesterday:
+            await closeDay(day)
+            day += timedelta(days=1)
+
+async def reopen(days):
+    """
+    Recomputes closed days touched by a late change such as a void or a credit payment. Days past
+    the watermark are skipped: closing one of them for a single branch would move the watermark
+    and leave the other branches without a row for that day. Branch days that already have a
+    Z-report get it rewritten.
+    """
+    days = {(toDate(d), b) for d, b in days}
+
+    async with closingLock:
+        lastDay = await closedUntil()
+        for day, branchId in days:
+            if lastDay and day <= lastDay:
+                await closeDay(day, branchId)
+
+    async with branchCloseLock:
+        for day, branchId in days:
+            if await BranchClose.exists(branchId=branchId, salesDate=day):
+                await closeBranchDay(branchId, day, rewrite=True)
+
+def isClosable(day, now=None):
+    """A branch day can be closed once it has ended; checkout still dates evening sales 17:00 of the same day."""
+    now = now or now_sg()
+    return day < now.date()
+
+def nextClosingRun(now):
+    return datetime.combine(now.date() + timedelta(days=1), datetime.min.time(), now.tzinfo) + CLOSING_DELAY
+
+async def closeBranchDay(branchId, day, closedBy=None, rewrite=False):
+    """
+    Writes the Z-report of one branch day: totals, payment mix, voids, top items and cashier
+    totals, all from a single pass over that day's slips. Closing a day that already has one
+    returns the existing row unless rewrite is set, which replaces it after a late void or payment.
+    """
+    existing = await BranchClose.get_or_none(branchId=branchId, salesDate=day)
+    if existing and not rewrite:
+        return existing
+
+    start = datetime.combine(day, datetime.min.time())
+    end = start + timedelta(days=1)
+
+    try:
+        async with in_transaction() as connection:
+            if existing:
+                closedBy = existing.closedBy
+                await BranchCloseItem.filter(branchCloseId=existing.id).using_db(connection).delete()
+                await BranchCloseCashier.filter(branchCloseId=existing.id).using_db(connection).delete()
+                await BranchClose.filter(id=existing.id).using_db(connection).delete()
+
+            totals = await connection.execute_query_dict("""
+                SELECT
+                    COUNT(CASE WHEN tr.isVoided = 0 THEN 1 END) AS transactionCount,
+                    COALESCE(SUM(CASE WHEN tr.isVoided = 0 THEN tr.totalAmount END), 0) AS grossSales,
+                    COALESCE(SUM(CASE WHEN tr.isVoided = 0 THEN tr.deliveryFee END), 0) AS deliveryFee,
+                    COALESCE(SUM(CASE WHEN tr.isVoided = 0 THEN tr.discount END), 0) AS totalDiscount,
+                    COALESCE(SUM(CASE WHEN tr.isVoided = 0 AND tr.isExacon = 0 THEN tr.totalAmount END), 0) AS cashSales,
+                    COALESCE(SUM(CASE WHEN tr.isVoided = 0 AND tr.isExacon = 1 THEN tr.totalAmount END), 0) AS creditSales,
+                    COALESCE(SUM(CASE WHEN tr.isVoided = 0 AND tr.isPaid = 0 THEN tr.totalAmount END), 0) AS unpaidCredit,
+                    COUNT(CASE WHEN tr.isVoided = 1 THEN 1 END) AS voidCount,
+                    COALESCE(SUM(CASE WHEN tr.isVoided = 1 THEN tr.totalAmount END), 0) AS voidAmount
+                FROM transactions tr
+                WHERE tr.branchId = %s AND tr.transactionDate >= %s AND tr.transactionDate < %s
+            """, [branchId, start, end])
+
+            costs = await connection.execute_query_dict("""
+                SELECT COALESCE(SUM(ti.quantity * COALESCE(ti.unitCost, i.cost)), 0) AS itemCost
+                FROM transactionitems ti
+                INNER JOIN transactions tr ON tr.id = ti.transactionId
+                LEFT JOIN items i ON i.id = ti.itemId
+                WHERE tr.branchId = %s AND tr.transactionDate >= %s AND tr.transactionDate < %s
+                AND tr.isVoided = 0
+            """, [branchId, start, end])
+
+            branchClose = await BranchClose.create(
+                branchId=branchId,
+                salesDate=day,
+                itemCost=costs[0]['itemCost'],
+                closedBy=closedBy,
+                closedAt=now_sg(),
+                using_db=connection,
+                **totals[0]
+            )
+
+            await connection.execute_query("""
+                INSERT INTO branch_close_items (branchCloseId, itemId, name, quantity, amount)
+                SELECT %s, i.id, i.name, SUM(ti.quantity), SUM(ti.amount)
+                FROM transactionitems ti
+                INNER JOIN transactions tr ON tr.id = ti.transactionId
+                INNER JOIN items i ON i.id = ti.itemId
+                WHERE tr.branchId = %s AND tr.transactionDate >= %s AND tr.transactionDate < %s
+                AND tr.isVoided = 0
+                GROUP BY i.id, i.name
+                ORDER BY SUM(ti.amount) DESC
+                LIMIT %s
+            """, [branchClose.id, branchId, start, end, TOP_ITEMS])
+
+            await connection.execute_query("""
+                INSERT INTO branch_close_cashiers (branchCloseId, cashierId, name, transactionCount, totalAmount)
+                SELECT %s, tr.cashierId, MAX(u.name), COUNT(*), SUM(tr.totalAmount)
+                FROM transactions tr
+                LEFT JOIN users u ON u.id = tr.cashierId
+                WHERE tr.branchId = %s AND tr.transactionDate >= %s AND tr.transactionDate < %s
+                AND tr.isVoided = 0
+                GROUP BY tr.cashierId
+            """, [branchClose.id, branchId, start, end])
+    except IntegrityError:
+        return await BranchClose.get(branchId=branchId, salesDate=day)
+
+    return branchClose
+
+async def closeBranches():
+    """Closes every active branch up to the last finished day, catching up on days the scheduler missed."""
+    async with branchCloseLock:
+        connection = Tortoise.get_connection('default')
+        now = now_sg()
+        lastDay = now.date() - timedelta(days=1)
+
+        branches = await connection.execute_query_dict("""
+            SELECT b.id,
+                (SELECT MAX(salesDate) FROM branch_closes bc WHERE bc.branchId = b.id) AS lastClosed,
+                (SELECT MIN(transactionDate) FROM transactions tr WHERE tr.branchId = b.id) AS firstSale
+            FROM branches b
+            WHERE b.isActive = 1
+        """)
+
+        for branch in branches:
+            if branch['lastClosed']:
+                day = toDate(branch['lastClosed']) + timedelta(days=1)
+            elif branch['firstSale']:
+                day = toDate(branch['firstSale'])
+            else:
+                continue
+
+            while day <= lastDay:
+                await closeBranchDay(branch['id'], day)
+                day += timedelta(days=1)
+
+async def runClosing():
+    try:
+        await backfillLineSnapshots()
+    except Exception as e:
+        print(f"Backfilling line snapshots failed: {e}")
+
+    while True:
+        try:
+            await closeDays()
+        except Exception as e:
+            print(f"Closing sales days failed: {e}")
+
+        try:
+            await closeBranches()
+        except Exception as e:
+            print(f"Closing branches failed: {e}")
+
+        now = now_sg()
+        await asyncio.sleep((nextClosingRun(now) - now).total_seconds())
+
+def branchCloseData(branchClose):
+    return {
+        "id": branchClose.id,
+        "branchId": branchClose.branchId,
+        "salesDate": branchClose.salesDate,
+        "transactionCount": branchClose.transactionCount,
+        "grossSales": branchClose.grossSales,
+        "deliveryFee": branchClose.deliveryFee,
+        "totalDiscount": branchClose.totalDiscount,
+        "netSales": branchClose.grossSales - branchClose.totalDiscount,
+        "itemCost": branchClose.itemCost,
+        "grossProfit": branchClose.grossSales - branchClose.totalDiscount - branchClose.itemCost,
+        "cashSales": branchClose.cashSales,
+        "creditSales": branchClose.creditSales,
+        "unpaidCredit": branchClose.unpaidCredit,
+        "voidCount": branchClose.voidCount,
+        "voidAmount": branchClose.voidAmount,
+        "closedBy": branchClose.closedBy,
+        "closedAt": branchClose.closedAt
+    }
+
+async def closeBranch(branchId, dateStr, userId):
+    if not branchId:
+        return create_response(False, "Branch is required", None, None), 400
+
+    try:
+        day = toDate(dateStr) if dateStr else now_sg().date() - timedelta(days=1)
+    except ValueError:
+        return create_response(False, "Invalid date", None, None), 400
+
+    if not isClosable(day):
+        return create_response(False, "Branch day can only be closed after it has ended", None, None), 400
+
+    branchClose = await closeBranchDay(int(branchId), day, userId)
+    return create_response(True, "Branch day closed", branchCloseData(branchClose), None), 200
+
+async def getBranchClose(branchId, dateStr):
+    try:
+        day = toDate(dateStr)
+    except ValueError:
+        return create_response(False, "Invalid date", None, None), 400
+
+    branchClose = await BranchClose.get_or_none(branchId=branchId, salesDate=day)
+    if not branchClose:
+        return create_response(False, "Branch day is not closed", None, None), 404
+
+    items = await BranchCloseItem.filter(branchCloseId=branchClose.id).order_by('-amount').values(
+        'itemId', 'name', 'quantity', 'amount'
+    )
+    cashiers = await BranchCloseCashier.filter(branchCloseId=branchClose.id).order_by('-totalAmount').values(
+        'cashierId', 'name', 'transactionCount', 'totalAmount'
+    )
+
+    data = branchCloseData(branchClose)
+    data["topItems"] = items
+    data["cashiers"] = cashiers
+    return create_response(True, "Successfully Retrieved", data, None), 200
+
+async def getBranchCloses(branchId, fromDateStr, toDateStr):
+    try:
+        fromDate, untilDate = toDate(fromDateStr), toDate(toDateStr)
+    except ValueError:
+        return create_response(False, "Invalid date", None, None), 400
+
+    closes = BranchClose.filter(salesDate__gte=fromDate, salesDate__lte=untilDate)
+    if branchId:
+        closes = closes.filter(branchId=branchId)
+
+    data = [branchCloseData(c) for c in await closes.order_by('salesDate', 'branchId')]
+    return create_response(True, "Successfully Retrieved", data, None), 200
+
+async def liveSummary(day, branchId):
+    connection = Tortoise.get_connection('default')
+    start = datetime.combine(day, datetime.min.time())
+    end = start + timedelta(days=1)
+    branchFilter, branchParams = branchClause(branchId, "tr.branchId")
+
+    result = await connection.execute_query_dict(f"""
+        SELECT
+            COALESCE(SUM(tr.totalAmount), 0) AS grossSales,
+            COALESCE(SUM(tr.deliveryFee), 0) AS deliveryFee,
+            COALESCE(SUM(tr.discount), 0) AS totalDiscount,
+            COALESCE(SUM(costs.item_cost), 0) AS itemCost
+        FROM transactions tr
+        LEFT JOIN (
+            SELECT ti.transactionId, SUM(ti.quantity * COALESCE(ti.unitCost, i.cost)) AS item_cost
+            FROM transactionitems ti
+            INNER JOIN transactions t ON t.id = ti.transactionId
+            LEFT JOIN items i ON i.id = ti.itemId
+            WHERE t.transactionDate >= %s AND t.transactionDate < %s
+            GROUP BY ti.transactionId
+        ) AS costs ON costs.transactionId = tr.id
+        WHERE tr.transactionDate >= %s AND tr.transactionDate < %s
+        AND tr.isVoided = 0 AND tr.isPaid = 1
+        {branchFilter}
+    """, [start, end, start, end] + branchParams)
+
+    return result[0]
+
+async def getDailySales(fromDate, untilDate, branchId=None):
+    """
+    Returns per-day totals for the range: closed days come from the stored summaries, today is
+    computed live. Reads are O(days) regardless of how many transactions the range holds.
+    """
+    fromDate, untilDate = toDate(fromDate), toDate(untilDate)
+    today = now_sg().date()
+
+    if fromDate < today:
+        lastDay = await closedUntil()
+        if not lastDay or lastDay < min(untilDate, today - timedelta(days=1)):
+            await closeDays()
+
+    days = []
+    if fromDate < today:
+        branchFilter, branchParams = branchClause(branchId, "branchId")
+        days = await Tortoise.get_connection('default').execute_query_dict(f"""
+            SELECT salesDate,
+                SUM(grossSales) AS grossSales,
+                SUM(deliveryFee) AS deliveryFee,
+                SUM(totalDiscount) AS totalDiscount,
+                SUM(itemCost) AS itemCost,
+                MAX(closedAt) AS closedAt
+            FROM daily_sales_summaries
+            WHERE salesDate BETWEEN %s AND %s {branchFilter}
+            GROUP BY salesDate
+            ORDER BY salesDate
+        """, [fromDate, min(untilDate, today - timedelta(days=1))] + branchParams)
+
+    if fromDate <= today <= untilDate:
+        live = await liveSummary(today, branchId)
+        days.append(dict(live, salesDate=today, closedAt=None))
+
+    return days
+
+def summarize(days):
+    gross = sum(d['grossSales'] for d in days)
+    deliveryFee = sum(d['deliveryFee'] for d in days)
+    discount = sum(d['totalDiscount'] for d in days)
+    itemCost = sum(d['itemCost'] for d in days)
+
+    return {
+        "gross_sales": gross,
+        "deliveryFee": deliveryFee,
+        "total_discount": discount,
+        "net_sales": gross - discount,
+        "item_cost": itemCost,
+        "gross_profit": gross - discount - itemCost
+    }
+
+async def getSalesSummary(fromDate, untilDate, branchId=None):
+    days = await getDailySales(fromDate, untilDate, branchId)
+    return summarize(days), days
+
+async def getHighestSalesDay(branchId=None, fromDate=None):
+    """
+    Best sales day (summed over branches unless branchId is given) since fromDate, read from the
+    daily summaries plus today's live total instead of grouping raw slips.
+    """
+    connection = Tortoise.get_connection('default')
+    today = now_sg().date()
+    branchFilter, branchParams = branchClause(branchId, "branchId")
+    dateFilter, dateParams = (" AND salesDate >= %s", [fromDate]) if fromDate else ("", [])
+
+    best = await connection.execute_query_dict(f"""
+        SELECT salesDate, SUM(grossSales) AS grossSales
+        FROM daily_sales_summaries
+        WHERE salesDate < %s {dateFilter} {branchFilter}
+        GROUP BY salesDate
+        ORDER BY grossSales DESC
+        LIMIT 1
+    """, [today] + dateParams + branchParams)
+    best = best[0] if best and best[0]['grossSales'] else None
+
+    live = await liveSummary(today, branchId)
+    if live['grossSales'] and (not best or live['grossSales'] > best['grossSales']):
+        best = {"salesDate": today, "grossSales": live['grossSales']}
+
+    return best
+
+def closedVersion(days):
+    """Identifies the stored state of a fully closed range; None when any day is still open."""
+    if not days or any(d['closedAt'] is None for d in days):
+        return None
+    return max(d['closedAt'] for d in days).strftime('%Y%m%d%H%M%S')
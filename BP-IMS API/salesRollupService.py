@@ -0,0 +1,146 @@
+from tortoise import Tortoise
+from tortoise.transactions import in_transaction
+from utils import create_response
+from datetime import datetime, timedelta, timezone, date
+from decimal import Decimal
+import jobService
+import logging
+
+logger = logging.getLogger(__name__)
+
+def now_sg():
+    return datetime.now(timezone.utc) + timedelta(hours=8)
+
+def monthStart(value):
+    value = value.date() if isinstance(value, datetime) else value
+    return value.replace(day=1)
+
+def addMonths(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+async def recordSale(branchId, transactionDate, amount, delta=1, connection=None):
+    """
+    Adds a paid order to (delta=1) or removes it from (delta=-1) the monthly totals. Checkout,
+    credit payment and void call this next to orderSizeService.recordOrder, in the sale's own
+    database transaction.
+    """
+    connection = connection or Tortoise.get_connection('default')
+    amount = Decimal(str(amount))
+
+    await connection.execute_query("""
+        INSERT INTO monthly_sales (branchId, month, totalAmount, transactionCount)
+        VALUES (%s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE totalAmount = totalAmount + %s, transactionCount = transactionCount + %s
+    """, [branchId, monthStart(transactionDate), amount * delta, delta, amount * delta, delta])
+
+async def rebuildMonthlySales(jobId=None):
+    """
+    Brings the monthly totals back in line with transactions. The stored months and the recomputed
+    ones are read from the same snapshot and only the difference is added, so checkouts keep
+    upserting while it runs and a sale committed after the snapshot keeps its own increment.
+    """
+    async with in_transaction() as connection:
+        stored = await connection.execute_query_dict("SELECT branchId, month, totalAmount, transactionCount FROM monthly_sales")
+        actual = await connection.execute_query_dict("""
+            SELECT branchId, DATE_SUB(DATE(transactionDate), INTERVAL DAY(transactionDate) - 1 DAY) AS month, SUM(totalAmount) AS totalAmount, COUNT(*) AS transactionCount
+            FROM transactions
+            WHERE isVoided = 0 AND isPaid = 1
+            GROUP BY branchId, DATE_SUB(DATE(transactionDate), INTERVAL DAY(transactionDate) - 1 DAY)
+        """)
+
+        drift = {}
+        for rows, sign in ((actual, 1), (stored, -1)):
+            for r in rows:
+                key = (r['branchId'], monthStart(r['month']))
+                amount, count = drift.get(key, (Decimal(0), 0))
+                drift[key] = (amount + sign * Decimal(str(r['totalAmount'])), count + sign * int(r['transactionCount']))
+
+        changes = [[*key, amount, count, amount, count] for key, (amount, count) in drift.items() if amount or count]
+        if changes:
+            await connection.execute_many("""
+                INSERT INTO monthly_sales (branchId, month, totalAmount, transactionCount)
+                VALUES (%s, %s, %s, %s)
+                ON DUPLICATE KEY UPDATE totalAmount = totalAmount + %s, transactionCount = transactionCount + %s
+            """, changes)
+            await connection.execute_query("DELETE FROM monthly_sales WHERE transactionCount = 0 AND totalAmount = 0")
+
+    return {"months": len(actual), "corrected": len(changes)}
+
+async def startRebuild():
+    jobId = jobService.startJob("rebuildMonthlySales", rebuildMonthlySales)
+    return create_response(True, "Rebuild started", {"jobId": jobId}, None), 200
+
+async def ensureRollups():
+    """
+    Reconciles the monthly totals at startup when they do not count exactly the paid, unvoided
+    orders, e.g. on the first start after the table was added. A sale landing between the two
+    counts only causes a redundant pass.
+    """
+    connection = Tortoise.get_connection('default')
+    try:
+        stored = await connection.execute_query_dict("SELECT COALESCE(SUM(transactionCount), 0) AS orders FROM monthly_sales")
+        actual = await connection.execute_query_dict("SELECT COUNT(*) AS orders FROM transactions WHERE isVoided = 0 AND isPaid = 1")
+        if int(stored[0]['orders']) != int(actual[0]['orders']):
+            await rebuildMonthlySales()
+    except Exception:
+        logger.exception("Building sales rollups failed")
+
+async def getMonthlyTotals(branchId=None, fromMonth=None, untilMonth=None):
+    """Returns {month: totalAmount} for one branch or, without branchId, the whole company."""
+    sqlQuery = "SELECT month, SUM(totalAmount) AS totalAmount FROM monthly_sales WHERE 1 = 1"
+    params = []
+
+    if branchId:
+        sqlQuery += " AND branchId = %s"
+        params.append(branchId)
+
+    if fromMonth:
+        sqlQuery += " AND month >= %s"
+        params.append(fromMonth)
+
+    if untilMonth:
+        sqlQuery += " AND month <= %s"
+        params.append(untilMonth)
+
+    sqlQuery += " GROUP BY month ORDER BY month"
+    rows = await Tortoise.get_connection('default').execute_query_dict(sqlQuery, params)
+    return {monthStart(r['month']): r['totalAmount'] for r in rows}
+
+async def getAllMonths(branchId=None):
+    """Every month from the first to the last with sales, gaps filled with zero."""
+    totals = await getMonthlyTotals(branchId)
+    if not totals:
+        return []
+
+    series = []
+    month, last = min(totals), max(totals)
+    while month <= last:
+        series.append((month, totals.get(month, Decimal(0))))
+        month = addMonths(month, 1)
+    return series
+
+async def getYearMonths(year, branchId=None):
+    totals = await getMonthlyTotals(branchId, date(year, 1, 1), date(year, 12, 1))
+    return [(date(year, m, 1), totals.get(date(year, m, 1), Decimal(0))) for m in range(1, 13)]
+
+async def getMonthChange(branchId=None):
+    """Percent change of this month's sales against last month's; 0.0 when either month has no sales."""
+    current = monthStart(now_sg())
+    previous = addMonths(current, -1)
+    totals = await getMonthlyTotals(branchId, previous, current)
+
+    if not totals.get(current) or not totals.get(previous):
+        return 0.0
+    return float((totals[current] - totals[previous]) / totals[previous] * 100)
+
+async def getChangeAgainstAverage(branchId=None):
+    """Percent change of this month's sales against the average of all earlier months."""
+    current = monthStart(now_sg())
+    totals = await getMonthlyTotals(branchId, None, current)
+    earlier = [amount for month, amount in totals.items() if month < current]
+
+    if not earlier or not sum(earlier):
+        return 0.0
+    average = sum(earlier) / len(earlier)
+    return float((totals.get(current, Decimal(0)) - average) / average * 100)
@@ -2,6 +2,10 @@
 from tortoise import Tortoise
 import asyncio
 from datetime import datetime, time, timezone, timedelta
+import reportService
+import orderSizeService
+import salesRollupService
+import dashboardService
 
 async def criticalItems(websocket, branchId):
     while True:
@@ -122,15 +126,12 @@ async def totalSales(websocket, branchId):
         singapore_year = now_sg.year
         singapore_month = now_sg.month
 
-        connection = Tortoise.get_connection('default')
-
         totalSalesYearQuery = f"""
             SELECT SUM(totalAmount) AS totalSales
             FROM transactions
             WHERE YEAR(transactionDate) = {singapore_year}
             AND branchId = {branchId} AND isVoided = 0 and isPaid = 1
         """
-        totalSalesPerYear = await connection.execute_query_dict(totalSalesYearQuery)
 
         totalSalesMonthQuery = f"""
             SELECT SUM(totalAmount) AS totalSales
@@ -138,7 +139,13 @@ async def totalSales(websocket, branchId):
             WHERE YEAR(transactionDate) = {singapore_year} AND MONTH(transactionDate) = {singapore_month}
             AND branchId = {branchId} AND isVoided = 0 and isPaid = 1
         """
-        totalSalesPerMonth = await connection.execute_query_dict(totalSalesMonthQuery)
+
+        results = await dashboardService.gather("totalSales", {
+            "year": dashboardService.fetch(totalSalesYearQuery),
+            "month": dashboardService.fetch(totalSalesMonthQuery)
+        }, {"year": [], "month": []})
+        totalSalesPerYear = results["year"]
+        totalSalesPerMonth = results["month"]
 
         totalSalesYear = totalSalesPerYear[0]["totalSales"] if totalSalesPerYear and totalSalesPerYear[0]["totalSales"] else 0.0
         totalSalesMonth = totalSalesPerMonth[0]["totalSales"] if totalSalesPerMonth and totalSalesPerMonth[0]["totalSales"] else 0.0
@@ -157,8 +164,6 @@ async def dailyTransactionHQ(websocket):
         now_sg = datetime.now(timezone.utc) + timedelta(hours=8)
         singapore_date = now_sg.date()
 
-        connection = Tortoise.get_connection('default')
-
         branchTransactionQuery = f"""
             SELECT 
                 b.name AS branchName, 
@@ -173,8 +178,6 @@ async def dailyTransactionHQ(websocket):
             GROUP BY b.id;
         """
 
-        branchTransactions = await connection.execute_query_dict(branchTransactionQuery)
-
         topItemsQuery = f"""
             WITH RankedItems AS (
             SELECT 
@@ -195,7 +198,12 @@ async def dailyTransactionHQ(websocket):
         WHERE `rank` <= 5;
         """
 
-        topItems = await connection.execute_query_dict(topItemsQuery)
+        results = await dashboardService.gather("dailyTransactionHQ", {
+            "branches": dashboardService.fetch(branchTransactionQuery),
+            "topItems": dashboardService.fetch(topItemsQuery)
+        }, {"branches": [], "topItems": []})
+        branchTransactions = results["branches"]
+        topItems = results["topItems"]
 
         total_amount = sum(tr["dailyTotal"] for tr in branchTransactions)
         total_profit = sum(tr["totalProfit"] for tr in branchTransactions)
@@ -234,14 +242,11 @@ async def totalSalesHQ(websocket):
         singapore_year = now_sg.year
         singapore_month = now_sg.month
 
-        connection = Tortoise.get_connection('default')
-
         totalSalesYearQuery = f"""
             SELECT SUM(totalAmount) AS totalSales
             FROM transactions
             WHERE YEAR(transactionDate) = {singapore_year} AND isVoided = 0
         """
-        totalSalesPerYear = await connection.execute_query_dict(totalSalesYearQuery)
 
         totalSalesMonthQuery = f"""
             SELECT SUM(totalAmount) AS totalSales
@@ -249,7 +254,13 @@ async def totalSalesHQ(websocket):
             WHERE YEAR(transactionDate) = {singapore_year} 
             AND MONTH(transactionDate) = {singapore_month} AND isVoided = 0
         """
-        totalSalesPerMonth = await connection.execute_query_dict(totalSalesMonthQuery)
+
+        results = await dashboardService.gather("totalSalesHQ", {
+            "year": dashboardService.fetch(totalSalesYearQuery),
+            "month": dashboardService.fetch(totalSalesMonthQuery)
+        }, {"year": [], "month": []})
+        totalSalesPerYear = results["year"]
+        totalSalesPerMonth = results["month"]
 
         totalSalesYear = totalSalesPerYear[0]["totalSales"] if totalSalesPerYear and totalSalesPerYear[0]["totalSales"] else 0.0
         totalSalesMonth = totalSalesPerMonth[0]["totalSales"] if totalSalesPerMonth and totalSalesPerMonth[0]["totalSales"] else 0.0
@@ -292,10 +303,6 @@ async def criticalItemsHQ(websocket):
             WHERE i.storeCriticalValue >= bi.quantity AND b.isActive = 1
             AND i.isManaged = 1
         """
-        connection = Tortoise.get_connection('default')
-        result = await connection.execute_query_dict(count_query)
- 
-        bi_critical_count = result[0]['critical_count']
 
         wi_count_query = f"""
             SELECT COUNT(*) as critical_count
@@ -304,10 +311,14 @@ async def criticalItemsHQ(websocket):
             WHERE i.whCriticalValue >= bi.quantity
             AND i.isManaged = 1
         """
-        connection = Tortoise.get_connection('default')
-        result = await connection.execute_query_dict(wi_count_query)
 
-        wi_critical_count = result[0]['critical_count']
+        results = await dashboardService.gather("criticalItemsHQ", {
+            "branches": dashboardService.fetch(count_query),
+            "warehouse": dashboardService.fetch(wi_count_query)
+        }, {"branches": [], "warehouse": []})
+
+        bi_critical_count = results["branches"][0]['critical_count'] if results["branches"] else 0
+        wi_critical_count = results["warehouse"][0]['critical_count'] if results["warehouse"] else 0
         critical_count = bi_critical_count + wi_critical_count
         await websocket.send(str(critical_count)) 
 
@@ -333,7 +344,6 @@ async def criticalItemsWH(websocket):
 async def analyticsData(websocket, branch_id=1):
     while True:
         now_sg = datetime.now(timezone.utc) + timedelta(hours=8)
-        connection = Tortoise.get_connection('default')
         singapore_year = now_sg.year
         singapore_month = now_sg.month
         singapore_date = now_sg.date()
@@ -368,64 +378,29 @@ async def analyticsData(websocket, branch_id=1):
                 FROM transactions tr
                 WHERE MONTH(tr.transactionDate) = {singapore_month} AND YEAR(tr.transactionDate) = {singapore_year} AND tr.branchId = {branch_id} AND tr.IsVoided = 0
                 and tr.isPaid = 1
-            """,
-            "Year": f"""
-                SELECT 
-                    COALESCE(SUM(CASE WHEN MONTH(tr.transactionDate) = 1 THEN tr.totalAmount END), 0) AS Jan,
-                    COALESCE(SUM(CASE WHEN MONTH(tr.transactionDate) = 2 THEN tr.totalAmount END), 0) AS Feb,
-                    COALESCE(SUM(CASE WHEN MONTH(tr.transactionDate) = 3 THEN tr.totalAmount END), 0) AS Mar,
-                    COALESCE(SUM(CASE WHEN MONTH(tr.transactionDate) = 4 THEN tr.totalAmount END), 0) AS Apr,
-                    COALESCE(SUM(CASE WHEN MONTH(tr.transactionDate) = 5 THEN tr.totalAmount END), 0) AS May,
-                    COALESCE(SUM(CASE WHEN MONTH(tr.transactionDate) = 6 THEN tr.totalAmount END), 0) AS Jun,
-                    COALESCE(SUM(CASE WHEN MONTH(tr.transactionDate) = 7 THEN tr.totalAmount END), 0) AS Jul,
-                    COALESCE(SUM(CASE WHEN MONTH(tr.transactionDate) = 8 THEN tr.totalAmount END), 0) AS Aug,
-                    COALESCE(SUM(CASE WHEN MONTH(tr.transactionDate) = 9 THEN tr.totalAmount END), 0) AS Sep,
-                    COALESCE(SUM(CASE WHEN MONTH(tr.transactionDate) = 10 THEN tr.totalAmount END), 0) AS Oct,
-                    COALESCE(SUM(CASE WHEN MONTH(tr.transactionDate) = 11 THEN tr.totalAmount END), 0) AS Nov,
-                    COALESCE(SUM(CASE WHEN MONTH(tr.transactionDate) = 12 THEN tr.totalAmount END), 0) AS `Dec` 
-                FROM transactions tr
-                INNER JOIN users u ON u.id = tr.cashierId
-                WHERE YEAR(tr.transactionDate) = {singapore_year} 
-                AND tr.branchId = {branch_id} AND tr.isVoided = 0 and tr.isPaid = 1
-            """,
-            "All": f"""
-                WITH RECURSIVE MonthSeries AS (
-                    SELECT DATE_FORMAT(MIN(transactionDate), '%Y-%m-01') AS monthStart 
-                    FROM transactions 
-                    WHERE branchId = {branch_id}
-                    UNION ALL
-                    SELECT DATE_ADD(monthStart, INTERVAL 1 MONTH) 
-                    FROM MonthSeries
-                    WHERE monthStart < (SELECT DATE_FORMAT(MAX(transactionDate), '%Y-%m-01') FROM transactions WHERE branchId = {branch_id})
-                )
-                SELECT 
-                    DATE_FORMAT(ms.monthStart, '%b %Y') AS YearMonth,
-                    COALESCE(SUM(tr.totalAmount), 0) AS TotalAmount
-                FROM MonthSeries ms
-                LEFT JOIN transactions tr 
-                    ON DATE_FORMAT(tr.transactionDate, '%Y-%m') = DATE_FORMAT(ms.monthStart, '%Y-%m')
-                    AND tr.branchId = {branch_id} AND tr.isVoided = 0 and tr.isPaid = 1
-                GROUP BY ms.monthStart, YearMonth  
-                ORDER BY ms.monthStart;
             """
         }
         
+        steps = {filter_type: dashboardService.fetch(query) for filter_type, query in queries.items()}
+        steps["Year"] = lambda: salesRollupService.getYearMonths(singapore_year, branch_id)
+        steps["All"] = lambda: salesRollupService.getAllMonths(branch_id)
+        results = await dashboardService.gather("analyticsData", steps, {name: [] for name in steps})
+
         sales_data = {}
-        for filter_type, query in queries.items():
-            result = await connection.execute_query_dict(query)
-            if filter_type == "All":
-                sales_data["All"] = [
-                    {
-                        "label": row["YearMonth"],
-                        "value": float(row["TotalAmount"]) if row["TotalAmount"] is not None else 0.0,  
-                        "dataPointText": f"₱{float(row['TotalAmount'] or 0):,.2f}"  
-                    }
-                    for row in result
-                ]
-            else:
-                sales_data[filter_type] = [
-                    {"label": k.replace('_', ' '), "value": float(v), "dataPointText": f"₱{float(v):,.2f}" } for row in result for k, v in row.items()
-                ]
+        for filter_type in queries:
+            sales_data[filter_type] = [
+                {"label": k.replace('_', ' '), "value": float(v), "dataPointText": f"₱{float(v):,.2f}" } for row in results[filter_type] for k, v in row.items()
+            ]
+
+        sales_data["Year"] = [
+            {"label": month.strftime('%b'), "value": float(amount), "dataPointText": f"₱{float(amount):,.2f}"}
+            for month, amount in results["Year"]
+        ]
+
+        sales_data["All"] = [
+            {"label": month.strftime('%b %Y'), "value": float(amount), "dataPointText": f"₱{float(amount):,.2f}"}
+            for month, amount in results["All"]
+        ]
         
         await websocket.send_json(sales_data)
         await asyncio.sleep(1)
@@ -433,103 +408,7 @@ async def analyticsData(websocket, branch_id=1):
 async def analysisReport(websocket, branchId):
     while True:
         now_sg = datetime.now(timezone.utc) + timedelta(hours=8)
-        connection = Tortoise.get_connection('default')
-        singapore_year = now_sg.year
-        singapore_month = now_sg.month
-
-        percentQuery = f"""
-            SELECT 
-                CASE 
-                    WHEN SUM(CASE WHEN MONTH(transactionDate) = {singapore_month} 
-                                AND YEAR(transactionDate) = {singapore_year} 
-                            THEN totalAmount END) IS NOT NULL
-                        AND SUM(CASE WHEN MONTH(transactionDate) = {singapore_month} - 1 
-                                    AND YEAR(transactionDate) = {singapore_year} 
-                                THEN totalAmount END) IS NOT NULL
-                    THEN 
-                        CAST(
-                            (
-                                (
-                                    SUM(CASE WHEN MONTH(transactionDate) = {singapore_month} 
-                                            AND YEAR(transactionDate) = {singapore_year} 
-                                        THEN totalAmount END) 
-                                    - 
-                                    SUM(CASE WHEN MONTH(transactionDate) = {singapore_month} - 1 
-                                            AND YEAR(transactionDate) = {singapore_year} 
-                                        THEN totalAmount END)
-                                )
-                                / 
-                                SUM(CASE WHEN MONTH(transactionDate) = {singapore_month} - 1 
-                                        AND YEAR(transactionDate) = {singapore_year} 
-                                    THEN totalAmount END)
-                            ) * 100 AS DOUBLE
-                        )
-                    ELSE 0.0 
-                END AS percentageChange
-            FROM transactions
-            INNER JOIN branches b ON b.Id = transactions.branchId
-            WHERE b.id = {branchId} AND transactions.isVoided = 0 and transactions.isPaid = 1
-        """
-
-        percentage = await connection.execute_query_dict(percentQuery)
-
-        highestSalesQuery = """
-            SELECT 
-                transactionDate AS highestSalesDate, 
-                SUM(totalAmount) AS highestSalesAmount
-            FROM transactions
-            INNER JOIN branches b ON b.Id = transactions.branchId
-            WHERE b.id = %s
-            GROUP BY transactionDate
-            ORDER BY highestSalesAmount DESC
-            LIMIT 1
-        """
-        highestSales = await connection.execute_query_dict(highestSalesQuery, [branchId])
-
-        highestSalesCurMonth = f"""
-            SELECT 
-                transactionDate AS highestSalesDate, 
-                SUM(totalAmount) AS highestSalesAmount
-            FROM transactions
-            INNER JOIN branches b ON b.Id = transactions.branchId
-            WHERE b.id = {branchId}
-            AND MONTH(transactionDate) = {singapore_month} 
-            AND YEAR(transactionDate) = {singapore_year}
-            GROUP BY transactionDate
-            ORDER BY highestSalesAmount DESC
-            LIMIT 1;
-        """
-        highestSalesMonth = await connection.execute_query_dict(highestSalesCurMonth)
-
-        highSmallQuery = f"""
-            SELECT 
-                COUNT(CASE WHEN totalAmount < 1500 THEN 1 END) AS smallOrderCount,
-                COUNT(CASE WHEN totalAmount > 1500 THEN 1 END) AS highOrderCount,
-                CASE 
-                    WHEN COUNT(*) = 0 
-                    THEN NULL 
-                    ELSE 
-                        CONCAT(
-                            ROUND(
-                                COUNT(CASE WHEN totalAmount < 1500 THEN 1 END) * 100.0 / COUNT(*), 2
-                            ), '%'
-                        ) 
-                END AS smallOrderPercentage,
-                CASE 
-                    WHEN COUNT(*) = 0 
-                    THEN NULL 
-                    ELSE 
-                        CONCAT(
-                            ROUND(
-                                COUNT(CASE WHEN totalAmount > 1500 THEN 1 END) * 100.0 / COUNT(*), 2
-                            ), '%'
-                        ) 
-                END AS highOrderPercentage
-            FROM transactions
-            INNER JOIN branches b ON b.Id = transactions.branchId
-            WHERE b.id = {branchId} AND transactions.isVoided = 0 and transactions.isPaid = 1
-        """
-        highSmallValue = await connection.execute_query_dict(highSmallQuery)
+        monthStart = now_sg.date().replace(day=1)
 
         peakQuery = """
             SELECT 
@@ -548,16 +427,29 @@ async def analysisReport(websocket, branchId):
             ORDER BY transactionCount DESC
             LIMIT 1
         """
-        peakValue = await connection.execute_query_dict(peakQuery, [branchId])
+
+        results = await dashboardService.gather("analysisReport", {
+            "percentChange": lambda: salesRollupService.getMonthChange(int(branchId)),
+            "highestSales": lambda: reportService.getHighestSalesDay(int(branchId)),
+            "highestSalesMonth": lambda: reportService.getHighestSalesDay(int(branchId), monthStart),
+            "orderSizes": lambda: orderSizeService.getDistribution(branchId=int(branchId)),
+            "peak": dashboardService.fetch(peakQuery, [branchId])
+        }, {"percentChange": 0.0, "peak": []})
+
+        percentage = results["percentChange"]
+        highestSales = results["highestSales"]
+        highestSalesMonth = results["highestSalesMonth"]
+        highSmallValue = results["orderSizes"] or {}
+        peakValue = results["peak"]
 
         response = {
-            "percentChange": percentage[0]['percentageChange'] if percentage else 0.0,
-            "highestSalesDate": highestSales[0]['highestSalesDate'] if highestSales else None,
-            "highestSalesAmount": highestSales[0]['highestSalesAmount'] if highestSales else None,
-            "highestSalesMonthDate": highestSalesMonth[0]['highestSalesDate'] if highestSalesMonth else None,
-            "highestSalesMonthAmount": highestSalesMonth[0]['highestSalesAmount'] if highestSalesMonth else None,
-            "smallOrderPercentage": highSmallValue[0]['smallOrderPercentage'] if highSmallValue else None,
-            "highOrderPercentage": highSmallValue[0]['highOrderPercentage'] if highSmallValue else None,
+            "percentChange": percentage,
+            "highestSalesDate": highestSales['salesDate'] if highestSales else None,
+            "highestSalesAmount": highestSales['grossSales'] if highestSales else None,
+            "highestSalesMonthDate": highestSalesMonth['salesDate'] if highestSalesMonth else None,
+            "highestSalesMonthAmount": highestSalesMonth['grossSales'] if highestSalesMonth else None,
+            "smallOrderPercentage": highSmallValue.get('smallOrderPercentage'),
+            "highOrderPercentage": highSmallValue.get('highOrderPercentage'),
             "peakPeriod": peakValue[0]['peakPeriod'] if peakValue else None,
         }
 
@@ -643,116 +535,7 @@ async def analyticsDataHQ(websocket, from_date_str, to_date_str, branch_id):
 async def analysisReportHQ(websocket):
     while True:
         now_sg = datetime.now(timezone.utc) + timedelta(hours=8)
-        connection = Tortoise.get_connection('default')
-        singapore_year = now_sg.year
-        singapore_month = now_sg.month
-
-        percentQuery = f"""
-            SELECT 
-                CASE 
-                    WHEN 
-                        COUNT(DISTINCT CASE 
-                            WHEN MONTH(transactionDate) <> {singapore_month} 
-                            AND YEAR(transactionDate) <> {singapore_year} 
-                            THEN DATE_FORMAT(transactionDate, '%Y-%m') 
-                        END) > 0
-                        AND 
-                        SUM(CASE 
-                            WHEN MONTH(transactionDate) <> {singapore_month} 
-                            AND YEAR(transactionDate) <> {singapore_year} 
-                            THEN totalAmount 
-                        END) > 0 
-                    THEN 
-                        CAST((( 
-                            SUM(CASE 
-                                WHEN MONTH(transactionDate) = {singapore_month} 
-                                AND YEAR(transactionDate) = {singapore_year} 
-                                THEN totalAmount 
-                            END) - 
-                            (SUM(CASE 
-                                WHEN MONTH(transactionDate) <> {singapore_month} 
-                                AND YEAR(transactionDate) <> {singapore_year} 
-                                THEN totalAmount 
-                            END) / 
-                            COUNT(DISTINCT CASE 
-                                WHEN MONTH(transactionDate) <> {singapore_month} 
-                                AND YEAR(transactionDate) <> {singapore_year} 
-                                THEN DATE_FORMAT(transactionDate, '%Y-%m') 
-                            END))
-                        ) 
-                        / 
-                        (SUM(CASE 
-                            WHEN MONTH(transactionDate) <> {singapore_month} 
-                            AND YEAR(transactionDate) <> {singapore_year} 
-                            THEN totalAmount 
-                        END) / 
-                        COUNT(DISTINCT CASE 
-                            WHEN MONTH(transactionDate) <> {singapore_month} 
-                            AND YEAR(transactionDate) <> {singapore_year} 
-                            THEN DATE_FORMAT(transactionDate, '%Y-%m') 
-                        END))
-                    ) * 100 AS DOUBLE)
-                    ELSE 0.0 
-                END AS percentageChange
-            FROM transactions
-            WHERE isVoided = 0 and isPaid = 1
-        """
-
-        percentage = await connection.execute_query_dict(percentQuery)
-
-        highestSalesQuery = """
-            SELECT 
-                transactionDate AS highestSalesDate, 
-                SUM(totalAmount) AS highestSalesAmount
-            FROM transactions
-            GROUP BY transactionDate
-            ORDER BY highestSalesAmount DESC
-            LIMIT 1
-        """
-        highestSales = await connection.execute_query_dict(highestSalesQuery)
-
-        highestSalesCurMonth = f"""
-            SELECT 
-                transactionDate AS highestSalesDate, 
-                SUM(totalAmount) AS highestSalesAmount
-            FROM transactions
-            WHERE MONTH(transactionDate) = {singapore_month} 
-            AND YEAR(transactionDate) = {singapore_year}
-            AND isVoided = 0
-            GROUP BY transactionDate
-            ORDER BY highestSalesAmount DESC
-            LIMIT 1;
-        """
-        highestSalesMonth = await connection.execute_query_dict(highestSalesCurMonth)
-
-        highSmallQuery = f"""
-            SELECT 
-                COUNT(CASE WHEN totalAmount < 1500 THEN 1 END) AS smallOrderCount,
-                COUNT(CASE WHEN totalAmount > 1500 THEN 1 END) AS highOrderCount,
-                CASE 
-                    WHEN COUNT(*) = 0 
-                    THEN NULL 
-                    ELSE 
-                        CONCAT(
-                            ROUND(
-                                COUNT(CASE WHEN totalAmount < 1500 THEN 1 END) * 100.0 / COUNT(*), 2
-                            ), '%'
-                        ) 
-                END AS smallOrderPercentage,
-                CASE 
-                    WHEN COUNT(*) = 0 
-                    THEN NULL 
-                    ELSE 
-                        CONCAT(
-                            ROUND(
-                                COUNT(CASE WHEN totalAmount > 1500 THEN 1 END) * 100.0 / COUNT(*), 2
-                            ), '%'
-                        ) 
-                END AS highOrderPercentage
-            FROM transactions
-            WHERE isVoided = 0 and isPaid = 1
-        """
-        highSmallValue = await connection.execute_query_dict(highSmallQuery)
+        monthStart = now_sg.date().replace(day=1)
 
         peakQuery = """
             SELECT 
@@ -770,16 +553,29 @@ async def analysisReportHQ(websocket):
             ORDER BY transactionCount DESC
             LIMIT 1
         """
-        peakValue = await connection.execute_query_dict(peakQuery)
+
+        results = await dashboardService.gather("analysisReportHQ", {
+            "percentChange": salesRollupService.getChangeAgainstAverage,
+            "highestSales": reportService.getHighestSalesDay,
+            "highestSalesMonth": lambda: reportService.getHighestSalesDay(None, monthStart),
+            "orderSizes": orderSizeService.getDistribution,
+            "peak": dashboardService.fetch(peakQuery)
+        }, {"percentChange": 0.0, "peak": []})
+
+        percentage = results["percentChange"]
+        highestSales = results["highestSales"]
+        highestSalesMonth = results["highestSalesMonth"]
+        highSmallValue = results["orderSizes"] or {}
+        peakValue = results["peak"]
 
         response = {
-            "percentChange": percentage[0]['percentageChange'] if percentage else 0.0,
-            "highestSalesDate": highestSales[0]['highestSalesDate'] if highestSales else None,
-            "highestSalesAmount": highestSales[0]['highestSalesAmount'] if highestSales else None,
-            "highestSalesMonthDate": highestSalesMonth[0]['highestSalesDate'] if highestSalesMonth else None,
-            "highestSalesMonthAmount": highestSalesMonth[0]['highestSalesAmount'] if highestSalesMonth else None,
-            "smallOrderPercentage": highSmallValue[0]['smallOrderPercentage'] if highSmallValue else None,
-            "highOrderPercentage": highSmallValue[0]['highOrderPercentage'] if highSmallValue else None,
+            "percentChange": percentage,
+            "highestSalesDate": highestSales['salesDate'] if highestSales else None,
+            "highestSalesAmount": highestSales['grossSales'] if highestSales else None,
+            "highestSalesMonthDate": highestSalesMonth['salesDate'] if highestSalesMonth else None,
+            "highestSalesMonthAmount": highestSalesMonth['grossSales'] if highestSalesMonth else None,
+            "smallOrderPercentage": highSmallValue.get('smallOrderPercentage'),
+            "highOrderPercentage": highSmallValue.get('highOrderPercentage'),
             "peakPeriod": peakValue[0]['peakPeriod'] if peakValue else None,
         }
 
@@ -865,15 +661,12 @@ async def totalCentralSales(websocket):
         singapore_year = now_sg.year
         singapore_month = now_sg.month
 
-        connection = Tortoise.get_connection('default')
-
         totalSalesYearQuery = f"""
             SELECT SUM(totalAmount) AS totalSales
             FROM transactions
             WHERE YEAR(transactionDate) = {singapore_year}
             AND isVoided = 0 AND isExacon = 1 and isPaid = 1
         """
-        totalSalesPerYear = await connection.execute_query_dict(totalSalesYearQuery)
 
         totalSalesMonthQuery = f"""
             SELECT SUM(totalAmount) AS totalSales
@@ -882,7 +675,13 @@ async def totalCentralSales(websocket):
             AND MONTH(transactionDate) = {singapore_month}
             AND isVoided = 0 AND isExacon = 1 and isPaid = 1
         """
-        totalSalesPerMonth = await connection.execute_query_dict(totalSalesMonthQuery)
+
+        results = await dashboardService.gather("totalCentralSales", {
+            "year": dashboardService.fetch(totalSalesYearQuery),
+            "month": dashboardService.fetch(totalSalesMonthQuery)
+        }, {"year": [], "month": []})
+        totalSalesPerYear = results["year"]
+        totalSalesPerMonth = results["month"]
 
         totalSalesYear = totalSalesPerYear[0]["totalSales"] if totalSalesPerYear and totalSalesPerYear[0]["totalSales"] else 0.0
         totalSalesMonth = totalSalesPerMonth[0]["totalSales"] if totalSalesPerMonth and totalSalesPerMonth[0]["totalSales"] else 0.0
@@ -975,7 +774,6 @@ async def analyticsSalesDataHQ(websocket, from_date_str, to_date_str, branch_id)
 async def analyticsGrossSalesDataHQ(websocket, from_date_str, to_date_str, branch_id):
     while True:
         now_sg = datetime.now(timezone.utc) + timedelta(hours=8)
-        connection = Tortoise.get_connection('default')
 
         try:
             from_date = datetime.strptime(from_date_str, '%Y-%m-%d').date() if from_date_str else now_sg.date()
@@ -984,34 +782,7 @@ async def analyticsGrossSalesDataHQ(websocket, from_date_str, to_date_str, branc
             from_date = now_sg.date()
             to_date = now_sg.date()
 
-        branch_filter = f"AND tr.branchId = {branch_id}" if branch_id != "0" else ""
-
-        query = f"""
-                SELECT 
-                    COALESCE(SUM(tr.totalAmount), 0) AS gross_sales,
-                    COALESCE(SUM(tr.deliveryFee), 0) AS deliveryFee,
-                    COALESCE(SUM(tr.discount), 0) AS total_discount,
-                    COALESCE(SUM(tr.totalAmount), 0) - COALESCE(SUM(tr.discount), 0) AS net_sales,
-                    COALESCE(SUM(costs.item_cost), 0) AS item_cost,
-                    (COALESCE(SUM(tr.totalAmount), 0) - COALESCE(SUM(tr.discount), 0)) - COALESCE(SUM(costs.item_cost), 0) AS gross_profit
-                FROM transactions tr
-                LEFT JOIN (
-                    SELECT 
-                        ti.transactionId,
-                        SUM(ti.quantity * i.cost) AS item_cost
-                    FROM transactionitems ti
-                    JOIN items i ON ti.itemId = i.id
-                    GROUP BY ti.transactionId
-                ) AS costs ON tr.id = costs.transactionId
-                WHERE DATE(tr.transactionDate) BETWEEN '{from_date}' AND '{to_date}'
-                AND tr.isVoided = 0
-                AND tr.isPaid = 1
-              {branch_filter}
-        """
-
-        result = await connection.execute_query_dict(query)
-
-        summary = result[0] if result else {}
+        summary, _ = await reportService.getSalesSummary(from_date, to_date, int(branch_id) if branch_id != "0" else None)
 
         response = {
             "grossSales": float(summary.get("gross_sales", 0)),
@@ -1,32 +1,38 @@
-from models import BranchTransferHistory, BranchItem, BranchReturn, WareHouseItem
-from utils import create_response
-from tortoise import Tortoise
+from models import BranchTransferHistory, BranchItem, BranchReturn
+from utils import create_response, query_history
+from tortoise.transactions import in_transaction
 from decimal import Decimal
 from datetime import datetime
+import inventoryService
 
 async def saveBranchTransfer(branchTransfer):
     branchItemFrom = await BranchItem.get_or_none(id=branchTransfer['branchFromId'])
-    branchItemTo = await BranchItem.get_or_none(branchId=branchTransfer['branchToId'], itemId = branchItemFrom.itemId)
+    branchItemTo = await BranchItem.get_or_none(branchId=branchTransfer['branchToId'], itemId = branchItemFrom.itemId) if branchItemFrom else None
 
     if not branchItemTo or not branchItemFrom:
         return create_response(False, "Invalid branch ID", None, None), 400
 
-    await BranchTransferHistory.create(
-        branchFromId=branchItemFrom.id,
-        branchToId=branchItemTo.id,
-        quantity=branchTransfer['quantity'],
-        date=datetime.now() 
-    )
-
-    branchItemTo.quantity += Decimal(branchTransfer['quantity'])
-    branchItemFrom.quantity -= Decimal(branchTransfer['quantity'])
-
-    await branchItemTo.save()
-    await branchItemFrom.save()
+    quantity = Decimal(str(branchTransfer['quantity']))
+
+    try:
+        async with in_transaction() as connection:
+            transfer = await BranchTransferHistory.create(
+                branchFromId=branchItemFrom.id,
+                branchToId=branchItemTo.id,
+                quantity=quantity,
+                date=datetime.now(),
+                using_db=connection
+            )
+            await inventoryService.adjustStock([
+                inventoryService.branchMovement(branchItemFrom, -quantity, 'transfer', transfer.id),
+                inventoryService.branchMovement(branchItemTo, quantity, 'transfer', transfer.id)
+            ], connection, guard=True)
+    except inventoryService.StockAdjustmentError as e:
+        return create_response(False, str(e), None, None), 200
 
     return create_response(True, "Success", None, None), 200
 
-async def getBranchTransferHistory(branchItemId):
+async def getBranchTransferHistory(branchItemId, fromDate=None, toDate=None, cursor=None, pageSize=None, includeCount=True):
 
     sqlQuery = """
            SELECT bh.id, bh.quantity, bh.date, bh.branchFromId, bh.branchToId, br1.Name as branchFrom, br2.Name as branchTo
@@ -35,14 +41,13 @@ async def getBranchTransferHistory(branchItemId):
            INNER JOIN branchitem b2 on b2.Id = bh.branchToId
            INNER JOIN branches br1 on br1.Id = b1.branchId
            INNER JOIN branches br2 on br2.Id = b2.branchId
-           WHERE bh.branchFromId = %s OR bh.branchToId = %s
+           WHERE (bh.branchFromId = %s OR bh.branchToId = %s)
         """
     params = [branchItemId, branchItemId]
 
-    connection = Tortoise.get_connection('default')
-    result = await connection.execute_query(sqlQuery, tuple(params))
-
-    history = result[1]
+    history, nextCursor, totalCount = await query_history(
+        sqlQuery, params, 'bh.date', 'bh.id', fromDate, toDate, cursor, pageSize, includeCount
+    )
 
     historyList = [
         {
@@ -57,49 +62,45 @@ async def getBranchTransferHistory(branchItemId):
         for h in history
     ]
 
-    return create_response(True, "Success", historyList, None), 200
+    return create_response(True, "Success", historyList, nextCursor, totalCount), 200
 
 async def returnToWH(returnStock):
-    branchItemId = await BranchItem.get_or_none(id=returnStock['branchItemId'])
-    whItem = await WareHouseItem.get_or_none(itemId = branchItemId.itemId)
-
-    if not branchItemId:
-        return create_response(False, 'Item not found', None, None), 200
+    branchItem = await BranchItem.get_or_none(id=returnStock['branchItemId'])
 
-    if not whItem:
+    if not branchItem:
         return create_response(False, 'Item not found', None, None), 200
 
-    await BranchReturn.create(
-        branchItemId=returnStock['branchItemId'],
-        reason=returnStock['reason'],
-        quantity=Decimal(str(returnStock['quantity'])),
-        date=datetime.now()
-    )
-
-    branchItemId.quantity -= Decimal(str(returnStock['quantity']))
-    whItem.quantity += Decimal(str(returnStock['quantity']))
-    await branchItemId.save()
-    await whItem.save()
+    quantity = Decimal(str(returnStock['quantity']))
+
+    try:
+        async with in_transaction() as connection:
+            branchReturn = await BranchReturn.create(
+                branchItemId=returnStock['branchItemId'],
+                reason=returnStock['reason'],
+                quantity=quantity,
+                date=datetime.now(),
+                using_db=connection
+            )
+            await inventoryService.adjustStock([
+                inventoryService.branchMovement(branchItem, -quantity, 'return_to_wh', branchReturn.id),
+                inventoryService.movement(inventoryService.WAREHOUSE, inventoryService.WAREHOUSE_LOCATION_ID, branchItem.itemId, quantity, 'return_to_wh', branchReturn.id)
+            ], connection, guard=True)
+    except inventoryService.StockAdjustmentError as e:
+        return create_response(False, str(e), None, None), 200
 
     return create_response(True, "Success", None, None), 200
 
-async def getBranchReturnHistory(branchItemId):
+async def getBranchReturnHistory(branchItemId, fromDate=None, toDate=None, cursor=None, pageSize=None, includeCount=True):
     sqlQuery = """
         SELECT br.id, br.branchItemId, br.reason, br.quantity, br.date
         FROM branchreturn br
         WHERE br.branchItemId = %s
-        ORDER BY br.id
     """
     params = [branchItemId]
 
-    connection = Tortoise.get_connection('default')
-    result = await connection.execute_query(sqlQuery, tuple(params))
-
-    countQuery = "SELECT COUNT(*) FROM branchreturn WHERE branchItemId = %s"
-    totalCountResult = await connection.execute_query(countQuery, (branchItemId,))
-    totalCount = totalCountResult[1][0]['COUNT(*)']
-
-    items = result[1]
+    items, nextCursor, totalCount = await query_history(
+        sqlQuery, params, 'br.date', 'br.id', fromDate, toDate, cursor, pageSize, includeCount
+    )
 
     itemList = [
         {
@@ -112,4 +113,4 @@ async def getBranchReturnHistory(branchItemId):
         for item in items
     ]
 
-    return create_response(True, 'Return to Warehouse History Retrieved Successfully', itemList, None, totalCount), 200
+    return create_response(True, 'Return to Warehouse History Retrieved Successfully', itemList, nextCursor, totalCount), 200
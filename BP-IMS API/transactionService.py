@@ -1,10 +1,17 @@
-from models import Item, Cart, CartItems, Transaction, TransactionItem,User, Branch, Customer, BranchItem, LoyaltyStages, ItemReward,LoyaltyCustomer
+from models import Item, Cart, CartItems, Transaction, TransactionItem,User, Branch, Customer, BranchItem
 from utils import create_response
 from datetime import datetime, time, timedelta, timezone
 from decimal import Decimal
 from tortoise import Tortoise
+from tortoise.expressions import F
 import pytz
-import customerService
+import inventoryService
+import receivableService
+import loyaltyService
+import fileService
+import reportService
+import salesRollupService
+import orderSizeService
 from tortoise.transactions import in_transaction
 
 sgt = pytz.timezone('Asia/Singapore')
@@ -275,95 +282,80 @@ async def processPayment(cartId, cart, cartItems, subTotal, totalAmount, amountR
     slip_no = await generate_slip_no(branch.id)
     total_cogs = 0
     transactionItems = []
+    movements = []
 
     now = datetime.now(timezone.utc) + timedelta(hours=8)
     adjusted_time = adjust_transaction_time(now)
 
-    transaction = await Transaction.create(
-        amountReceived=amountReceived,
-        totalAmount=totalAmount,
-        cashierId=mainCart.userId,
-        slipNo=slip_no,
-        transactionDate=adjusted_time,
-        customerId=cart.get("customerId"),
-        branchId=user.branchId,
-        profit=0, 
-        discount=cart.get("discount") or 0,
-        deliveryFee=cart.get("deliveryFee") or 0
-    )
-
-    for cItem in cartItems:
-        branchItem = await BranchItem.get_or_none(id=cItem["branchItemId"])
-        item = await Item.get_or_none(id=branchItem.itemId)
-
-        if not branchItem or not item:
-            continue
-
-        branchItem.quantity -= Decimal(cItem["quantity"])
-        await branchItem.save()
-
-        itemAmount = item.price * Decimal(cItem["quantity"])
-        total_cogs += item.cost * Decimal(cItem["quantity"])
-
-        tItem = await TransactionItem.create(
-            transactionId=transaction.id,
-            itemId=item.id,
-            quantity=Decimal(cItem["quantity"]),
-            amount=itemAmount,
-            isVoided=False
+    async with in_transaction() as connection:
+        transaction = await Transaction.create(
+            amountReceived=amountReceived,
+            totalAmount=totalAmount,
+            cashierId=mainCart.userId,
+            slipNo=slip_no,
+            transactionDate=adjusted_time,
+            customerId=cart.get("customerId"),
+            branchId=user.branchId,
+            profit=0, 
+            discount=cart.get("discount") or 0,
+            deliveryFee=cart.get("deliveryFee") or 0,
+            using_db=connection
         )
 
-        transactionItems.append({
-            "id": tItem.id,
-            "itemId": item.id,
-            "name": item.name,
-            "price": item.price,
-            "quantity": tItem.quantity,
-            "amount": tItem.amount,
-            "sellByUnit": item.sellByUnit
-        })
+        for cItem in cartItems:
+            branchItem = await BranchItem.select_for_update().using_db(connection).get_or_none(id=cItem["branchItemId"])
+            item = await Item.get_or_none(id=branchItem.itemId, using_db=connection) if branchItem else None
 
-    transaction.profit = Decimal(totalAmount) - total_cogs
-    await transaction.save()
+            if not branchItem or not item:
+                continue
 
-    loyaltyItem = {}
-    if totalAmount >= 3000 and customer:
-        loyaltyItem["newProgress"] = True
-        customerStages = await LoyaltyCustomer.filter(customerId=customer.id)
-        if customerStages:
-            done = await customerService.markNextStageDone(customer.id)
-        else:
-            await customerService.saveLoyaltyCustomer(customer.id)
+            branchItem.quantity -= Decimal(cItem["quantity"])
+            await branchItem.save(using_db=connection)
+            movements.append(inventoryService.branchMovement(branchItem, -Decimal(cItem["quantity"]), 'sale', transaction.id))
 
-        customer.isLoyalty = True
+            itemAmount = item.price * Decimal(cItem["quantity"])
+            total_cogs += item.cost * Decimal(cItem["quantity"])
 
-        query = """
-            SELECT ls.orderId, ls.itemRewardId, lc.id as lcId
-            FROM loyaltycustomers lc
-            JOIN loyaltystages ls ON lc.stageId = ls.id
-            WHERE lc.customerId = %s AND lc.isDone = TRUE
-            ORDER BY ls.orderId DESC
-            LIMIT 1
-        """
-        latest_stage = await Tortoise.get_connection("default").execute_query_dict(query, [customer.id])
-        if latest_stage:
-            latest_stage = latest_stage[0]
-            loyaltyItem.update({
-                "currentStage": latest_stage["orderId"],
-                "id": latest_stage["lcId"],
-                "completeLoyalty": done
+            tItem = await TransactionItem.create(
+                transactionId=transaction.id,
+                itemId=item.id,
+                quantity=Decimal(cItem["quantity"]),
+                amount=itemAmount,
+                unitPrice=item.price,
+                unitCost=item.cost,
+                isVoided=False,
+                using_db=connection
+            )
+
+            transactionItems.append({
+                "id": tItem.id,
+                "itemId": item.id,
+                "name": item.name,
+                "price": item.price,
+                "quantity": tItem.quantity,
+                "amount": tItem.amount,
+                "sellByUnit": item.sellByUnit
             })
 
-            if latest_stage["itemRewardId"]:
-                rewardItem = await ItemReward.get_or_none(id=latest_stage["itemRewardId"])
-                if rewardItem:
-                    loyaltyItem["hasReward"] = True
-                    loyaltyItem["rewardName"] = rewardItem.name
-                    loyaltyItem["isItem"] = rewardItem.id == 1
+        transaction.profit = Decimal(totalAmount) - total_cogs
+        await transaction.save(using_db=connection)
+        await inventoryService.recordMovements(movements, connection)
+        await salesRollupService.recordSale(transaction.branchId, adjusted_time, totalAmount, connection=connection)
+        await orderSizeService.recordOrder(transaction.branchId, adjusted_time, totalAmount, connection=connection)
+
+    loyaltyItem = {}
+    isNewLoyalty = False
+    if totalAmount >= loyaltyService.LOYALTY_THRESHOLD and customer:
+        loyaltyItem = await loyaltyService.advance(customer.id)
+        isNewLoyalty = not customer.isLoyalty
 
     if customer:
-        (customer.totalOrderAmount) += Decimal(totalAmount)
-        await customer.save()
+        await Customer.filter(id=customer.id).update(
+            totalOrderAmount=F('totalOrderAmount') + Decimal(totalAmount),
+            orderCount=F('orderCount') + 1,
+            lastPurchaseDate=adjusted_time,
+            **({"isLoyalty": True} if isNewLoyalty else {})
+        )
 
     response = {
         "transaction": {
@@ -382,6 +374,8 @@ async def processPayment(cartId, cart, cartItems, subTotal, totalAmount, amountR
         "loyaltyItemDto": loyaltyItem
     }
 
+    fileService.prerenderReceipt(transaction.id)
+
     return create_response(True, "Payment Successful", response), 200
 
 async def generate_slip_no(branchId: int) -> str:
@@ -425,7 +419,7 @@ async def getTransactionHistory(transactionId):
                 "id": tItem.id,
                 "itemId": item.id,
                 "name": item.name,
-                "price": item.price,
+                "price": tItem.unitPrice if tItem.unitPrice is not None else item.price,
                 "quantity": tItem.quantity,
                 "amount": tItem.amount,
                 "sellByUnit": item.sellByUnit
@@ -562,31 +556,53 @@ async def getAllTransactionsAsyncHQ(branchId=None, page=1, search=""):
     return create_response(True, "Successfully Retrieved", transactionsDto, None, total_count), 200
 
 async def voidTransaction(transactionId):
-    transaction = await Transaction.get_or_none(id=transactionId)
-
-    if not transaction:
-        return create_response(False, 'Transaction not found!'), 404
-
-    transactionItems = await TransactionItem.filter(transactionId=transactionId)
-    customer = await Customer.get_or_none(id=transaction.customerId) if transaction.customerId else None
-
-    transaction.isVoided = True
-    await transaction.save()
-
-    updatedBranchItems = []
-    for tItem in transactionItems:
-        branchItem = await BranchItem.get_or_none(branchId=transaction.branchId, itemId=tItem.itemId)
-        if branchItem:
-            branchItem.quantity += tItem.quantity
-            await branchItem.save()
-            updatedBranchItems.append({
-                "itemId": tItem.itemId,
-                "quantity": branchItem.quantity
-            })
-
-    if customer:
-        customer.totalOrderAmount -= transaction.totalAmount
-        await customer.save()
+    async with in_transaction() as connection:
+        transaction = await Transaction.select_for_update().using_db(connection).get_or_none(id=transactionId)
+
+        if not transaction:
+            return create_response(False, 'Transaction not found!'), 404
+
+        if transaction.isVoided:
+            return create_response(False, 'Transaction is already voided'), 200
+
+        transactionItems = await TransactionItem.filter(transactionId=transactionId).using_db(connection)
+        customer = await Customer.get_or_none(id=transaction.customerId, using_db=connection) if transaction.customerId else None
+
+        wasPendingCredit = transaction.isExacon and not transaction.isPaid
+        wasCountedSale = transaction.isPaid
+        transaction.isVoided = True
+        transaction.receiptVersion += 1
+        await transaction.save(using_db=connection)
+
+        if wasPendingCredit:
+            await receivableService.adjustBalance(transaction.customerId, -transaction.totalAmount, connection)
+
+        if wasCountedSale:
+            await salesRollupService.recordSale(transaction.branchId, transaction.transactionDate, transaction.totalAmount, -1, connection)
+            await orderSizeService.recordOrder(transaction.branchId, transaction.transactionDate, transaction.totalAmount, -1, connection)
+
+        movements = []
+        for tItem in transactionItems:
+            branchItem = await BranchItem.select_for_update().using_db(connection).get_or_none(branchId=transaction.branchId, itemId=tItem.itemId)
+            if branchItem:
+                branchItem.quantity += tItem.quantity
+                await branchItem.save(using_db=connection)
+                movements.append(inventoryService.branchMovement(branchItem, tItem.quantity, 'void', transaction.id))
+
+        await inventoryService.recordMovements(movements, connection)
+
+        if customer and wasCountedSale:
+            await Customer.filter(id=customer.id).using_db(connection).update(
+                totalOrderAmount=F('totalOrderAmount') - transaction.totalAmount,
+                orderCount=F('orderCount') - 1
+            )
+            await connection.execute_query("""
+                UPDATE customers
+                SET lastPurchaseDate = (SELECT MAX(transactionDate) FROM transactions WHERE customerId = %s AND isPaid = 1 AND isVoided = 0)
+                WHERE id = %s
+            """, [customer.id, customer.id])
+
+    await reportService.reopen([(transaction.transactionDate, transaction.branchId)])
 
     return create_response(True, "Transaction voided successfully", None), 200
 
@@ -6,6 +6,7 @@ import hashlib
 import re
 import cloudinary
 import cloudinary.uploader
+from tortoise import Tortoise
 
 cloudinary.config( 
     cloud_name = CLOUD_NAME, 
@@ -51,6 +52,85 @@ def token_required(f):
     return decorator
 
 
+async def query_history(baseQuery, params, dateColumn, idColumn, fromDate=None, toDate=None, cursor=None, pageSize=None, includeCount=True, descending=False):
+    """
+    Runs a history query with an optional date range and keyset pagination over (dateColumn, idColumn).
+    baseQuery must already contain a WHERE clause and select both columns under their own names.
+    Returns the rows, the cursor for the next page and the total count, which is only queried
+    when includeCount is set. With descending, pages run from the newest row backwards.
+    """
+    filters = ""
+    filterParams = list(params)
+
+    if fromDate:
+        filters += f" AND {dateColumn} >= %s"
+        filterParams.append(fromDate)
+
+    if toDate:
+        filters += f" AND {dateColumn} < DATE_ADD(%s, INTERVAL 1 DAY)"
+        filterParams.append(toDate)
+
+    connection = Tortoise.get_connection('default')
+
+    totalCount = 0
+    if includeCount:
+        countQuery = f"SELECT COUNT(*) AS total FROM ({baseQuery}{filters}) AS history"
+        countResult = await connection.execute_query_dict(countQuery, tuple(filterParams))
+        totalCount = countResult[0]['total'] if countResult else 0
+
+    sqlQuery = baseQuery + filters
+    queryParams = list(filterParams)
+
+    if cursor:
+        cursorDate, cursorId = cursor.rsplit(',', 1)
+        op = "<" if descending else ">"
+        sqlQuery += f" AND ({dateColumn} {op} %s OR ({dateColumn} = %s AND {idColumn} {op} %s))"
+        queryParams.extend([cursorDate, cursorDate, int(cursorId)])
+
+    direction = " DESC" if descending else ""
+    sqlQuery += f" ORDER BY {dateColumn}{direction}, {idColumn}{direction}"
+
+    if pageSize:
+        sqlQuery += " LIMIT %s"
+        queryParams.append(pageSize + 1)
+
+    rows = await connection.execute_query_dict(sqlQuery, tuple(queryParams))
+
+    nextCursor = None
+    if pageSize and len(rows) > pageSize:
+        rows = rows[:pageSize]
+        last = rows[-1]
+        nextCursor = f"{last[dateColumn.split('.')[-1]]},{last[idColumn.split('.')[-1]]}"
+
+    return rows, nextCursor, totalCount
+
+SET_NULL = "SET NULL"
+CASCADE = "CASCADE"
+
+async def detach_references(connection, references, ids):
+    """
+    Clears every reference to the given ids before the referenced rows go away, one statement
+    per (table, column, action). SET_NULL keeps the referencing rows, CASCADE deletes them.
+    Meant to run inside the caller's transaction; returns the affected row count per table.
+    """
+    ids = ids if isinstance(ids, (list, tuple, set)) else [ids]
+    if not ids:
+        return {}
+
+    placeholders = ", ".join(["%s"] * len(ids))
+    affected = {}
+
+    for table, column, action in references:
+        if action == CASCADE:
+            sqlQuery = f"DELETE FROM {table} WHERE {column} IN ({placeholders})"
+        else:
+            sqlQuery = f"UPDATE {table} SET {column} = NULL WHERE {column} IN ({placeholders})"
+
+        result = await connection.execute_query(sqlQuery, list(ids))
+        affected[table] = affected.get(table, 0) + result[0]
+
+    return affected
+
 def hash_password_md5(password: str) -> str:
     return hashlib.md5(password.encode('utf-8')).hexdigest()
 
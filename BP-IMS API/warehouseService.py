@@ -1,9 +1,11 @@
-from utils import create_response
+from utils import create_response, query_history, detach_references, SET_NULL, CASCADE
 from tortoise import Tortoise
-from models import WHStockInput, WareHouseItem, Item, Supplier, SupplierReturn
-from decimal import Decimal
+from models import WHStockInput, WareHouseItem, Supplier, SupplierReturn
+from decimal import Decimal, InvalidOperation
 from tortoise.queryset import Q 
 from datetime import datetime
+from tortoise.transactions import in_transaction
+import inventoryService
 
 async def getWHStocks(categoryId, page=1, search=""):
     pageSize = 30
@@ -58,27 +60,18 @@ async def getWHStocks(categoryId, page=1, search=""):
 
     return create_response(True, 'Items Successfully Retrieved', itemList, None, totalCount), 200
 
-async def getStockHistory(itemId):
+async def getStockHistory(itemId, fromDate=None, toDate=None, cursor=None, pageSize=None, includeCount=True):
     sqlQuery = """
         SELECT s.*, i.whCriticalValue, su.name as deliveredByName, i.name, i.sellByUnit from whstockinputs s
         INNER JOIN items i on i.id = s.itemId 
-        inner join warehouseitems wh on wh.itemId = i.id
         LEFT JOIN suppliers su ON su.Id = s.deliveredBy
-        WHERE wh.Id = %s
+        WHERE s.itemId = (SELECT wh.itemId FROM warehouseitems wh WHERE wh.Id = %s)
     """
     params = [itemId]
 
-    sqlQuery += " ORDER BY s.Id"
-
-    connection = Tortoise.get_connection('default')
-    result = await connection.execute_query(sqlQuery, tuple(params))
-    countQuery = """
-        SELECT COUNT(*) from whstockinputs WHERE itemId = %s
-    """
-    totalCountResult = await connection.execute_query(countQuery, (itemId,))
-    totalCount = totalCountResult[1][0]['COUNT(*)']
-
-    items = result[1]
+    items, nextCursor, totalCount = await query_history(
+        sqlQuery, params, 's.deliveryDate', 's.id', fromDate, toDate, cursor, pageSize, includeCount
+    )
 
     itemList = [
         {
@@ -95,29 +88,116 @@ async def getStockHistory(itemId):
         }
         for item in items
     ]
-    return create_response(True, 'Items Successfully Retrieved', itemList, None, totalCount), 200
+    return create_response(True, 'Items Successfully Retrieved', itemList, nextCursor, totalCount), 200
 
 async def createStockInput(stockInput):
     whItem = await WareHouseItem.get_or_none(id=stockInput['id'])
-    item = await Item.get_or_none(id = whItem.itemId)
 
     if not whItem:
         return create_response(False, 'Item not found', None, None), 400
     delivered_by = None if stockInput['deliveredBy'] == 0 else stockInput['deliveredBy']
-    await WHStockInput.create(
-        qty=stockInput['qty'],
-        deliveryDate=stockInput['deliveryDate'],
-        deliveredBy=delivered_by,
-        expectedQty=stockInput['expectedTotalQty'],
-        actualQty=stockInput['actualTotalQty'],
-        itemId=whItem.itemId
-    )
-    whItem.quantity += Decimal(str(stockInput['qty']))
 
-    await whItem.save()
+    try:
+        async with in_transaction() as connection:
+            savedInput = await WHStockInput.create(
+                qty=stockInput['qty'],
+                deliveryDate=stockInput['deliveryDate'],
+                deliveredBy=delivered_by,
+                expectedQty=stockInput['expectedTotalQty'],
+                actualQty=stockInput['actualTotalQty'],
+                itemId=whItem.itemId,
+                using_db=connection
+            )
+            await inventoryService.adjustStock([
+                inventoryService.warehouseMovement(whItem, stockInput['qty'], 'delivery', savedInput.id)
+            ], connection)
+    except inventoryService.StockAdjustmentError as e:
+        return create_response(False, str(e), None, None), 400
 
     return create_response(True, "Success", None, None), 200
 
+async def createDelivery(delivery):
+    lines = (delivery or {}).get('lines') or []
+    if not lines:
+        return create_response(False, 'No delivery lines provided', None, None), 400
+
+    if not delivery.get('deliveryDate'):
+        return create_response(False, 'Delivery date is required', None, None), 400
+
+    try:
+        for line in lines:
+            line['whItemId'] = int(line['whItemId'])
+            line['expectedQty'] = Decimal(str(line['expectedQty']))
+            line['actualQty'] = Decimal(str(line['actualQty']))
+            line['qty'] = Decimal(str(line.get('qty', line['actualQty'])))
+    except (KeyError, TypeError, ValueError, InvalidOperation):
+        return create_response(False, 'Each line needs a whItemId, expectedQty and actualQty', None, None), 400
+
+    whItemIds = list({line['whItemId'] for line in lines})
+
+    placeholders = ", ".join(["%s"] * len(whItemIds))
+    connection = Tortoise.get_connection('default')
+    whItems = await connection.execute_query_dict(
+        f"SELECT id, itemId FROM warehouseitems WHERE id IN ({placeholders})", whItemIds
+    )
+    itemIds = {wh['id']: wh['itemId'] for wh in whItems}
+
+    missing = [whItemId for whItemId in whItemIds if whItemId not in itemIds]
+    if missing:
+        return create_response(False, 'Item not found', missing, None), 400
+
+    supplierId = delivery.get('supplierId') or None
+    deliveryDate = delivery['deliveryDate']
+    discrepancies = []
+    totalExpected = Decimal(0)
+    totalActual = Decimal(0)
+
+    for line in lines:
+        expectedQty = line['expectedQty']
+        actualQty = line['actualQty']
+        itemId = itemIds[line['whItemId']]
+
+        totalExpected += expectedQty
+        totalActual += actualQty
+        if expectedQty != actualQty:
+            discrepancies.append({
+                "whItemId": line['whItemId'],
+                "itemId": itemId,
+                "expectedQty": expectedQty,
+                "actualQty": actualQty,
+                "variance": actualQty - expectedQty
+            })
+
+    try:
+        async with in_transaction() as connection:
+            movements = []
+            for line in lines:
+                itemId = itemIds[line['whItemId']]
+                stockInput = await WHStockInput.create(
+                    qty=line['qty'],
+                    deliveryDate=deliveryDate,
+                    deliveredBy=supplierId,
+                    expectedQty=line['expectedQty'],
+                    actualQty=line['actualQty'],
+                    itemId=itemId,
+                    using_db=connection
+                )
+                movements.append(inventoryService.movement(inventoryService.WAREHOUSE, inventoryService.WAREHOUSE_LOCATION_ID, itemId, line['qty'], 'delivery', stockInput.id))
+
+            await inventoryService.adjustStock(movements, connection)
+    except inventoryService.StockAdjustmentError as e:
+        return create_response(False, str(e), None, None), 400
+
+    summary = {
+        "lineCount": len(lines),
+        "totalExpectedQty": totalExpected,
+        "totalActualQty": totalActual,
+        "totalVariance": totalActual - totalExpected,
+        "discrepancies": discrepancies
+    }
+
+    return create_response(True, "Success", summary, None, len(discrepancies)), 200
+
 async def getSupplierList(search = ""):
 
     supplierQuery = Supplier.all().order_by('name')
@@ -169,49 +249,35 @@ async def saveSupplier(supplier):
 
     return create_response(True, "Success", None, None), 200
 
+SUPPLIER_REFERENCES = [
+    ("whstockinputs", "deliveredBy", SET_NULL),
+    ("supplierreturn", "supplierId", CASCADE)
+]
+
 async def removeSupplier(id):
     existingSupplier = await Supplier.get_or_none(id=id)
     
     if not existingSupplier:
         return create_response(False, "Supplier not found", None, None), 404 
 
-    whStockHistory = await WHStockInput.filter(deliveredBy=existingSupplier.id).all() 
-    supplierReturns = await SupplierReturn.filter(supplierId = existingSupplier.id).all()
-    
-    for stock in whStockHistory:
-        stock.deliveredBy = None  
-        await stock.save()
-
-    for supReturn in supplierReturns:
-        await supReturn.delete()
-        
-    await existingSupplier.delete() 
+    async with in_transaction() as connection:
+        await detach_references(connection, SUPPLIER_REFERENCES, existingSupplier.id)
+        await existingSupplier.delete(using_db=connection)
 
     return create_response(True, "Success", None, None), 200
 
-async def getSupplierStockHistory(supplierId):
+async def getSupplierStockHistory(supplierId, fromDate=None, toDate=None, cursor=None, pageSize=None, includeCount=True):
     sqlQuery = """
         SELECT s.*, i.whCriticalValue, su.name as deliveredByName, i.name, i.sellByUnit from whstockinputs s
         INNER JOIN items i on i.id = s.itemId 
-        inner join warehouseitems wh on wh.itemId = i.id
         INNER JOIN suppliers su ON su.Id = s.deliveredBy
-        WHERE su.Id = %s
+        WHERE s.deliveredBy = %s
     """
     params = [supplierId]
 
-    sqlQuery += " ORDER BY s.Id"
-
-    connection = Tortoise.get_connection('default')
-    result = await connection.execute_query(sqlQuery, tuple(params))
-    countQuery = """
-        SELECT COUNT(*) from whstockinputs s
-        INNER JOIN suppliers su ON su.Id = s.deliveredBy
-        WHERE su.id = %s
-    """
-    totalCountResult = await connection.execute_query(countQuery, (supplierId,))
-    totalCount = totalCountResult[1][0]['COUNT(*)']
-
-    items = result[1]
+    items, nextCursor, totalCount = await query_history(
+        sqlQuery, params, 's.deliveryDate', 's.id', fromDate, toDate, cursor, pageSize, includeCount
+    )
 
     itemList = [
         {
@@ -228,16 +294,19 @@ async def getSupplierStockHistory(supplierId):
         }
         for item in items
     ]
-    return create_response(True, 'Items Successfully Retrieved', itemList, None, totalCount), 200
+    return create_response(True, 'Items Successfully Retrieved', itemList, nextCursor, totalCount), 200
 
 async def editWHStock(id, qty):
-    whItem = await WareHouseItem.get_or_none(id=id)
+    async with in_transaction() as connection:
+        whItem = await WareHouseItem.select_for_update().using_db(connection).get_or_none(id=id)
 
-    if not whItem:
-        return create_response(False, 'Item not found', None, None), 200
+        if not whItem:
+            return create_response(False, 'Item not found', None, None), 200
 
-    whItem.quantity = Decimal(str(qty))
-    await whItem.save()
+        delta = Decimal(str(qty)) - whItem.quantity
+        whItem.quantity = Decimal(str(qty))
+        await whItem.save(using_db=connection)
+        await inventoryService.recordMovements([inventoryService.warehouseMovement(whItem, delta, 'adjustment')], connection)
     
     return create_response(True, "Success", None, None), 200
 
@@ -247,37 +316,38 @@ async def returnToSupplier(returnStock):
     if not whItem:
         return create_response(False, 'Item not found', None, None), 200
 
-    await SupplierReturn.create(
-        supplierId=returnStock['supplierId'],
-        whItemId=returnStock['whItemId'],
-        reason=returnStock['reason'],
-        quantity=Decimal(str(returnStock['quantity'])),
-        date=datetime.now()
-    )
-
-    whItem.quantity -= Decimal(str(returnStock['quantity']))
-    await whItem.save()
+    quantity = Decimal(str(returnStock['quantity']))
+
+    try:
+        async with in_transaction() as connection:
+            supplierReturn = await SupplierReturn.create(
+                supplierId=returnStock['supplierId'],
+                whItemId=returnStock['whItemId'],
+                reason=returnStock['reason'],
+                quantity=quantity,
+                date=datetime.now(),
+                using_db=connection
+            )
+            await inventoryService.adjustStock([
+                inventoryService.warehouseMovement(whItem, -quantity, 'return_to_supplier', supplierReturn.id)
+            ], connection, guard=True)
+    except inventoryService.StockAdjustmentError as e:
+        return create_response(False, str(e), None, None), 200
 
     return create_response(True, "Success", None, None), 200
 
-async def getReturnToStockHistory(whItemId):
+async def getReturnToStockHistory(whItemId, fromDate=None, toDate=None, cursor=None, pageSize=None, includeCount=True):
     sqlQuery = """
         SELECT sr.id, sr.supplierId, s.name as supplierName, sr.whItemId, sr.reason, sr.quantity, sr.date
         FROM supplierreturn sr
         LEFT JOIN suppliers s ON s.id = sr.supplierId
         WHERE sr.whItemId = %s
-        ORDER BY sr.id
     """
     params = [whItemId]
 
-    connection = Tortoise.get_connection('default')
-    result = await connection.execute_query(sqlQuery, tuple(params))
-
-    countQuery = "SELECT COUNT(*) FROM supplierreturn WHERE whItemId = %s"
-    totalCountResult = await connection.execute_query(countQuery, (whItemId,))
-    totalCount = totalCountResult[1][0]['COUNT(*)']
-
-    items = result[1]
+    items, nextCursor, totalCount = await query_history(
+        sqlQuery, params, 'sr.date', 'sr.id', fromDate, toDate, cursor, pageSize, includeCount
+    )
 
     itemList = [
         {
@@ -292,4 +362,4 @@ async def getReturnToStockHistory(whItemId):
         for item in items
     ]
 
-    return create_response(True, 'Return to Stock History Retrieved Successfully', itemList, None, totalCount), 200
\ No newline at end of file
+    return create_response(True, 'Return to Stock History Retrieved Successfully', itemList, nextCursor, totalCount), 200
\ No newline at end of file